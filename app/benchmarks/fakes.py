@@ -0,0 +1,180 @@
+"""
+Local stand-ins for the AWS services used by the app (Cognito, Lambda and S3)
+and for a Redis cache server, so the benchmarks never leave the machine.
+"""
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import jwt
+from botocore.exceptions import ReadTimeoutError
+
+
+FAKE_SIGNING_KEY = "fake-cognito-signing-key-for-local-benchmarks"
+
+
+class FakeClientError(Exception):
+    pass
+
+
+class _FakeExceptions:
+    """
+    Mimics ``client.exceptions``: any attribute is an exception class
+    """
+
+    def __init__(self):
+        self._classes = {}
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if name not in self._classes:
+            self._classes[name] = type(name, (FakeClientError,), {})
+        return self._classes[name]
+
+
+class FakeCognitoClient:
+    """
+    Accepts any user/password pair and issues unsigned JWTs valid for one hour.
+    ``latency`` (seconds) simulates the round trip to Cognito; ``failure_rate``
+    of the calls (0 to 1) time out after that latency, to simulate an outage.
+    Both can be changed while the app runs.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.exceptions = _FakeExceptions()
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ReadTimeoutError(endpoint_url="https://fake-cognito.local")
+
+    def _tokens(self, username):
+        expiration = datetime.utcnow() + timedelta(hours=1)
+        token = jwt.encode({"sub": username, "exp": expiration}, FAKE_SIGNING_KEY, algorithm="HS256")
+        return {"AccessToken": token, "IdToken": token, "RefreshToken": "fake-refresh-token"}
+
+    def admin_initiate_auth(self, AuthParameters, **kwargs):
+        self._call()
+        return {"AuthenticationResult": self._tokens(AuthParameters["USERNAME"])}
+
+    def initiate_auth(self, AuthParameters, **kwargs):
+        self._call()
+        return {"AuthenticationResult": self._tokens("refresh")}
+
+    def sign_up(self, **kwargs):
+        self._call()
+        return {"UserConfirmed": False}
+
+    def confirm_sign_up(self, **kwargs):
+        self._call()
+        return {}
+
+    def forgot_password(self, **kwargs):
+        self._call()
+        return {}
+
+    def confirm_forgot_password(self, **kwargs):
+        self._call()
+        return {}
+
+
+class FakeLambdaClient:
+    def __init__(self):
+        self.exceptions = _FakeExceptions()
+        self.invocations = []
+
+    def invoke(self, FunctionName, Payload=b"", **kwargs):
+        self.invocations.append((FunctionName, Payload))
+        return {"StatusCode": 202}
+
+
+class FakeS3Client:
+    """
+    In-memory bucket storage
+    """
+
+    def __init__(self):
+        self.exceptions = _FakeExceptions()
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.read()
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        from io import BytesIO
+        try:
+            return {"Body": BytesIO(self.objects[(Bucket, Key)])}
+        except KeyError:
+            raise self.exceptions.NoSuchKey(Key)
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600, **kwargs):
+        return f"https://fake-s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+class FakeRedisClient:
+    """
+    The subset of ``redis.Redis`` used by ``RedisCacheBackend`` (get, mget, set with px/nx,
+    delete and non-transactional pipelines), in memory. Share one instance between apps to
+    simulate several workers on one server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (value, expires_at or None)
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            return entry[0] if entry else None
+
+    def mget(self, keys):
+        with self._lock:
+            return [entry[0] if entry else None for entry in map(self._live, keys)]
+
+    def set(self, key, value, px=None, nx=False):
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            self._data[key] = (value if isinstance(value, bytes) else str(value).encode(),
+                               time.time() + px / 1000 if px else None)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def pipeline(self, transaction=True):
+        return _FakeRedisPipeline(self)
+
+
+class _FakeRedisPipeline:
+    def __init__(self, client):
+        self.client = client
+        self._commands = []
+
+    def set(self, *args, **kwargs):
+        self._commands.append((self.client.set, args, kwargs))
+        return self
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
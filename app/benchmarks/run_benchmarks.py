@@ -0,0 +1,323 @@
+"""
+Benchmark harness for the main user flows of the Insumos app.
+
+Seeds a database (SQLite by default, Postgres with --database-url), replaces the
+AWS clients with local fakes and measures latency and throughput of the hot
+flows through Flask's test client. Results are written as JSON so two commits
+can be compared with --compare.
+
+Run from the app/ directory:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --insumos 10000 --orders 500000 --representantes 5000
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/<old>.json
+    python -m benchmarks.run_benchmarks --flows order_pdf_letter --letter-renderer xhtml2pdf
+    python -m benchmarks.run_benchmarks --flows letter_renderer_reportlab letter_renderer_xhtml2pdf
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.fakes import FakeCognitoClient, FakeLambdaClient, FakeRedisClient, FakeS3Client
+from benchmarks.seed import flow_context, forget_stored_letters, seed
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def load_app(database_url, cognito_latency, letter_renderer="reportlab", cache_backend="memory"):
+    """
+    Build the app against the benchmark database and swap in the AWS fakes (and the Redis
+    fake for ``cache_backend="redis"``).
+    Returns the app and the seconds spent importing the package and running create_app.
+    """
+    start = time.perf_counter()
+    from insumos import create_app
+    from insumos.cache import RedisCacheBackend
+    from insumos.extensions import aws_clients, cache
+    # A fresh cache per run: entries left by a previous run would describe another database
+    app = create_app({"SQLALCHEMY_DATABASE_URI": database_url, "TESTING": True,
+                      "STORAGE_BACKEND": "s3", "S3_BUCKET_NAME": "benchmarks", "LETTER_RENDERER": letter_renderer,
+                      "CACHE_BACKEND": "memory" if cache_backend == "redis" else cache_backend,
+                      "CACHE_SQLITE_PATH": os.path.join(tempfile.mkdtemp(), "insumos_cache.db")})
+    startup_seconds = time.perf_counter() - start
+    if cache_backend == "redis":
+        cache.use(RedisCacheBackend(client=FakeRedisClient()))
+
+    aws_clients.register('cognito-idp', FakeCognitoClient(latency=cognito_latency))
+    aws_clients.register('lambda', FakeLambdaClient())
+    aws_clients.register('s3', FakeS3Client())
+    # The per-request JSON log line and xhtml2pdf CSS warnings would dominate the output
+    logging.getLogger("insumos.profiling").setLevel(logging.WARNING)
+    logging.getLogger("xhtml2pdf").setLevel(logging.ERROR)
+    return app, startup_seconds
+
+
+def login(app, email):
+    client = app.test_client()
+    response = client.post("/login", data={"username": email, "password": "Benchmark1!"})
+    assert response.status_code == 302, f"login failed for {email}: {response.status_code}"
+    return client
+
+
+def build_flows(app, ctx):
+    """
+    Each flow is (role, callable(client, iteration) -> response)
+    """
+    insumo_query = ctx["insumo_query"]
+    representante_query = ctx["representante_query"]
+
+    def flow_login(client, i):
+        return app.test_client().post(
+            "/login", data={"username": ctx["representante_email"], "password": "Benchmark1!"})
+
+    def flow_search_insumos_keystroke(client, i):
+        # Simulates the htmx keyup trigger: every keystroke sends a longer prefix
+        prefix = insumo_query[:1 + i % len(insumo_query)]
+        return client.get("/search_insumos_representante", query_string={"query": prefix})
+
+    def flow_search_orders_admin_representante(client, i):
+        prefix = representante_query[:2 + i % (len(representante_query) - 1)]
+        return client.get("/search_orders_admin", query_string={"query_representante_name": prefix})
+
+    def flow_search_orders_admin_status(client, i):
+        statuses = ["todos", "ENTREGADO", "EN_CAMINO", "CANCELADO"]
+        return client.get("/search_orders_admin", query_string={"query_status": statuses[i % len(statuses)]})
+
+    def flow_search_orders_admin_combined(client, i):
+        # Several filters at once plus a sort, as the filter form sends them
+        prefix = representante_query[:2 + i % (len(representante_query) - 1)]
+        return client.get("/search_orders_admin", query_string={
+            "query_representante_name": prefix,
+            "query_customer_team": ["WETLIA", "OFTALMO", "CARDIO"][i % 3],
+            "query_status": ["todos", "ENTREGADO", "EN_CAMINO"][i % 3],
+            "total_min": "1",
+            "sort": ["fecha_pedido", "total", "representante"][i % 3],
+        })
+
+    def flow_api_v1_orders(client, i):
+        # A page of 100 orders with the status filter, as JSON
+        statuses = ["todos", "ENTREGADO", "EN_CAMINO", "CANCELADO"]
+        return client.get("/api/v1/orders", query_string={"query_status": statuses[i % len(statuses)],
+                                                           "limit": 100})
+
+    def flow_insumos_representante_page(client, i):
+        # Paging through the catalog table, the same for every representante
+        return client.get("/api/insumos_representante", query_string={"page": 1 + i % 5})
+
+    def flow_add_order_record(client, i):
+        form = {
+            "medico_solicitante": "Dr. Benchmark",
+            "posicion_medico": "Oftalmólogo",
+            "nombre_institucion": "Hospital Benchmark",
+            "direccion_entrega": "Av. Reforma 222",
+        }
+        for insumo_id in ctx["insumo_ids"]:
+            form[f"quantity_insumo_{insumo_id}"] = "1"
+            form[f"name_{insumo_id}"] = f"Insumo {insumo_id}"
+        return client.post("/add_order_record", data=form)
+
+    # Orders whose letter has not been rendered yet: every call renders and uploads a new PDF
+    unrendered_orders = itertools.count()
+
+    def flow_order_pdf_letter(client, i):
+        order_id = 1 + next(unrendered_orders) % ctx["orders"]
+        return client.get(f"/order_pdf_letter/{order_id}/letter")
+
+    def flow_order_pdf_letter_stored(client, i):
+        # Rendered on the first call, then only a redirect to the stored PDF
+        return client.get(f"/order_pdf_letter/{ctx['order_id']}/letter")
+
+    def letter_renderer_flow(name):
+        # The renderer alone, whatever --letter-renderer says: same order and context for both
+        def flow(client, i):
+            from insumos.extensions import db
+            from insumos.letter_renderers import get_renderer
+            from insumos.letters import TYPE_LETTER, letter_context
+            from insumos.models import Order
+            with app.app_context():
+                context = letter_context(db.session.get(Order, ctx["order_id"]), TYPE_LETTER)
+                pdf = get_renderer(name).render_request_letter(context)
+            return app.response_class(pdf, status=200 if pdf else 500, mimetype="application/pdf")
+        return flow
+
+    return {
+        "login": (None, flow_login),
+        "search_insumos_keystroke": ("representante", flow_search_insumos_keystroke),
+        "search_orders_admin_representante": ("admin", flow_search_orders_admin_representante),
+        "search_orders_admin_status": ("admin", flow_search_orders_admin_status),
+        "search_orders_admin_combined": ("admin", flow_search_orders_admin_combined),
+        "api_v1_orders": ("admin", flow_api_v1_orders),
+        "insumos_representante_page": ("representante", flow_insumos_representante_page),
+        "add_order_record": ("representante", flow_add_order_record),
+        "order_pdf_letter": ("representante", flow_order_pdf_letter),
+        "order_pdf_letter_stored": ("representante", flow_order_pdf_letter_stored),
+        "letter_renderer_reportlab": (None, letter_renderer_flow("reportlab")),
+        "letter_renderer_xhtml2pdf": (None, letter_renderer_flow("xhtml2pdf")),
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def run_flow(app, ctx, role, flow, iterations, warmup, concurrency):
+    emails = {"admin": ctx["admin_email"], "representante": ctx["representante_email"]}
+    local = threading.local()
+
+    def client_for_thread():
+        if not hasattr(local, "client"):
+            local.client = login(app, emails[role]) if role else None
+        return local.client
+
+    def call(i):
+        client = client_for_thread()
+        start = time.perf_counter()
+        response = flow(client, i)
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return elapsed
+
+    for i in range(warmup):
+        call(i)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Log every worker thread in before the clock starts
+        list(pool.map(lambda _: client_for_thread(), range(concurrency)))
+        start = time.perf_counter()
+        latencies = list(pool.map(call, range(iterations)))
+        wall = time.perf_counter() - start
+
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "min_ms": min(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "throughput_rps": iterations / wall if wall else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline_path, threshold):
+    """
+    Print p50/p95 deltas against a previous result file.
+    Returns True when some flow regressed more than ``threshold`` percent.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressed = False
+    print(f"\nComparación contra {baseline_path} ({baseline.get('revision')})")
+    print(f"{'flow':40} {'p50 antes':>10} {'p50 ahora':>10} {'Δ%':>8} {'p95 antes':>10} {'p95 ahora':>10} {'Δ%':>8}")
+    for name, result in current["flows"].items():
+        old = baseline["flows"].get(name)
+        if not old:
+            continue
+        deltas = []
+        for key in ("p50_ms", "p95_ms"):
+            deltas.append((result[key] - old[key]) / old[key] * 100 if old[key] else 0.0)
+        if threshold is not None and max(deltas) > threshold:
+            regressed = True
+        print(f"{name:40} {old['p50_ms']:10.2f} {result['p50_ms']:10.2f} {deltas[0]:+8.1f} "
+              f"{old['p95_ms']:10.2f} {result['p95_ms']:10.2f} {deltas[1]:+8.1f}")
+    return regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="SQLAlchemy URL; defaults to a temporary SQLite file")
+    parser.add_argument("--insumos", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--representantes", type=int, default=200)
+    parser.add_argument("--vendors", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--cognito-latency", type=float, default=0.0,
+                        help="Simulated Cognito round trip in seconds")
+    parser.add_argument("--letter-renderer", choices=["reportlab", "xhtml2pdf"], default="reportlab",
+                        help="PDF renderer used by the order_pdf_letter flows")
+    parser.add_argument("--cache-backend", choices=["memory", "sqlite", "redis", "off"], default="memory",
+                        help="Cache backend; redis runs against an in-memory fake")
+    parser.add_argument("--flows", nargs="*", help="Subset of flows to run")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the data already in --database-url")
+    parser.add_argument("--output", help="Result file; defaults to benchmarks/results/<revision>.json")
+    parser.add_argument("--compare", help="Previous result file to compare against")
+    parser.add_argument("--fail-threshold", type=float,
+                        help="Exit with status 1 if a p50/p95 regresses more than this percentage")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "insumos_bench.db")
+    app, startup_seconds = load_app(database_url, args.cognito_latency, args.letter_renderer,
+                                    args.cache_backend)
+
+    volumes = {"insumos": args.insumos, "orders": args.orders, "representantes": args.representantes,
+               "vendors": args.vendors}
+    with app.app_context():
+        start = time.perf_counter()
+        if args.skip_seed:
+            ctx = flow_context(args.insumos, args.orders)
+            # The fake S3 bucket starts empty: letters stored by a previous run must be rendered again
+            forget_stored_letters()
+        else:
+            ctx = seed(**volumes)
+        seed_seconds = time.perf_counter() - start
+    print(f"Datos generados en {seed_seconds:.1f}s: {volumes}")
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "database": database_url.split(":", 1)[0],
+        "volumes": volumes,
+        "letter_renderer": args.letter_renderer,
+        "startup_seconds": startup_seconds,
+        "seed_seconds": seed_seconds,
+        "flows": {},
+    }
+    for name, (role, flow) in build_flows(app, ctx).items():
+        if args.flows and name not in args.flows:
+            continue
+        result = run_flow(app, ctx, role, flow, args.iterations, args.warmup, args.concurrency)
+        results["flows"][name] = result
+        print(f"{name:40} p50={result['p50_ms']:8.2f}ms p95={result['p95_ms']:8.2f}ms "
+              f"{result['throughput_rps']:8.1f} req/s")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Resultados guardados en {output}")
+
+    if args.compare and compare(results, args.compare, args.fail_threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Deterministic data generator for the benchmarks.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, update
+
+from insumos.extensions import db
+from insumos.models import BayerUser, Vendor, Insumo, OrderStatus, Order
+
+BATCH_SIZE = 5000
+
+ADMIN_EMAIL = 'lilian.heredia@xaldigital.com'
+
+FIRST_NAMES = ["LUIS", "BRENDA", "CARMEN", "MIGUEL", "JOSE", "DIANA", "ISRAEL", "RUTH", "MIRIAM", "MARTHA",
+               "LILIANA", "VIOLETA", "GEORGINA", "NORA", "EDNA", "MARIO"]
+LAST_NAMES = ["GUTIERREZ", "HERNANDEZ", "GONZALEZ", "VELAZQUEZ", "MARCIAL", "ORTIZ", "AHUMADA", "DE LA ROSA",
+              "SOLTERO", "SALAZAR", "MONDRAGON", "DE LEON", "AZPEITIA", "BARRERAS", "ORONA", "HERRERA", "GARCIA"]
+INSUMO_WORDS = ["Gasas", "Hisopos", "Micropore", "Torundas", "Alcohol", "Yodopovidona", "Microdacyn",
+                "Clorhexidina", "Jeringas", "Agujas", "Blefarostato", "Tetracaina", "Tropicamida", "Campos",
+                "Bloques", "Solución"]
+INSUMO_QUALIFIERS = ["estériles", "desechables", "de insulina", "oftálmica", "quirúrgicos", "30G", "32G",
+                     "reutilizables", "de algodón", "congelante"]
+
+
+def _batched(rows_iter, size=BATCH_SIZE):
+    batch = []
+    for row in rows_iter:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def representante_email(index):
+    return f"representante{index}@bayer.com"
+
+
+def seed(insumos=1000, orders=20000, representantes=200, vendors=20, seed_value=42):
+    """
+    Drop and recreate every table, then bulk insert the requested volumes.
+    Tables are recreated so the serial ids start at 1 on every backend.
+    Returns the ``flow_context`` for the seeded data.
+    """
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+
+    db.drop_all()
+    db.create_all()
+
+    db.session.execute(insert(Vendor), [
+        {"name": f"Proveedor {i}", "cellphone": "5555555555", "user_email": f"vendor{i}@bayer.com",
+         "creation_date": now}
+        for i in range(1, vendors + 1)
+    ])
+
+    def bayer_users():
+        yield {"email": ADMIN_EMAIL, "customer_team": "WETLIA", "name": "XALDIGITAL ADMIN TEST", "cwid": "ABCDE",
+               "address": "CALLE 12", "ext_number": "912", "int_number": "", "colonia": "LA LIBERTAD",
+               "ciudad": "PUEBLA", "edo": "PUE", "cp": "72130", "cel_bayer": "222 3509687"}
+        for i in range(1, representantes + 1):
+            yield {"email": representante_email(i), "customer_team": rng.choice(["WETLIA", "OFTALMO", "CARDIO"]),
+                   "name": f"{rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}",
+                   "cwid": f"CW{i:05d}", "address": "CALLE 12 PONIENTE", "ext_number": str(i), "int_number": "",
+                   "colonia": "CENTRO", "ciudad": "CDMX", "edo": "DIF", "cp": "01000", "cel_bayer": "55 00000000"}
+
+    for batch in _batched(bayer_users()):
+        db.session.execute(insert(BayerUser), batch)
+
+    insumo_rows = []
+    for i in range(1, insumos + 1):
+        insumo_rows.append({
+            "name": f"{rng.choice(INSUMO_WORDS)} {rng.choice(INSUMO_QUALIFIERS)} {i}",
+            "stock": 10 ** 9,
+            "unit_cost": float(rng.randrange(500, 6000, 100)),
+            "vendor_id": rng.randint(1, vendors),
+            "last_updated": now - timedelta(minutes=i),
+        })
+    for batch in _batched(insumo_rows):
+        db.session.execute(insert(Insumo), batch)
+
+    statuses = list(OrderStatus)
+
+    def order_rows():
+        for i in range(1, orders + 1):
+            items = []
+            total = 0
+            for index in rng.sample(range(len(insumo_rows)), k=min(len(insumo_rows), rng.randint(1, 5))):
+                insumo = insumo_rows[index]
+                quantity = rng.randint(1, 20)
+                total += quantity * insumo["unit_cost"]
+                items.append({"id": index + 1, "name": insumo["name"], "quantity": quantity,
+                              "cost": insumo["unit_cost"]})
+            created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 730))
+            yield {
+                "user_email": representante_email(rng.randint(1, representantes)),
+                "creation_date": created,
+                "last_updated": created,
+                "data": items,
+                "status": rng.choice(statuses),
+                "delivery_information": "Av. Reforma 222, CDMX",
+                "delivery_institute": f"Hospital {rng.randint(1, 300)}",
+                "doctor_name": f"Dr. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "doctor_position": "Oftalmólogo",
+                "total": total,
+            }
+
+    for batch in _batched(order_rows()):
+        db.session.execute(insert(Order), batch)
+
+    db.session.commit()
+    return flow_context(insumos, orders)
+
+
+def forget_stored_letters():
+    db.session.execute(update(Order).values(letter_key=None, letter_response_key=None))
+    db.session.commit()
+
+
+def flow_context(insumos, orders):
+    """
+    Ids and search terms used by the benchmark flows, valid for any seeded database
+    """
+    return {
+        "admin_email": ADMIN_EMAIL,
+        "representante_email": representante_email(1),
+        "insumo_ids": list(range(1, min(insumos, 3) + 1)),
+        "order_id": 1,
+        "orders": orders,
+        "representante_query": LAST_NAMES[-1],
+        "insumo_query": INSUMO_WORDS[0].lower()[:3],
+    }
@@ -0,0 +1,64 @@
+"""
+Gunicorn settings, loaded automatically when gunicorn is started from app/.
+Command line flags (e.g. ``-w 1 -b 0.0.0.0:5000``) still take precedence.
+
+``gunicorn_worker_class`` selects the serving mode:
+
+* ``sync`` (default): one request at a time per worker process.
+* ``gevent``: cooperative workers. Cognito HTTPS calls and Postgres queries
+  yield instead of blocking, so a slow Cognito response does not starve the
+  requests that only need the database. Concurrent Cognito calls are still
+  bounded by ``cognito_max_concurrency`` (see insumos/cognito.py).
+* ``gthread``: a thread pool of ``gunicorn_threads`` per worker.
+
+With ``gunicorn_preload`` (on by default) the app and its heavy libraries are
+imported once in the master and workers fork with that memory shared
+copy-on-write. ``create_app`` opens no database connections and builds no boto3
+clients, so nothing process-specific is inherited by the workers. Each worker
+then warms up (templates, connections, clients, a throwaway PDF) before serving;
+``warmup_enabled=false`` skips it. Each worker also runs an outbox dispatcher
+thread delivering order notifications (``outbox_dispatcher_thread=false`` to run
+``flask dispatch-outbox`` as a separate process instead).
+"""
+import os
+
+worker_class = os.getenv("gunicorn_worker_class", "sync")
+if worker_class == "gevent":
+    # Patch before the app (boto3, ssl, psycopg2) is preloaded in the master
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = os.getenv("gunicorn_bind", "0.0.0.0:5000")
+workers = int(os.getenv("gunicorn_workers", 1))
+preload_app = os.getenv("gunicorn_preload", "true").lower() == "true"
+worker_connections = int(os.getenv("gunicorn_worker_connections", 200))
+threads = int(os.getenv("gunicorn_threads", 8 if worker_class == "gthread" else 1))
+timeout = int(os.getenv("gunicorn_timeout", 30))
+keepalive = int(os.getenv("gunicorn_keepalive", 5))
+
+
+def on_starting(server):
+    if preload_app:
+        # Imported lazily by the app for fast startup; loading it here shares it between workers
+        import reportlab.platypus  # noqa: F401
+        if os.getenv("letter_renderer") == "xhtml2pdf":
+            import xhtml2pdf.pisa  # noqa: F401
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # psycopg2 is a C extension: without this its socket waits would block the whole worker
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+    # Runs in each worker once the app is loaded and before it accepts requests (see insumos/warmup.py)
+    app = worker.wsgi
+    if app.config.get("WARMUP_ENABLED"):
+        from insumos.warmup import warm_up
+        warm_up(app)
+    if app.config.get("OUTBOX_DISPATCHER_THREAD"):
+        # Delivers order notifications in the background (see insumos/outbox.py)
+        from insumos.outbox import start_background_dispatcher
+        start_background_dispatcher(app)
@@ -0,0 +1,76 @@
+"""
+Insumos application package.
+
+Importing the package has no side effects: settings are read, extensions bound
+and blueprints registered only when ``create_app`` is called.
+"""
+import os
+
+import click
+from flask import Flask
+
+from insumos import (admission, archive, images, instrumentation, order_events, order_summary, outbox, sessions,
+                     warmup)
+from insumos.config import load_config
+from insumos.extensions import db, aws_clients, cache, cognito_client, storage
+
+# templates/ and static/ live next to the package, in app/
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_app(config=None):
+    """
+    :param config: optional mapping applied over the environment settings
+                   (e.g. ``{'SQLALCHEMY_DATABASE_URI': 'sqlite://'}`` in tests)
+    """
+    app = Flask(__name__, root_path=APP_ROOT)
+    app.config.update(load_config())
+    if config:
+        app.config.update(config)
+
+    warmup.init_app(app)
+    db.init_app(app)
+    aws_clients.init_app(app)
+    cognito_client.init_app(app)
+    storage.init_app(app)
+    cache.init_app(app)
+    instrumentation.init_app(app)
+    admission.init_app(app)
+    sessions.init_app(app)
+    archive.init_app(app)
+    images.init_app(app)
+    order_summary.init_app(app)
+    outbox.init_app(app)
+    order_events.init_app(app)
+
+    from insumos.auth import auth_bp
+    from insumos.admin import admin_bp
+    from insumos.representante import representante_bp
+    from insumos.letters import letters_bp
+    from insumos.storage import storage_bp
+    from insumos.order_events import order_events_bp
+    from insumos.api import api_v1_bp
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(representante_bp)
+    app.register_blueprint(letters_bp)
+    app.register_blueprint(storage_bp)
+    app.register_blueprint(order_events_bp)
+    app.register_blueprint(api_v1_bp)
+
+    register_commands(app)
+    return app
+
+
+def register_commands(app):
+    @app.cli.command('create-tables')
+    def create_tables():
+        """Create the database tables."""
+        db.create_all()
+        click.echo("All tables created.")
+
+    @app.cli.command('drop-tables')
+    def drop_tables():
+        """Drop the database tables."""
+        db.drop_all()
+        click.echo("All tables dropped.")
@@ -0,0 +1,458 @@
+"""
+Administrator views: insumo catalog, order search and order status management.
+"""
+import json
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, jsonify, session
+
+from insumos.archive import archived_ids
+from insumos.auth import bayer_user_cache, token_required, requires_admin_email
+from insumos.extensions import cache, db
+from insumos.insumo_batch import InvalidInsumoChange, apply_insumo_changes, parse_batch
+from insumos.models import BayerUser, Vendor, Insumo, OrderStatus, Order
+from insumos.order_search import (DEFAULT_SORT, ORDER_SORTS, InvalidOrderSearch, build_order_search,
+                                  parse_order_filters, representantes_by_email)
+from insumos.outbox import change_order_status
+from insumos.stock import low_stock_count, low_stock_insumos
+
+admin_bp = Blueprint('admin', __name__)
+
+# Rows per page of the bulk edit table
+BULK_EDIT_PAGE_SIZE = 50
+
+# Vendor options of the insumo forms; changed by any vendor write
+vendor_cache = cache.namespace('vendors', invalidated_by=(Vendor,))
+
+
+def vendor_options():
+    """
+    ``[{'id', 'name'}]`` of every vendor by name, shared by the workers until a vendor changes
+    """
+    return vendor_cache.get_or_set('options', lambda: [
+        {'id': vendor_id, 'name': name}
+        for vendor_id, name in db.session.query(Vendor.id, Vendor.name).order_by(Vendor.name)])
+
+
+@admin_bp.route('/initial_data', methods=["GET"])
+def initial_data():
+    db.drop_all()
+    db.create_all()
+    vendor = Vendor(name="Daniel Rodriguez", cellphone="31822211308", user_email="daniel@bayer.com")
+    vendor_2 = Vendor(name="Juan Perez", cellphone="31822211308", user_email="juan.perez@bayer.com")
+    db.session.add(vendor)
+    db.session.add(vendor_2)
+    insumos_list = [
+        Insumo(name="Campos quirúrgicos estériles, reutilizables o desechables", stock=1500, unit_cost=3000,
+               vendor=vendor),
+        Insumo(name="Gasas desechables", stock=1500, unit_cost=2000, vendor=vendor),
+        Insumo(name="Hisopos estériles", stock=1500, unit_cost=2000, vendor=vendor_2),
+        Insumo(name="Micropore, tela adhesiva o transport", stock=1500, unit_cost=2000, vendor=vendor_2),
+        Insumo(name="Torundas de algodón", stock=1500, unit_cost=4500, vendor=vendor),
+        Insumo(name="Alcohol de 96°", stock=1500, unit_cost=2000, vendor=vendor_2),
+        Insumo(name="Yodopovidona", stock=1500, unit_cost=2000, vendor=vendor),
+        Insumo(name="Microdacyn", stock=1500, unit_cost=3000, vendor=vendor_2),
+        Insumo(name="Clorhexidina", stock=1500, unit_cost=2000, vendor=vendor),
+        Insumo(name="Krit, desinfectante de instrumental quirúrgico", stock=1500, unit_cost=2000, vendor=vendor),
+        Insumo(name="Jeringas de insuina", stock=1500, unit_cost=2000, vendor=vendor_2),
+        Insumo(name="Agujas de insulina, 30G o 32G", stock=1500, unit_cost=2000, vendor=vendor),
+        Insumo(name="Blefarostato", stock=1500, unit_cost=2000, vendor=vendor),
+        Insumo(name="Tetracaina solución oftálmica", stock=1500, unit_cost=2000, vendor=vendor),
+        Insumo(name="Tropicamida- fenilefrina solución oftálmica", stock=1500, unit_cost=5000, vendor=vendor_2),
+        Insumo(name="Solución y/o ungüento antibótico/antiinflamatorio", stock=1500, unit_cost=2000, vendor=vendor),
+        Insumo(name="Bloques de gel congelante", stock=1500, unit_cost=2000, vendor=vendor)
+    ]
+    for insumo in insumos_list:
+        db.session.add(insumo)
+
+    bayer_cwid_initial_data = [
+        "WETLIA,GUTIERREZ MEDINA LUIS ERNESTO,MEBGV,FRANCITA,No 199,,PETROLERA,AZCAPOTZALCO,DIF,02480,55 27550384,ernesto.gutierrez@bayer.com",
+        "WETLIA,HERNANDEZ GARCIA BRENDA,MEBKF,CALLE 27,No 43,,OLIVAR DEL CONDE 2A SECC,ALVARO OBREGON,DIF,01408,55 26992682,brenda.hernandez@bayer.com",
+        "WETLIA,GONZALEZ VIVIAN ILESVE CARMEN,MEBKP,MIGUEL DE MENDOZA,No 4,104,MIXCOAC,BENITO JUAREZ,DIF,03910,55 30765297,carmen.gonzalez3@bayer.com",
+        "WETLIA,VELAZQUEZ BARRON MARIA DEL CARMEN,MEBYE,HONDA DE SAN MIGUEL,No 452,,SAN MIGUEL,LEON,GTO,37390,477 6702290,madelcarmen.velazquez@bayer.com",
+        "WETLIA,MARCIAL CARDENAS MIGUEL ANGEL,GNFMO,UNIVERSIDAD DE TORINO ,No 4245,0,LOMAS UNIVERSIDAD ETAPA V,CHIHUAHUA,CHI,31123,614 1420421,miguel.marcial@bayer.com",
+        "WETLIA,HERNANDEZ FERNANDEZ JOSE ALFREDO,GFBSI,COAHUILA,No 162,,VILLA RICA AMPLIACIÓN,BOCA DEL RIO,VER,94298,229 2138725,josealfredo.hernandez@bayer.com",
+        "WETLIA,ORTIZ CURIEL DIANA LIZETH,GDUQN,PINOS,No 232,,VILLAS DE ANAHUAC SEC ALPES II,ESCOBEDO,NLE,66059,81 80118978,diana.ortiz@bayer.com",
+        "WETLIA,AHUMADA GARCIA ISRAEL,GMQPR,BOSQUE DE TAMARINDOS,1116,,VILLAS DEL CAMPO,CALIMAYA,ESTADO DE MEXICO,52220,55 5619939574,israel.ahumada@bayer.com",
+        "WETLIA,DE LA ROSA MATA RUTH NOHEMI,EQHPU,FAISAN VENERADO,No 1013,,LOS FAISANES SECTOR EL DORADO,GUADALUPE,NLE,67169,81 82528262,ruthnohemi.delarosamata@bayer.com",
+        "WETLIA,SOLTERO ROMERO MIRIAM,GFNXH,C. ALI CHUMACERO,No 1000,118,SAN LORENZO COACALCO,METEPEC,MEX,52140,55 54568550,miriam.soltero@bayer.com",
+        "WETLIA,SALAZAR GOMEZ MARTHA LUCERO,GHMAP,LERDO,No 92,ED- D D-304,SAN PABLO,IZTAPALAPA,DIF,09000,55 43750564,martha.salazar@bayer.com",
+        "WETLIA,MONDRAGON ROSALES LILIANA,MEBLR,TINACO,No 20,,BARRANCA SECA,LA MAGDALENA CONTRERAS,DIF,10580,55 54157176,liliana.mondragon@bayer.com",
+        "WETLIA,DE LEON BUSTAMANTE VIOLETA ESMERALDA,GHUUA,EL OCOTE,No 254,,TERRANOVA TUXTLA,TUXTLA GUTIERREZ,CHS,29089,96 16030508,violeta.deleon@bayer.com",
+        "WETLIA,AZPEITIA PEREZ GEORGINA BELEN,MECXX,CIRCUITO DEL BOSQUE,No 242,,BOSQUES VALLARTA,ZAPOPAN,JAL,45222,33 18657198,georgina.azpeitia@bayer.com",
+        "WETLIA,GUTIERREZ ESPARZA NORA DENISSE,GOMJD,C-35,No 401,0,FRANCISCO DE MONTEJO,MERIDA,YUC,97203,0,denisse.gutierrez@bayer.com",
+        "WETLIA,BARRERAS ESPINOZA EDNA GUADALUPE,GIAZX,CDA DE LOS ROMANCES,No 20,,PRIVADAS DEL CID,HERMOSILLO,SON,83107,662 4702948,edna.barreras@bayer.com",
+        "WETLIA,ORONA RUIZ JOSE,GGKFI,PRIVADA COLINA DEL RIO,No 7653,91,RESIDENCIAL AGUA CALIENTE,TIJUANA,BCN,22194,664 2010578,jose.orona@bayer.com",
+        "WETLIA,HERRERA LIMON MARIO,MEBPT,CALLE 12 PONIENTE,No 912,,LA LIBERTAD,PUEBLA,PUE,72130,222 3509687,mario.herrera@bayer.com",
+        "WETLIA,XALDIGITAL REPRESENTANTE TEST,MEBPZ,CALLE 12 PONIENTE,No 912,,LA LIBERTAD,PUEBLA,PUE,72130,222 3509687,kandreyrosales@gmail.com",
+        "WETLIA,BAYER REPRESENTANTE TEST,REPR1,CALLE 12 PONIENTE,No 912,,LA LIBERTAD,PUEBLA,PUE,72130,222 3509687,juangabriel.gonzalez@bayer.com",
+        "WETLIA,XALDIGITAL ADMIN TEST,ABCDE,CALLE 12 PONIENTE,No 912,,LA LIBERTAD,PUEBLA,PUE,72130,222 3509687,lilian.heredia@xaldigital.com",
+        "WETLIA,CARLA GALINDO,ADMIN1,CALLE 12 PONIENTE,No 912,,LA LIBERTAD,PUEBLA,PUE,72130,222 3509687,carla.galindo@bayer.com",
+
+    ]
+    for entry in bayer_cwid_initial_data:
+        fields = entry.split(',')
+        bayer_user = BayerUser(
+            customer_team=fields[0],
+            name=fields[1],
+            cwid=fields[2],
+            address=fields[3],
+            ext_number=fields[4],
+            int_number=fields[5],
+            colonia=fields[6],
+            ciudad=fields[7],
+            edo=fields[8],
+            cp=fields[9],
+            cel_bayer=fields[10],
+            email=fields[11]
+        )
+        db.session.add(bayer_user)
+    # with open('static/assets/img/bayer_admin_signature.png', 'rb') as f:
+    #     image_data = f.read()
+    #     admin_signature = Signature(user_email=ADMIN_EMAIL, signature_image=image_data)
+    #     db.session.add(admin_signature)
+    db.session.commit()
+    return {"message": "Data inicial cargada!"}
+
+
+@admin_bp.route('/admin', methods=["GET"])
+@token_required
+@requires_admin_email()
+def index_admin():
+    return render_template('admin/index_admin.html', admin_user=True)
+
+
+@admin_bp.route('/add_insumos_form', methods=["GET"])
+@token_required
+def add_insumos_form():
+    return render_template("representante/add_insumos_form.html",
+                           vendors=vendor_options())
+
+
+@admin_bp.route('/getvendorlist', methods=["GET"])
+@token_required
+def getvendorlist():
+    options = [
+        {'id': vendor['id'], 'text': vendor['name']} for vendor in vendor_options()
+    ]
+    return jsonify(options)
+
+
+@admin_bp.route('/api/vendors', methods=["GET"])
+@token_required
+def insumos_list():
+    page = request.args.get('page', 1, type=int)
+    per_page = 10  # Number of records per page
+    pagination = Insumo.query.order_by(Insumo.last_updated.desc()).paginate(
+        page=page, per_page=per_page, max_per_page=10, count=True, error_out=False)
+    insumos = pagination.items
+    return render_template('admin/insumos_table.html',
+                           insumos=insumos,
+                           pagination=pagination)
+
+
+def search_query_insumos(query, page, per_page, max_per_page=10):
+    if query:
+        insumos = (
+            Insumo.query.filter(Insumo.name.ilike(f'%{query}%'))
+            .order_by(Insumo.last_updated.desc())
+            .paginate(page=page, per_page=per_page, max_per_page=max_per_page, count=True, error_out=False)
+        )
+    else:
+        insumos = Insumo.query.order_by(Insumo.last_updated.desc()).paginate(
+            page=page, per_page=per_page, max_per_page=max_per_page, count=True, error_out=False)
+    return insumos
+
+
+@admin_bp.route('/search_insumos', methods=['GET'])
+@token_required
+@requires_admin_email()
+def search_insumos():
+    query = request.args.get('query', '')
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+    insumos = search_query_insumos(query=query, per_page=per_page, page=page)
+    return render_template('admin/insumos_table.html', insumos=insumos.items, pagination=insumos)
+
+
+def _bulk_edit_page(page, query, **context):
+    insumos = search_query_insumos(query=query, page=page, per_page=BULK_EDIT_PAGE_SIZE,
+                                   max_per_page=BULK_EDIT_PAGE_SIZE)
+    return render_template('admin/insumos_bulk_edit_table.html', insumos=insumos.items, pagination=insumos,
+                           vendors=vendor_options(), **context)
+
+
+@admin_bp.route('/bulk_edit_insumos', methods=['GET', 'POST'])
+@token_required
+@requires_admin_email()
+def bulk_edit_insumos():
+    """
+    GET: the insumos table with editable rows. POST: applies the edited rows in one transaction, from
+    that form or as JSON ``{"insumos": [{"id", "version", "stock", "unit_cost", "vendor_id",
+    "reorder_threshold"}, ...]}`` (fields left out are not changed; a body of another shape is a 400
+    ``{"error": ...}``)
+    """
+    if request.method == 'GET':
+        return _bulk_edit_page(request.args.get('page', 1, type=int), request.args.get('query', ''))
+
+    if request.is_json:
+        try:
+            changes = parse_batch(request.get_json(silent=True))
+        except InvalidInsumoChange as e:
+            return jsonify({'error': str(e)}), 400
+        updated, conflicts = apply_insumo_changes(changes)
+        return jsonify({'updated': updated, 'conflicts': conflicts})
+
+    form = request.form
+    changes = [{
+        'id': insumo_id,
+        'version': form.get(f'version_{insumo_id}'),
+        'stock': form.get(f'stock_{insumo_id}'),
+        'unit_cost': form.get(f'unit_cost_{insumo_id}'),
+        'vendor_id': form.get(f'vendor_{insumo_id}'),
+        'reorder_threshold': form.get(f'reorder_threshold_{insumo_id}'),
+    } for insumo_id in form.getlist('insumo_ids')]
+    updated, conflicts = apply_insumo_changes(changes)
+    return _bulk_edit_page(form.get('page', 1, type=int), form.get('query', ''),
+                           updated_count=len(updated), conflicts=conflicts)
+
+
+@admin_bp.route('/api/low_stock', methods=['GET'])
+@token_required
+@requires_admin_email()
+def low_stock():
+    return render_template('admin/low_stock_table.html', insumos=low_stock_insumos())
+
+
+@admin_bp.route('/api/low_stock_badge', methods=['GET'])
+@token_required
+@requires_admin_email()
+def low_stock_badge():
+    return render_template('admin/low_stock_badge.html', low_stock_count=low_stock_count())
+
+
+@admin_bp.route('/search_orders_admin', methods=['GET'])
+@token_required
+@requires_admin_email()
+def search_orders_admin():
+    """
+    Filtering all the status except orders with status CREADA, with any combination of the filters
+    of insumos/order_search.py
+    """
+    include_archive = request.args.get('include_archive') == 'on'
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+    try:
+        search = build_order_search(
+            parse_order_filters(request.args),
+            sort=request.args.get('sort') or DEFAULT_SORT,
+            direction=request.args.get('direction') or 'desc',
+            include_archive=include_archive)
+    except InvalidOrderSearch as e:
+        return render_template("custom_alert_message.html", message=str(e), error=True)
+    pagination = search.paginate(page=page, per_page=per_page, max_per_page=10, count=True, error_out=False)
+    archived = archived_ids([order.id for order in pagination.items]) if include_archive else set()
+    representantes = representantes_by_email(pagination.items)
+    new_dict_orders_list = []
+    for order in pagination.items:
+        representante, customer_team = representantes.get(order.user_email, (None, None))
+        new_dict_orders_list.append({
+            "id": order.id,
+            "representante": representante,
+            "institucion_entrega": order.delivery_institute,
+            "customer_team": customer_team,
+            "total": order.total,
+            "fecha_pedido": order.creation_date,
+            "fecha_entrega": datetime.strftime(
+                order.estimated_delivery_date,
+                "%d-%m-%Y") if order.estimated_delivery_date else "",
+            "estado": order.status.value,
+            "direccion_entrega": order.delivery_information,
+            "archivado": order.id in archived
+        })
+    return render_template(
+        'admin/orders_table.html',
+        orders=new_dict_orders_list,
+        pagination=pagination,
+        include_archive=include_archive
+    )
+
+
+@admin_bp.route('/pedidos', methods=["GET"])
+@token_required
+@requires_admin_email()
+def pedidos():
+    customer_teams = bayer_user_cache.get_or_set('customer_teams', lambda: [
+        team for team, in db.session.query(BayerUser.customer_team).distinct().order_by(BayerUser.customer_team)])
+    return render_template(
+        'admin/orders_admin.html',
+        admin_user=True,
+        statuses=[status for status in OrderStatus if status != OrderStatus.CREADA],
+        customer_teams=customer_teams,
+        sorts=ORDER_SORTS
+    )
+
+
+@admin_bp.route('/api/get_orders_to_delete_html', methods=["GET", "POST"])
+@token_required
+@requires_admin_email()
+def get_orders_to_delete_html():
+    if request.method == 'GET':
+        list_orders_id_raw = request.args.get('orders_id_list')
+        orders_ids = [int(order_id) for order_id in json.loads(list_orders_id_raw)]
+        filtered_orders = Order.query.filter(Order.id.in_(orders_ids)).all()
+        return render_template(
+            'admin/orders_to_delete.html',
+            orders_to_delete=filtered_orders
+        )
+    else:
+        list_orders_id_raw = request.form.get('orders_id_list')
+        orders_ids = [int(order_id) for order_id in json.loads(list_orders_id_raw)]
+        filtered_orders = Order.query.filter(Order.id.in_(orders_ids)).all()
+        for order in filtered_orders:
+            change_order_status(order, OrderStatus.CANCELADO, changed_by=session.get('user_email'))
+        db.session.commit()
+        return render_template(
+            'custom_alert_message.html',
+            message='Pedidos cancelados!'
+        )
+
+
+def filter_vendor(vendor_id: int):
+    filtered_vendor = Vendor.query.filter_by(id=vendor_id).all()
+    if len(filtered_vendor) == 1:
+        return filtered_vendor[0]
+    else:
+        raise ValueError("El proveedor no existe")
+
+
+def _stock_levels(stock, reorder_threshold):
+    try:
+        stock = int(stock)
+        reorder_threshold = int(reorder_threshold or 0)
+    except (TypeError, ValueError):
+        raise ValueError("El stock y el punto de reorden deben ser números enteros")
+    if stock < 0 or reorder_threshold < 0:
+        raise ValueError("El stock y el punto de reorden no pueden ser negativos")
+    return stock, reorder_threshold
+
+
+@admin_bp.route('/add_insumos_records', methods=["POST"])
+@token_required
+def add_insumos_records():
+    """
+    Adding an Insumo record to the datatabase
+    """
+    name = request.form.get('name')
+    stock = request.form.get('stock')
+    unit_cost = request.form.get('unit_cost')
+    vendor_id = int(request.form.get('vendorselect'))
+    try:
+        stock, reorder_threshold = _stock_levels(stock, request.form.get('reorder_threshold'))
+        vendor = filter_vendor(vendor_id=vendor_id)
+        insumo = Insumo(name=name, stock=stock, unit_cost=unit_cost, vendor=vendor,
+                        reorder_threshold=reorder_threshold)
+        db.session.add(insumo)
+        db.session.commit()
+        message = "Insumo agregado correctamente!"
+        error = False
+    except Exception as e:
+        message = str(e)
+        error = True
+    return render_template("custom_alert_message.html",
+                           error=error,
+                           message=message)
+
+
+@admin_bp.route('/edit_insumo/<int:insumo_id>', methods=["GET", "POST"])
+@token_required
+@requires_admin_email()
+def edit_insumo(insumo_id):
+    """
+    Editing an Insumo record based on its ID
+    """
+    name = request.form.get('name')
+    stock = request.form.get('stock')
+    unit_cost = request.form.get('unit_cost')
+    vendor_id = int(request.form.get('vendorselect', 0))
+    try:
+        insumo = Insumo.query.get(insumo_id)
+        if request.method == "POST":
+            stock, reorder_threshold = _stock_levels(stock, request.form.get('reorder_threshold'))
+            vendor = filter_vendor(vendor_id=vendor_id)
+            insumo.name = name
+            insumo.stock = stock
+            insumo.reorder_threshold = reorder_threshold
+            insumo.unit_cost = unit_cost
+            insumo.vendor = vendor
+            insumo.last_updated = datetime.utcnow()
+            insumo.version = Insumo.version + 1
+            db.session.commit()
+            return render_template(
+                "custom_alert_message.html",
+                message="Insumo agregado correctamente!",
+                error=False)
+        else:
+            vendor = filter_vendor(vendor_id=insumo.vendor_id)
+            return render_template('admin/edit_insumos_admin.html',
+                                   insumo=insumo,
+                                   insumo_number=insumo.id,
+                                   vendors=vendor_options(),
+                                   vendor_selected_id=vendor.id)
+    except Exception as e:
+        return render_template(
+            "custom_alert_message.html",
+            message=str(e),
+            error=True)
+
+
+@admin_bp.route('/edit_order/<int:order_id>', methods=["GET", "POST"])
+@token_required
+@requires_admin_email()
+def edit_order(order_id):
+    """
+    Editing an Insumo record based on its ID
+    """
+    estimated_delivery_date = request.form.get('estimated_delivery_date')
+    status = request.form.get('status_order')
+    try:
+        order = Order.query.get(order_id)
+        general_statuses_for_admin = [status for status in OrderStatus if status != OrderStatus.CREADA]
+        if request.method == "POST":
+            if estimated_delivery_date:
+                order.estimated_delivery_date = estimated_delivery_date
+                order.last_updated = datetime.utcnow()
+            change_order_status(order, status, changed_by=session.get('user_email'))
+            db.session.commit()
+            return render_template(
+                "custom_alert_message.html",
+                message="Pedido actualizado correctamente!",
+                order_id=order_id,
+                estimated_delivery_date=order.estimated_delivery_date,
+                statuses=general_statuses_for_admin,
+                actual_status=order.status.value,
+                error=False)
+        else:
+            return render_template(
+                'admin/edit_order_admin.html',
+                order_id=order_id,
+                estimated_delivery_date=order.estimated_delivery_date.strftime("%Y-%m-%d")
+                if order.estimated_delivery_date else '',
+                statuses=general_statuses_for_admin,
+                actual_status=order.status.value,
+                error=False
+            )
+    except Exception as e:
+        message = str(e)
+        return render_template(
+            "custom_alert_message.html",
+            message=message,
+            error=True)
+
+
+@admin_bp.route('/delete_insumo/<int:insumo_id>', methods=["DELETE"])
+def delete_insumo(insumo_id):
+    insumo = Insumo.query.get_or_404(insumo_id)
+    db.session.delete(insumo)
+    db.session.commit()
+    return jsonify({"Insumo eliminado!"}), 201
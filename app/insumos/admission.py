@@ -0,0 +1,256 @@
+"""
+Admission control: concurrency limits per class of endpoint.
+
+A burst of letter renders or broad searches could otherwise take every
+worker and leave ``/login`` waiting behind them. Each class has its own
+number of slots (``ADMISSION_LIMITS``):
+
+* ``pdf``: letter PDFs and the letters ZIP.
+* ``search``: the order and insumo searches and the API lists.
+* ``auth``: login, logout, sign up and password recovery.
+* ``writes``: any other POST/PUT/PATCH/DELETE.
+* ``streams``: the order event stream, held open for minutes, so this caps
+  the workers (or threads) it can take.
+
+Other GETs (pages, fragments) are not limited. A
+request waits at most ``ADMISSION_QUEUE_TIMEOUT`` seconds for a slot of its
+class, and at most ``ADMISSION_MAX_QUEUE`` requests of a class wait in a
+worker; beyond that it is answered at once with 503 and ``Retry-After``
+(``custom_alert_message.html``, or JSON under ``/api/v1``). The slot is held
+until the response is sent, streamed ones included.
+
+Backends (``ADMISSION_BACKEND``):
+
+* ``host`` (default): slots shared by every worker of the host, as
+  ``flock`` locks on files in ``ADMISSION_LOCK_DIR``, so the limits hold with
+  sync workers too. The kernel frees the slot of a worker that dies.
+* ``process``: a semaphore per worker, for a single worker with threads or
+  gevent.
+* ``off``: no limits.
+
+``/metrics`` exports the waiting requests, the requests holding a slot and
+the limit of each class (in this worker), the time waited for a slot and the
+rejections by reason (``queue_full``, ``timeout``).
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from flask import current_app, g, make_response, render_template, request
+
+from insumos.instrumentation import LATENCY_BUCKETS, Counter, Histogram, metrics
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: only the process backend there
+    fcntl = None
+
+logger = logging.getLogger("insumos.admission")
+
+# Endpoint -> class; other endpoints are limited as writes when called with WRITE_METHODS
+ENDPOINT_CLASSES = {
+    'letters.order_pdf_letter': 'pdf',
+    'letters.orders_letters_zip': 'pdf',
+    'admin.search_orders_admin': 'search',
+    'admin.search_insumos': 'search',
+    'representante.search_insumos_representante': 'search',
+    'representante.orders_representante_list': 'search',
+    'api_v1.list_orders': 'search',
+    'api_v1.list_insumos': 'search',
+    'auth.login_representante': 'auth',
+    'auth.logout': 'auth',
+    'auth.registro_representante': 'auth',
+    'auth.confirm_account_code': 'auth',
+    'auth.forgot_password': 'auth',
+    'auth.send_reset_password_link': 'auth',
+    'order_events.order_events': 'streams',
+}
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+ADMISSION_WAIT = metrics.register(Histogram(
+    "insumos_admission_wait_seconds", "Time requests waited for a slot of their class", ("class",),
+    buckets=(0.001,) + LATENCY_BUCKETS))
+ADMISSION_REJECTED = metrics.register(Counter(
+    "insumos_admission_rejected_total", "Requests answered with 503 by class and reason (queue_full, timeout)",
+    ("class", "reason")))
+
+
+class ProcessSlots:
+    name = 'process'
+
+    def __init__(self, admission_class, size):
+        self._semaphore = threading.BoundedSemaphore(size)
+
+    def acquire(self, timeout):
+        return self._semaphore.acquire(timeout=timeout) or None
+
+    def release(self, token):
+        self._semaphore.release()
+
+
+class HostSlots:
+    """
+    Slot ``i`` of a class is held while a process has an exclusive ``flock`` on ``<class>.<i>.lock``
+    """
+    name = 'host'
+
+    # Seconds between attempts while every slot is taken, doubling up to the maximum
+    POLL_INTERVAL = 0.005
+    MAX_POLL_INTERVAL = 0.05
+
+    def __init__(self, admission_class, size, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f'{admission_class}.{i}.lock') for i in range(size)]
+
+    def _try_slot(self, path):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        interval = self.POLL_INTERVAL
+        while True:
+            # Random order so the first slots are not always the contended ones
+            for path in random.sample(self.paths, len(self.paths)):
+                fd = self._try_slot(path)
+                if fd is not None:
+                    return fd
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, self.MAX_POLL_INTERVAL)
+
+    def release(self, token):
+        # Closing the descriptor drops the lock
+        os.close(token)
+
+
+class AdmissionPool:
+    def __init__(self, admission_class, slots, limit, max_queue):
+        self.admission_class = admission_class
+        self.slots = slots
+        self.limit = limit
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+
+    def acquire(self, timeout):
+        """
+        ``(token, None)`` with a slot, or ``(None, reason)`` when the request must be rejected
+        """
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                return None, 'queue_full'
+            self.waiting += 1
+        start = time.monotonic()
+        try:
+            token = self.slots.acquire(timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        ADMISSION_WAIT.observe((self.admission_class,), time.monotonic() - start)
+        if token is None:
+            return None, 'timeout'
+        with self._lock:
+            self.in_flight += 1
+        return token, None
+
+    def release(self, token):
+        with self._lock:
+            self.in_flight -= 1
+        self.slots.release(token)
+
+
+_pools = {}
+
+
+def create_pools(app):
+    config = app.config
+    backend = config['ADMISSION_BACKEND']
+    if backend == 'off':
+        return {}
+    if backend == 'host' and fcntl is None:
+        logger.warning("flock is not available: admission limits apply per process")
+        backend = 'process'
+    if backend not in ('host', 'process'):
+        raise ValueError(f"Unknown ADMISSION_BACKEND: {backend}")
+    pools = {}
+    for admission_class, limit in config['ADMISSION_LIMITS'].items():
+        if backend == 'host':
+            slots = HostSlots(admission_class, limit, config['ADMISSION_LOCK_DIR'])
+        else:
+            slots = ProcessSlots(admission_class, limit)
+        pools[admission_class] = AdmissionPool(admission_class, slots, limit, config['ADMISSION_MAX_QUEUE'])
+    return pools
+
+
+def endpoint_class(endpoint, method):
+    admission_class = ENDPOINT_CLASSES.get(endpoint)
+    if admission_class is None and endpoint and method in WRITE_METHODS:
+        return 'writes'
+    return admission_class
+
+
+def _rejection(admission_class):
+    retry_after = int(current_app.config['ADMISSION_RETRY_AFTER'])
+    message = (f"El servidor está atendiendo demasiadas solicitudes en este momento. "
+               f"Intenta de nuevo en {retry_after} segundos.")
+    if request.blueprint == 'api_v1':
+        response = make_response(json.dumps({'error': message}, ensure_ascii=False), 503)
+        response.mimetype = 'application/json'
+    else:
+        response = make_response(render_template('custom_alert_message.html', message=message, error=True), 503)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _admit():
+    pool = _pools.get(endpoint_class(request.endpoint, request.method))
+    if pool is None:
+        return None
+    token, reason = pool.acquire(current_app.config['ADMISSION_QUEUE_TIMEOUT'])
+    if token is None:
+        ADMISSION_REJECTED.inc((pool.admission_class, reason))
+        logger.warning("Rejected %s %s: %s slots %s", request.method, request.path, pool.admission_class, reason)
+        return _rejection(pool.admission_class)
+    g.admission = (pool, token)
+    return None
+
+
+def _release(exc):
+    admission = g.pop('admission', None)
+    if admission is not None:
+        pool, token = admission
+        pool.release(token)
+
+
+def _collect_admission_gauges():
+    lines = []
+    for name, documentation, attribute in (
+            ("insumos_admission_queue_depth", "Requests waiting for a slot of their class", 'waiting'),
+            ("insumos_admission_in_flight", "Requests holding a slot of their class", 'in_flight'),
+            ("insumos_admission_limit", "Slots of each class", 'limit')):
+        lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge"])
+        lines.extend(f'{name}{{class="{pool.admission_class}"}} {getattr(pool, attribute)}'
+                     for pool in _pools.values())
+    return lines
+
+
+metrics.add_collector(_collect_admission_gauges)
+
+
+def init_app(app):
+    _pools.clear()
+    _pools.update(create_pools(app))
+    app.before_request(_admit)
+    app.teardown_request(_release)
@@ -0,0 +1,234 @@
+"""
+JSON API (``/api/v1``) for integrations and the mobile client.
+
+* ``GET /api/v1/insumos``: the catalog (``query`` filters by name).
+* ``GET /api/v1/orders``: orders; admins get every order and the filters of
+  the admin search (insumos/order_search.py), representantes only their own.
+* ``GET /api/v1/orders/<id>/items``: the insumos of one order.
+
+``fields=id,name,...`` picks the columns (sparse fieldsets): only those are
+selected in SQL. Lists are paginated with an opaque ``cursor`` over the id
+(keyset pagination, so deep pages cost the same as the first one) and
+``limit`` rows (``API_PAGE_SIZE``, at most ``API_MAX_PAGE_SIZE``). They are
+streamed as they are read, with server-side cursors where the driver has
+them, and serialized with orjson: dates as ISO 8601, ``Numeric`` amounts as
+strings so no precision is lost, statuses by name::
+
+    {"data": [{...}, ...], "next_cursor": "..." | null}
+
+Errors are ``{"error": "..."}`` with status 400, 401 or 404.
+"""
+import base64
+import binascii
+from decimal import Decimal
+
+import orjson
+from flask import Blueprint, Response, current_app, request, session, stream_with_context
+from sqlalchemy import Enum, select
+
+from insumos.auth import ADMIN_EMAILS, token_required
+from insumos.extensions import db
+from insumos.models import Insumo, Order, OrderStatus, Vendor
+from insumos.order_search import FILTERS, InvalidOrderSearch, parse_order_filters
+
+api_v1_bp = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+# Field -> column, per resource
+INSUMO_FIELDS = {
+    'id': Insumo.id,
+    'name': Insumo.name,
+    'stock': Insumo.stock,
+    'unit_cost': Insumo.unit_cost,
+    'reorder_threshold': Insumo.reorder_threshold,
+    'vendor_id': Insumo.vendor_id,
+    'vendor_name': Vendor.name,
+    'last_updated': Insumo.last_updated,
+    # Sent back in the batch edits of /bulk_edit_insumos
+    'version': Insumo.version,
+}
+ORDER_FIELDS = {
+    'id': Order.id,
+    'user_email': Order.user_email,
+    'status': Order.status,
+    'creation_date': Order.creation_date,
+    'estimated_delivery_date': Order.estimated_delivery_date,
+    'last_updated': Order.last_updated,
+    'total': Order.total,
+    'delivery_institute': Order.delivery_institute,
+    'delivery_information': Order.delivery_information,
+    'doctor_name': Order.doctor_name,
+    'doctor_position': Order.doctor_position,
+    'letter_response_date': Order.letter_response_date,
+    'items': Order.data,
+}
+DEFAULT_INSUMO_FIELDS = ('id', 'name', 'stock', 'unit_cost', 'vendor_id')
+DEFAULT_ORDER_FIELDS = ('id', 'user_email', 'status', 'creation_date', 'estimated_delivery_date', 'total',
+                        'delivery_institute')
+
+# Rows fetched from the database per round trip while streaming
+STREAM_BATCH_SIZE = 500
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+@api_v1_bp.errorhandler(ApiError)
+def _api_error(e):
+    return _json({'error': str(e)}, e.status)
+
+
+@api_v1_bp.errorhandler(InvalidOrderSearch)
+def _invalid_search(e):
+    return _json({'error': str(e)}, 400)
+
+
+@api_v1_bp.before_request
+def _require_session():
+    # token_required answers with the login page; API clients get a JSON 401 instead
+    if not session.get('access_token'):
+        return _json({'error': "Sesión no iniciada"}, 401)
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError
+
+
+def _dumps(value):
+    return orjson.dumps(value, default=_default)
+
+
+def _json(value, status=200):
+    return Response(_dumps(value), status=status, mimetype='application/json')
+
+
+def _fields(allowed, default):
+    requested = request.args.get('fields')
+    if not requested:
+        return list(default)
+    fields = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ApiError(f"Campos no válidos: {', '.join(unknown)}. Disponibles: {', '.join(allowed)}")
+    return fields
+
+
+def _limit():
+    config = current_app.config
+    limit = request.args.get('limit', config['API_PAGE_SIZE'], type=int)
+    if limit < 1:
+        raise ApiError("limit debe ser mayor que 0")
+    return min(limit, config['API_MAX_PAGE_SIZE'])
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(_dumps({'after': last_id})).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        last_id = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))['after']
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ApiError("cursor no válido")
+    if not isinstance(last_id, int):
+        raise ApiError("cursor no válido")
+    return last_id
+
+
+def _page(statement, id_column, fields, descending=False):
+    """
+    Stream one page of ``statement`` (already restricted to the requested columns and filters)
+    """
+    limit = _limit()
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = decode_cursor(cursor)
+        statement = statement.where(id_column < after if descending else id_column > after)
+    statement = (statement
+                 .order_by(id_column.desc() if descending else id_column.asc())
+                 .limit(limit + 1)
+                 .execution_options(yield_per=STREAM_BATCH_SIZE))
+
+    # orjson writes enums by value: statuses are sent by name, as the filters take them
+    enum_fields = [name for name, column in zip(fields, statement.selected_columns)
+                   if isinstance(column.type, Enum)]
+
+    def generate():
+        result = db.session.execute(statement)
+        try:
+            yield b'{"data":['
+            last_id = None
+            sent = 0
+            has_more = False
+            for row in result:
+                if sent == limit:
+                    # The extra row only tells there is a next page
+                    has_more = True
+                    break
+                # The id is always selected, last, for the cursor
+                last_id = row[-1]
+                item = dict(zip(fields, row))
+                for name in enum_fields:
+                    if item[name] is not None:
+                        item[name] = item[name].name
+                yield (b',' if sent else b'') + _dumps(item)
+                sent += 1
+            yield b'],"next_cursor":' + _dumps(encode_cursor(last_id) if has_more else None) + b'}'
+        finally:
+            result.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def _columns(allowed, fields, id_column):
+    return [allowed[name] for name in fields] + [id_column]
+
+
+@api_v1_bp.route('/insumos')
+@token_required
+def list_insumos():
+    fields = _fields(INSUMO_FIELDS, DEFAULT_INSUMO_FIELDS)
+    statement = select(*_columns(INSUMO_FIELDS, fields, Insumo.id))
+    if 'vendor_name' in fields:
+        statement = statement.join(Vendor, Vendor.id == Insumo.vendor_id)
+    query = request.args.get('query', '').strip()
+    if query:
+        statement = statement.where(Insumo.name.ilike(f'%{query}%'))
+    return _page(statement, Insumo.id, fields)
+
+
+def _visible_orders(statement):
+    # Same orders as the HTML tables: all of a representante's own, every confirmed one for admins
+    user_email = session.get('user_email')
+    if user_email in ADMIN_EMAILS:
+        return statement.where(Order.status != OrderStatus.CREADA)
+    return statement.where(Order.user_email == user_email)
+
+
+@api_v1_bp.route('/orders')
+@token_required
+def list_orders():
+    """
+    Newest first; admins can also use the filters of the admin search (``query_status``,
+    ``fecha_desde``, ``total_min``...)
+    """
+    fields = _fields(ORDER_FIELDS, DEFAULT_ORDER_FIELDS)
+    statement = _visible_orders(select(*_columns(ORDER_FIELDS, fields, Order.id)))
+    if session.get('user_email') in ADMIN_EMAILS:
+        for name, value in parse_order_filters(request.args).items():
+            _, apply = FILTERS[name]
+            statement = apply(statement, Order, value)
+    return _page(statement, Order.id, fields, descending=True)
+
+
+@api_v1_bp.route('/orders/<int:order_id>/items')
+@token_required
+def order_items(order_id):
+    row = db.session.execute(_visible_orders(select(Order.data)).where(Order.id == order_id)).first()
+    if row is None:
+        raise ApiError("Pedido no encontrado", 404)
+    return _json({'data': row.data or []})
@@ -0,0 +1,109 @@
+"""
+Archival of closed orders.
+
+Delivered and cancelled orders whose last update is older than the retention
+window are moved from ``orders`` to ``orders_archive`` in batches, one
+transaction per batch, so ``orders`` (and its indexes) only holds the working
+set the representantes and the admin search touch every day. Run it from a
+scheduler (cron, systemd timer) with ``flask archive-orders``.
+
+The admin search and the representante order list read the archive only when
+asked (``include_archive``), through ``orders_with_archive``; the letters of
+an archived order are still served (``get_order_or_archived_or_404``).
+"""
+from datetime import datetime, timedelta
+
+import click
+from flask import abort
+from sqlalchemy import delete, insert, literal, null, select, union_all, update
+from sqlalchemy.orm import aliased
+
+from insumos.extensions import db
+from insumos.models import ArchivedOrder, Insumo, Order, OrderStatus
+
+ARCHIVABLE_STATUSES = (OrderStatus.ENTREGADO, OrderStatus.CANCELADO)
+_BLOB_COLUMNS = ('letter', 'letter_response')
+
+
+def _order_columns():
+    return [column.name for column in Order.__table__.columns]
+
+
+def archive_orders(retention_days, batch_size=500):
+    """
+    Returns the number of archived orders
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    columns = _order_columns()
+    orders = Order.__table__
+    archived = 0
+    archivable = (orders.c.status.in_(ARCHIVABLE_STATUSES), orders.c.last_updated < cutoff)
+    while True:
+        # Locked until the commit, so a status change cannot land between the copy and the delete;
+        # rows a writer holds are skipped and archived on a later run
+        order_ids = db.session.execute(
+            select(orders.c.id)
+            .where(*archivable)
+            .order_by(orders.c.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not order_ids:
+            return archived
+
+        # The condition is repeated so a row that stopped matching (SQLite has no row locks) is left alone
+        db.session.execute(
+            insert(ArchivedOrder.__table__).from_select(
+                columns + ['archived_at'],
+                select(*[orders.c[name] for name in columns], literal(datetime.utcnow()))
+                .where(orders.c.id.in_(order_ids), *archivable)))
+        moved = select(ArchivedOrder.id).where(ArchivedOrder.id.in_(order_ids))
+        db.session.execute(
+            update(Insumo.__table__).where(Insumo.__table__.c.order_id.in_(moved)).values(order_id=None))
+        deleted = db.session.execute(
+            delete(orders).where(orders.c.id.in_(moved), *archivable)).rowcount
+        db.session.commit()
+        archived += deleted
+
+
+def orders_with_archive():
+    """
+    ``Order`` entity over ``orders UNION ALL orders_archive``, for read-only searches
+    """
+    hot = select(*_search_columns(Order.__table__))
+    cold = select(*_search_columns(ArchivedOrder.__table__))
+    return aliased(Order, union_all(hot, cold).subquery('orders_all'), adapt_on_names=True)
+
+
+def _search_columns(table):
+    # The letter PDFs are not read by the searches: kept out of the UNION as typed NULLs
+    return [null().cast(table.c[name].type).label(name) if name in _BLOB_COLUMNS else table.c[name]
+            for name in _order_columns()]
+
+
+def get_order_or_archived_or_404(order_id):
+    """
+    The ``Order`` with ``order_id``, or its ``ArchivedOrder`` once archived, for the read-only views
+    """
+    order = db.session.get(Order, order_id) or db.session.get(ArchivedOrder, order_id)
+    if order is None:
+        abort(404)
+    return order
+
+
+def archived_ids(order_ids):
+    if not order_ids:
+        return set()
+    return set(db.session.execute(
+        select(ArchivedOrder.id).where(ArchivedOrder.id.in_(order_ids))).scalars())
+
+
+def init_app(app):
+    @app.cli.command('archive-orders')
+    @click.option('--retention-days', type=int, default=lambda: app.config['ORDER_RETENTION_DAYS'],
+                  show_default='ORDER_RETENTION_DAYS', help='Days since the last update before archiving')
+    @click.option('--batch-size', type=int, default=500, show_default=True, help='Orders moved per transaction')
+    def archive_orders_command(retention_days, batch_size):
+        """Move delivered and cancelled orders past the retention window to orders_archive."""
+        archived = archive_orders(retention_days, batch_size)
+        click.echo(f"{archived} orders archived.")
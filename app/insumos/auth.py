@@ -0,0 +1,381 @@
+"""
+Registration, login and password flows against Cognito, plus the access
+decorators shared by the other blueprints.
+"""
+from datetime import datetime
+from functools import wraps
+
+import jwt
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, session, abort
+
+from insumos.cognito import CognitoUnavailableError
+from insumos.extensions import cache, db, cognito_client
+from insumos.models import BayerUser
+
+auth_bp = Blueprint('auth', __name__)
+
+LOGIN_URL_REPRESENTATE = 'login/login_representante.html'
+SIGNUP_URL_REPRESENTATE = 'login/registro_representante.html'
+CONFIRM_ACCOUNT_CODE_URL = 'login/confirm_account_code.html'
+RESET_PASSWORD_URL = 'login/reset_password.html'
+SEND_RESET_PASSWORD_LINK = 'login/send_reset_password_link.html'
+
+ADMIN_EMAILS = ['lilian.heredia@xaldigital.com', 'carla.galindo@bayer.com']
+
+
+@auth_bp.route('/autocomplete')
+def autocomplete():
+    """
+    Function to get all the data of representante based on CWID field
+    :return:
+    """
+    cwid = request.args.get('cwid_custom_id', '')
+    bayer_user = BayerUser.query.filter_by(cwid=cwid).first()
+    if bayer_user:
+        return render_template(
+            "login/form_data_cwid_registro_representante.html",
+            cwid_custom_id=bayer_user.cwid,
+            username=bayer_user.email,
+            fullname=bayer_user.name,
+            customer_team_input=bayer_user.customer_team,
+            delivery_address=bayer_user.address,
+            city=bayer_user.ciudad,
+            colonia=bayer_user.colonia,
+            ext_number=bayer_user.ext_number,
+            int_number=bayer_user.int_number,
+            edo=bayer_user.edo,
+            cp=bayer_user.cp,
+            telephone_bayer=bayer_user.cel_bayer
+        )
+    else:
+        return render_template(
+            "login/form_data_cwid_registro_representante.html",
+            cwid_custom_id=cwid,
+            username="",
+            fullname="",
+            customer_team_input="",
+            delivery_address="",
+            city="",
+            colonia="",
+            ext_number="",
+            int_number="",
+            edo="",
+            cp="",
+            telephone_bayer=""
+        )
+
+
+def authenticate_user(username, password):
+    try:
+        response = cognito_client.admin_initiate_auth(
+            AuthFlow='ADMIN_NO_SRP_AUTH',
+            AuthParameters={
+                'USERNAME': username,
+                'PASSWORD': password
+            },
+            ClientId=current_app.config['COGNITO_CLIENT_ID'],
+            UserPoolId=current_app.config['COGNITO_USER_POOL_ID'],
+            ClientMetadata={
+                'username': username,
+                'password': password,
+            }
+        )
+        return response
+    except cognito_client.exceptions.NotAuthorizedException as e:
+        # Handle invalid credentials
+        return {"reason": "Credenciales Inválidas"}
+    except cognito_client.exceptions.ResourceNotFoundException as e:
+        # Handle invalid credentials
+        return {"reason": "Recurso No Encontrado"}
+    except cognito_client.exceptions.UserNotFoundException as e:
+        # Handle invalid credentials
+        return {"reason": "Usuario No Encontrado"}
+    except cognito_client.exceptions.UserNotConfirmedException as e:
+        # Handle invalid credentials
+        return {"reason": "Usuario No Confirmado"}
+    except CognitoUnavailableError as e:
+        return {"reason": str(e)}
+    except Exception as e:
+        # Handle other errors
+        return {"reason": "Error general. Por favor contactar al administrador"}
+
+
+def requires_admin_email():
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            if session.get('user_email') not in ADMIN_EMAILS:
+                return redirect(url_for('representante.representante'))
+            return func(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# Registered representantes and their customer teams; changed by any BayerUser write
+bayer_user_cache = cache.namespace('bayer_users', invalidated_by=(BayerUser,))
+
+
+def is_representante(email):
+    if not email:
+        return False
+    return bayer_user_cache.get_or_set(
+        f'registered:{email}', lambda: db.session.query(BayerUser.id).filter_by(email=email).first() is not None)
+
+
+def requires_representante_email():
+    def decorator(func):
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            if session.get('user_email') in ADMIN_EMAILS:
+                return redirect(url_for('admin.index_admin'))
+            if not is_representante(session.get('user_email')):
+                return abort(404)
+            return func(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+@auth_bp.route('/login', methods=['GET', 'POST'])
+def login_representante():
+    """
+        Accessing with Cognito using username and password.
+        After login is redirected to reset password and login again
+    """
+
+    if request.method == 'POST':
+        username = request.form.get('username')
+        password = request.form.get('password')
+
+        if not username or not password:
+            return render_template(LOGIN_URL_REPRESENTATE, error="Nombre de usuario y Contraseña obligatorios")
+
+        cognito_response = authenticate_user(username, password)
+
+        reason = cognito_response.get("reason")
+        if reason == "Usuario No Confirmado":
+            return render_template(CONFIRM_ACCOUNT_CODE_URL, email=username)
+        elif reason is not None:
+            return render_template(LOGIN_URL_REPRESENTATE, error=reason)
+
+        auth_result = cognito_response.get("AuthenticationResult")
+        if not auth_result:
+            return render_template(LOGIN_URL_REPRESENTATE, error=cognito_response)
+
+        session['access_token'] = auth_result.get('AccessToken')
+        session['id_token'] = auth_result.get('IdToken')
+        session['user_email'] = username
+        if username in ADMIN_EMAILS:
+            return redirect(url_for('admin.index_admin'))
+        elif BayerUser.query.filter_by(email=username).first():
+            return redirect(url_for('representante.representante'))
+        else:
+            return redirect(url_for('auth.logout'))
+
+
+    else:
+        return render_template(
+            LOGIN_URL_REPRESENTATE,
+            accessKeyId=current_app.config['AWS_ACCESS_KEY_ID'],
+            secretAccessKey=current_app.config['AWS_SECRET_ACCESS_KEY']
+        )
+
+
+@auth_bp.route('/registro', methods=['GET', 'POST'])
+def registro_representante():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        try:
+            response = cognito_client.sign_up(
+                ClientId=current_app.config['COGNITO_CLIENT_ID'],
+                Username=username,
+                Password=password
+            )
+            return render_template(CONFIRM_ACCOUNT_CODE_URL, email=username)
+        except cognito_client.exceptions.NotAuthorizedException as e:
+            # Handle authentication failure
+            return render_template(SIGNUP_URL_REPRESENTATE, error="Usuario no Autorizado para ejecutar esta acción")
+        except cognito_client.exceptions.UsernameExistsException:
+            return render_template(
+                SIGNUP_URL_REPRESENTATE,
+                error="Ya existe una cuenta asociada a este correo")
+        except cognito_client.exceptions.InvalidPasswordException:
+            return render_template(
+                SIGNUP_URL_REPRESENTATE,
+                error="Crea una contraseña de al menos 8 dígitos, más segura, usando al menos una letra mayúscula, "
+                      "un número y un carácter especial")
+        except CognitoUnavailableError as e:
+            return render_template(SIGNUP_URL_REPRESENTATE, error=str(e))
+        except Exception as e:
+            return render_template(
+                LOGIN_URL_REPRESENTATE,
+                error=f"Ha ocurrido el siguiente error: {e}")
+    else:
+        return render_template(SIGNUP_URL_REPRESENTATE)
+
+
+def refresh_access_token():
+    refresh_token = session.get("refresh_token")
+    if not refresh_token:
+        return None
+
+    try:
+        response = cognito_client.initiate_auth(
+            ClientId=current_app.config['COGNITO_CLIENT_ID'],
+            AuthFlow='REFRESH_TOKEN_AUTH',
+            AuthParameters={
+                'REFRESH_TOKEN': refresh_token
+            }
+        )
+        new_access_token = response['AuthenticationResult']['AccessToken']
+        session['access_token'] = new_access_token
+        return new_access_token
+    except cognito_client.exceptions.NotAuthorizedException:
+        return None
+    except CognitoUnavailableError:
+        # The session is still valid: the caller tells the user to retry instead of logging them out
+        raise
+    except Exception as e:
+        current_app.logger.warning("Error refreshing token: %s", e)
+        return None
+
+
+@auth_bp.route('/confirmar_cuenta', methods=['GET', 'POST'])
+def confirm_account_code():
+    email = request.form['email_not_confirmed']
+    email_code = request.form['custom_code']
+    if request.method == "POST":
+        try:
+            cognito_client.confirm_sign_up(
+                ClientId=current_app.config['COGNITO_CLIENT_ID'],
+                Username=email,
+                ConfirmationCode=email_code
+            )
+            return render_template(LOGIN_URL_REPRESENTATE)
+        except cognito_client.exceptions.ExpiredCodeException as e:
+            return render_template(CONFIRM_ACCOUNT_CODE_URL,
+                                   error="El código enviado a su correo ha expirado",
+                                   email=email)
+        except cognito_client.exceptions.CodeMismatchException as e:
+            return render_template(
+                CONFIRM_ACCOUNT_CODE_URL,
+                error="El código no es válido", email=email)
+        except cognito_client.exceptions.TooManyFailedAttemptsException as e:
+            return render_template(
+                CONFIRM_ACCOUNT_CODE_URL,
+                error="Máximo de intentos superados para validar la cuenta", email=email)
+        except cognito_client.exceptions.UserNotFoundException as e:
+            return render_template(
+                CONFIRM_ACCOUNT_CODE_URL,
+                error="Error: Usuario no Encontrado o Eliminado", email=email)
+        except CognitoUnavailableError as e:
+            return render_template(CONFIRM_ACCOUNT_CODE_URL, error=str(e), email=email)
+    else:
+        return render_template(CONFIRM_ACCOUNT_CODE_URL, email=email)
+
+
+@auth_bp.route('/logout')
+def logout():
+    # Clear the session data
+    session.clear()
+    db.session.remove()
+    return redirect(url_for('auth.login_representante'))
+
+
+def token_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = session.get("access_token")
+        if not token:
+            return render_template(LOGIN_URL_REPRESENTATE)
+        try:
+            decoded_token = jwt.decode(token, options={"verify_signature": False})
+            expiration_time = datetime.utcfromtimestamp(decoded_token['exp'])
+            current_time = datetime.utcnow()
+            if expiration_time > current_time:
+                return f(*args, **kwargs)
+            else:
+                new_token = refresh_access_token()
+                if new_token:
+                    return f(*args, **kwargs)
+                else:
+                    db.session.remove()
+                    return render_template(LOGIN_URL_REPRESENTATE, error="Sesión Expirada. Ingrese sus datos de nuevo")
+        except jwt.ExpiredSignatureError:
+            new_token = refresh_access_token()
+            if new_token:
+                return f(*args, **kwargs)
+            else:
+                db.session.remove()
+                return render_template(LOGIN_URL_REPRESENTATE, error="Sesión Expirada. Ingrese sus datos de nuevo")
+        except jwt.InvalidTokenError:
+            return render_template(LOGIN_URL_REPRESENTATE, error="Token inválido. Ingrese sus datos de nuevo")
+        except CognitoUnavailableError as e:
+            return render_template(LOGIN_URL_REPRESENTATE, error=str(e))
+
+    return decorated_function
+
+
+@auth_bp.route('/olvido_contrasena', methods=['GET', 'POST'])
+def forgot_password():
+    if request.method == "POST":
+        email = request.form['email_forgot_password']
+        password = request.form['password']
+        custom_code = request.form['custom_code']
+        try:
+            cognito_client.confirm_forgot_password(
+                ClientId=current_app.config['COGNITO_CLIENT_ID'],
+                Username=email,
+                ConfirmationCode=custom_code,
+                Password=password,
+            )
+            return render_template(LOGIN_URL_REPRESENTATE)
+        except cognito_client.exceptions.UserNotFoundException as e:
+            return render_template(RESET_PASSWORD_URL,
+                                   error="Usuario No Encontrado o Eliminado.", email=email)
+        except cognito_client.exceptions.InvalidPasswordException as e:
+            return render_template(RESET_PASSWORD_URL,
+                                   error="Usuario No Encontrado o Eliminado.", email=email)
+        except cognito_client.exceptions.CodeMismatchException as e:
+            return render_template(RESET_PASSWORD_URL,
+                                   error="Ha ocurrido un problema al enviar el código para asignar una nueva contraseña. "
+                                         "Intenta de nuevo.",
+                                   email=email)
+        except CognitoUnavailableError as e:
+            return render_template(RESET_PASSWORD_URL, error=str(e), email=email)
+        except Exception as e:
+            return render_template(RESET_PASSWORD_URL,
+                                   error=f"Error: {e}", email=email)
+    else:
+        return render_template(RESET_PASSWORD_URL)
+
+
+@auth_bp.route('/enviar_link_contrasena', methods=['GET', 'POST'])
+def send_reset_password_link():
+    if request.method == "POST":
+        email = request.form['email_forgot_password']
+        try:
+            cognito_client.forgot_password(
+                ClientId=current_app.config['COGNITO_CLIENT_ID'],
+                Username=email
+            )
+            return render_template(RESET_PASSWORD_URL)
+
+        except cognito_client.exceptions.UserNotFoundException as e:
+            return render_template(SEND_RESET_PASSWORD_LINK,
+                                   error="Usuario No Encontrado o Eliminado.", email=email)
+        except cognito_client.exceptions.CodeDeliveryFailureException as e:
+            return render_template(
+                SEND_RESET_PASSWORD_LINK,
+                error="Ha ocurrido un problema al enviar el código para asignar una nueva contraseña. "
+                      "Intenta de nuevo.",
+                email=email)
+        except CognitoUnavailableError as e:
+            return render_template(SEND_RESET_PASSWORD_LINK, error=str(e), email=email)
+        except Exception as e:
+            return render_template(SEND_RESET_PASSWORD_LINK,
+                                   error=f"Error: {e}", email=email)
+    else:
+        return render_template(SEND_RESET_PASSWORD_LINK)
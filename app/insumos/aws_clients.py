@@ -0,0 +1,113 @@
+"""
+Lazy boto3 client factory.
+
+Clients are created on first use from a single shared boto3 session, with a
+tuned botocore ``Config`` (connection pool size, connect/read timeouts and
+retry mode). Services that are never called in a worker never pay for their
+client. Every created client is instrumented, so call latency per service and
+operation is exported in ``/metrics``.
+"""
+import threading
+
+import boto3
+from botocore.config import Config
+
+from insumos.instrumentation import instrument_boto3_client
+
+
+class AWSClientFactory:
+    def __init__(self, region_name=None, aws_access_key_id=None, aws_secret_access_key=None,
+                 max_pool_connections=10, connect_timeout=2, read_timeout=5,
+                 retry_mode='adaptive', max_attempts=3, endpoint_urls=None, service_config=None):
+        """
+        :param endpoint_urls: optional ``{service_name: url}``, e.g. to point a client at a local stub
+        :param service_config: optional ``{service_name: {Config kwarg: value}}`` overriding the defaults
+        """
+        self._lock = threading.Lock()
+        self.configure(region_name, aws_access_key_id, aws_secret_access_key, max_pool_connections,
+                       connect_timeout, read_timeout, retry_mode, max_attempts, endpoint_urls, service_config)
+
+    def init_app(self, app):
+        config = app.config
+        self.configure(
+            region_name=config['AWS_REGION'],
+            aws_access_key_id=config['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=config['AWS_SECRET_ACCESS_KEY'],
+            max_pool_connections=config['AWS_MAX_POOL_CONNECTIONS'],
+            connect_timeout=config['AWS_CONNECT_TIMEOUT'],
+            read_timeout=config['AWS_READ_TIMEOUT'],
+            retry_mode=config['AWS_RETRY_MODE'],
+            max_attempts=config['AWS_MAX_ATTEMPTS'],
+            endpoint_urls=config['AWS_ENDPOINT_URLS'],
+            service_config=config['AWS_SERVICE_CONFIG'])
+
+    def configure(self, region_name=None, aws_access_key_id=None, aws_secret_access_key=None,
+                  max_pool_connections=10, connect_timeout=2, read_timeout=5,
+                  retry_mode='adaptive', max_attempts=3, endpoint_urls=None, service_config=None):
+        """
+        Replace the settings; clients already created are discarded and rebuilt on next use
+        """
+        self.region_name = region_name
+        self._credentials = {
+            'aws_access_key_id': aws_access_key_id,
+            'aws_secret_access_key': aws_secret_access_key,
+        }
+        self._default_config = {
+            'max_pool_connections': max_pool_connections,
+            'connect_timeout': connect_timeout,
+            'read_timeout': read_timeout,
+            'retries': {'mode': retry_mode, 'max_attempts': max_attempts},
+        }
+        self.endpoint_urls = dict(endpoint_urls or {})
+        self.service_config = dict(service_config or {})
+        with self._lock:
+            self._session = None
+            self._clients = {}
+
+    # boto3 sessions are not thread-safe while creating clients, callers hold self._lock
+    def _get_session(self):
+        if self._session is None:
+            self._session = boto3.session.Session(region_name=self.region_name, **self._credentials)
+        return self._session
+
+    def client(self, service_name):
+        client = self._clients.get(service_name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(service_name)
+            if client is None:
+                config = Config(**{**self._default_config, **self.service_config.get(service_name, {})})
+                client = self._get_session().client(
+                    service_name,
+                    config=config,
+                    endpoint_url=self.endpoint_urls.get(service_name))
+                instrument_boto3_client(client)
+                self._clients[service_name] = client
+        return client
+
+    def register(self, service_name, client):
+        """
+        Use an already built client (or a local fake) for a service
+        """
+        with self._lock:
+            self._clients[service_name] = client
+
+    def lazy(self, service_name):
+        return LazyClient(self, service_name)
+
+    def created_clients(self):
+        return sorted(self._clients)
+
+
+class LazyClient:
+    """
+    Stands in for a boto3 client and builds it on the first attribute access
+    """
+
+    def __init__(self, factory, service_name):
+        self._factory = factory
+        self._service_name = service_name
+
+    def __getattr__(self, name):
+        return getattr(self._factory.client(self._service_name), name)
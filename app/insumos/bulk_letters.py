@@ -0,0 +1,212 @@
+"""
+Bulk letter download: many orders' letters streamed as one ZIP.
+
+Letters already kept in object storage (or in the legacy ``Order.letter`` /
+``Order.letter_response`` columns) are copied as they are. The rest are
+rendered in a process pool, so several PDFs are drawn at the same time without
+holding the GIL of the web worker, and stored like ``order_pdf_letter`` does:
+once the ZIP is sent, in one transaction, and only for orders whose letter was
+not stored nor its signature replaced meanwhile.
+
+At most ``LETTER_ZIP_WORKERS`` letters are in flight: a new render is only
+submitted when one finishes and has been written to the ZIP, so memory is
+bounded by the pool size and not by the number of selected orders. The ZIP is
+written to the response as each letter completes (PDFs are already
+compressed, so entries are stored, not deflated).
+"""
+import atexit
+import multiprocessing
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.orm import load_only
+
+from insumos.extensions import db, storage
+from insumos.models import Order
+
+# Stored letter column: the signature column its letter is drawn with
+SIGNATURE_KEY_COLUMNS = {
+    'letter_key': 'letter_signature_key',
+    'letter_response_key': 'letter_response_signature_key',
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_worker_app = None
+
+
+def _init_worker():
+    # Only the templates of the xhtml2pdf renderer need an app: no settings, database or extensions
+    global _worker_app
+    from flask import Flask
+    from insumos import APP_ROOT
+    _worker_app = Flask('insumos', root_path=APP_ROOT)
+
+
+def _render_in_worker(renderer_name, response_letter, context):
+    from insumos.letter_renderers import render_letter_with
+    with _worker_app.app_context():
+        return render_letter_with(renderer_name, response_letter, context)
+
+
+def get_pool(app):
+    """
+    One pool per web worker process, started on the first bulk download and shut down at exit
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a (possibly threaded) web worker could copy held locks into the children
+            _pool = ProcessPoolExecutor(
+                max_workers=app.config['LETTER_ZIP_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker)
+            atexit.register(_pool.shutdown, cancel_futures=True)
+        return _pool
+
+
+def store_letter(order_id, pdf):
+    return storage.put(f'letters/{order_id}/{uuid.uuid4().hex}.pdf', pdf, 'application/pdf')
+
+
+def reference_letter(model, order_id, key_column, signature_key, letter_key):
+    """
+    Point the order (``Order`` or ``ArchivedOrder``) at a stored letter, unless another request
+    stored one first or the signature the letter was drawn with (``signature_key``, None for a
+    legacy or missing signature) was replaced meanwhile: ``save_signature`` clears the key of the
+    letter drawn without it. The object of a letter that lost is deleted. Returns whether it won;
+    the caller commits.
+    """
+    signature_column = getattr(model, SIGNATURE_KEY_COLUMNS[key_column])
+    updated = (db.session.query(model)
+               .filter(model.id == order_id,
+                       getattr(model, key_column).is_(None),
+                       signature_column == signature_key if signature_key else signature_column.is_(None))
+               .update({key_column: letter_key}, synchronize_session=False))
+    if not updated:
+        storage.delete(letter_key)
+    return bool(updated)
+
+
+class _ZipStream:
+    """
+    Write-only file object for ``zipfile``: written bytes are buffered until ``drain``. Having no
+    ``tell``/``seek`` makes ``zipfile`` write data descriptors instead of seeking back.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_entry(zip_file, name, data):
+    info = zipfile.ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    zip_file.writestr(info, data)
+
+
+def stream_letters_zip(order_ids, letter_types, letter_context, file_name):
+    """
+    Generator of the ZIP bytes. ``letter_types`` holds (key column, legacy column, response letter);
+    ``letter_context(order, response_letter)`` builds the renderer context.
+    """
+    app = current_app._get_current_object()
+    max_in_flight = app.config['LETTER_ZIP_WORKERS']
+    output = _ZipStream()
+    errors = []
+    rendered = []  # (order id, key column, signature key, letter key), referenced once the ZIP is sent
+    pending = {}
+
+    try:
+        with zipfile.ZipFile(output, 'w') as zip_file:
+            for order_id in order_ids:
+                order = (Order.query
+                         .options(load_only(Order.id, Order.letter_key, Order.letter_response_key,
+                                            Order.letter_signature_key, Order.letter_response_signature_key,
+                                            Order.letter_signature, Order.letter_response_signature,
+                                            Order.user_email, Order.data, Order.doctor_name,
+                                            Order.doctor_position, Order.delivery_institute))
+                         .filter(Order.id == order_id).first())
+                if order is None:
+                    errors.append(f"Pedido {order_id}: no encontrado")
+                    continue
+                for key_column, legacy_column, response_letter in letter_types:
+                    name = file_name(order.id, response_letter)
+                    stored = _stored_letter(order, key_column, legacy_column)
+                    if stored is not None:
+                        _zip_entry(zip_file, name, stored)
+                        yield output.drain()
+                        continue
+                    while len(pending) >= max_in_flight:
+                        yield from _write_completed(zip_file, output, pending, errors, rendered)
+                    future = get_pool(app).submit(_render_in_worker, app.config['LETTER_RENDERER'],
+                                                  response_letter, letter_context(order, response_letter))
+                    pending[future] = (order.id, key_column, getattr(order, SIGNATURE_KEY_COLUMNS[key_column]),
+                                       name)
+            while pending:
+                yield from _write_completed(zip_file, output, pending, errors, rendered)
+
+            if errors:
+                _zip_entry(zip_file, 'errores.txt', '\n'.join(errors).encode('utf-8'))
+        yield output.drain()
+    finally:
+        # Also when the client went away mid-stream: nothing more is rendered, and the letters
+        # already stored are kept (as order_pdf_letter does) in one transaction
+        for future in pending:
+            future.cancel()
+        _reference_rendered(rendered)
+
+
+def _reference_rendered(rendered):
+    if not rendered:
+        return
+    try:
+        for order_id, key_column, signature_key, letter_key in rendered:
+            reference_letter(Order, order_id, key_column, signature_key, letter_key)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Could not keep the letters rendered for the ZIP")
+        for _, _, _, letter_key in rendered:
+            storage.delete(letter_key)
+
+
+def _stored_letter(order, key_column, legacy_column):
+    key = getattr(order, key_column)
+    if key:
+        return storage.get(key)
+    # Deferred column: only loaded for orders without a stored key
+    return getattr(order, legacy_column) or None
+
+
+def _write_completed(zip_file, output, pending, errors, rendered):
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        order_id, key_column, signature_key, name = pending.pop(future)
+        try:
+            pdf = future.result()
+        except Exception:
+            pdf = None
+            current_app.logger.exception("Letter rendering failed for order %s", order_id)
+        if pdf is None:
+            errors.append(f"Pedido {order_id}: error al generar {name}")
+            continue
+        _zip_entry(zip_file, name, pdf)
+        yield output.drain()
+        # Kept so the next download is a copy; referenced from the order after the last letter
+        rendered.append((order_id, key_column, signature_key, store_letter(order_id, pdf)))
@@ -0,0 +1,379 @@
+"""
+Cache for lookup data and rendered fragments, shared by the gunicorn workers.
+
+Backends (``CACHE_BACKEND``):
+
+* ``sqlite`` (default): one SQLite file (``CACHE_SQLITE_PATH``) in WAL mode,
+  shared by every worker of the host.
+* ``redis``: any server speaking the Redis protocol (``CACHE_REDIS_URL``),
+  shared by every host. Needs the ``redis`` package.
+* ``memory``: an LRU in the worker process, for a single process, tests and
+  the benchmarks. Other workers do not see its invalidations.
+* ``off``: every lookup misses.
+
+Entries live in namespaces (``cache.namespace('vendors', invalidated_by=(Vendor,))``,
+with ``cache`` from insumos/extensions.py).
+Each namespace has a version token stored in the backend and part of every
+key, so invalidating a namespace is one write: the old entries are never read
+again and expire on their own. A commit that wrote any of the namespace's
+models (through the ORM or a DML statement on their tables) invalidates it
+once the transaction commits, wherever the write happened.
+
+``get_many``/``set_many`` take one round trip for any number of keys. Hits
+and misses per namespace are exported in ``/metrics``. A backend error is
+logged and treated as a miss, so a cache outage only costs the database
+queries it was saving.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from sqlalchemy import event
+
+from insumos.instrumentation import Counter, metrics
+
+logger = logging.getLogger("insumos.cache")
+
+serializer = TaggedJSONSerializer()
+
+CACHE_REQUESTS = metrics.register(Counter(
+    "insumos_cache_requests_total", "Cache lookups by namespace and result (hit, miss)", ("namespace", "result")))
+CACHE_INVALIDATIONS = metrics.register(Counter(
+    "insumos_cache_invalidations_total", "Cache namespace invalidations", ("namespace",)))
+CACHE_ERRORS = metrics.register(Counter(
+    "insumos_cache_errors_total", "Cache backend errors, served as misses", ("backend",)))
+
+
+class MemoryCacheBackend:
+    name = 'memory'
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at or None)
+
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] is not None and entry[1] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[0]
+        return found
+
+    def set_many(self, mapping, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            for key, value in mapping.items():
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value):
+        """
+        Set ``key`` (without expiry) unless it is there; returns its value
+        """
+        with self._lock:
+            entry = self._entries.setdefault(key, (value, None))
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+
+class SQLiteCacheBackend:
+    """
+    SQLite file shared by the processes of one host; one connection per thread (and process)
+    """
+    name = 'sqlite'
+
+    # Expired entries are purged (and the size capped) every this many writes
+    PURGE_EVERY = 256
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # A connection must not cross a fork (gunicorn --preload)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS cache "
+                               "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ','.join('?' * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders}) "
+            f"AND (expires_at IS NULL OR expires_at > ?)", (*keys, time.time()))
+        return {key: value for key, value in rows}
+
+    def set_many(self, mapping, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        connection = self._connection()
+        connection.executemany("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                               [(key, value, expires_at) for key, value in mapping.items()])
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge(connection)
+
+    def _purge(self, connection):
+        connection.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        # Over the cap: drop the entries closest to expiring (version tokens never expire)
+        connection.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE expires_at IS NOT NULL "
+            "ORDER BY expires_at LIMIT max(0, (SELECT count(*) FROM cache) - ?))", (self.max_entries,))
+
+    def add(self, key, value):
+        connection = self._connection()
+        # Read first: the key is almost always there, and a read takes no write lock
+        row = connection.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            connection.execute("INSERT OR IGNORE INTO cache (key, value, expires_at) VALUES (?, ?, NULL)",
+                               (key, value))
+            row = connection.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return row[0]
+
+    def delete_many(self, keys):
+        self._connection().executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+
+
+class RedisCacheBackend:
+    """
+    :param client: a ``redis.Redis`` (or anything with the same ``mget``/``set``/``pipeline``/
+                   ``delete`` methods); built from ``url`` when not given
+    """
+    name = 'redis'
+
+    def __init__(self, url=None, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.client = client
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        return {key: value for key, value in zip(keys, self.client.mget(keys)) if value is not None}
+
+    def set_many(self, mapping, ttl=None):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipeline.set(key, value, px=int(ttl * 1000) if ttl else None)
+        pipeline.execute()
+
+    def add(self, key, value):
+        current = self.client.get(key)
+        if current is not None:
+            return current
+        if self.client.set(key, value, nx=True):
+            return value
+        return self.client.get(key) or value
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if keys:
+            self.client.delete(*keys)
+
+
+class NullCacheBackend:
+    name = 'off'
+
+    def get_many(self, keys):
+        return {}
+
+    def set_many(self, mapping, ttl=None):
+        pass
+
+    def add(self, key, value):
+        return value
+
+    def delete_many(self, keys):
+        pass
+
+
+def create_backend(app):
+    config = app.config
+    backend = config['CACHE_BACKEND']
+    if backend == 'sqlite':
+        return SQLiteCacheBackend(config['CACHE_SQLITE_PATH'], config['CACHE_MAX_ENTRIES'])
+    if backend == 'redis':
+        return RedisCacheBackend(config['CACHE_REDIS_URL'])
+    if backend == 'memory':
+        return MemoryCacheBackend(config['CACHE_MAX_ENTRIES'])
+    if backend == 'off':
+        return NullCacheBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+
+_MISSING = object()
+
+
+class CacheNamespace:
+    def __init__(self, cache, name, ttl=None):
+        self.cache = cache
+        self.name = name
+        self.ttl = ttl
+
+    def _version(self):
+        key = f"{self.cache.key_prefix}:{self.name}:version"
+        version = self.cache.call('add', key, uuid.uuid4().hex[:12].encode())
+        return version.decode() if isinstance(version, bytes) else version
+
+    def _prefix(self):
+        return f"{self.cache.key_prefix}:{self.name}:{self._version()}:"
+
+    def get_many(self, keys, prefix=None):
+        """
+        ``{key: value}`` of the keys found
+
+        :param prefix: read under this ``_prefix()`` instead of the current version's
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        prefix = prefix or self._prefix()
+        found = self.cache.call('get_many', [prefix + str(key) for key in keys]) or {}
+        values = {}
+        for key in keys:
+            raw = found.get(prefix + str(key))
+            if raw is not None:
+                values[key] = serializer.loads(raw.decode() if isinstance(raw, bytes) else raw)
+        hits = len(values)
+        if hits:
+            CACHE_REQUESTS.inc((self.name, 'hit'), hits)
+        if hits < len(keys):
+            CACHE_REQUESTS.inc((self.name, 'miss'), len(keys) - hits)
+        return values
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, mapping, ttl=None, prefix=None):
+        """
+        :param prefix: write under this ``_prefix()`` instead of the current version's
+        """
+        if not mapping:
+            return
+        prefix = prefix or self._prefix()
+        self.cache.call('set_many', {prefix + str(key): serializer.dumps(value).encode()
+                                     for key, value in mapping.items()},
+                        ttl or self.ttl or self.cache.default_ttl)
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def get_or_set(self, key, create, ttl=None):
+        """
+        The cached value, or ``create()`` stored for next time
+        """
+        # Stored under the version read before create(): if the namespace is invalidated while it
+        # runs, the value (maybe computed from the old rows) lands under the orphaned token
+        prefix = self._prefix()
+        value = self.get_many([key], prefix).get(key, _MISSING)
+        if value is _MISSING:
+            value = create()
+            self.set_many({key: value}, ttl, prefix)
+        return value
+
+    def invalidate(self):
+        # A new token: entries under the old one are orphaned and expire on their own
+        self.cache.call('set_many', {f"{self.cache.key_prefix}:{self.name}:version": uuid.uuid4().hex[:12].encode()})
+        CACHE_INVALIDATIONS.inc((self.name,))
+
+
+class Cache:
+    def __init__(self):
+        self.backend = NullCacheBackend()
+        self.key_prefix = 'insumos'
+        self.default_ttl = 300
+        self._namespaces = {}
+        self._invalidated_by = {}  # table name -> namespace names
+
+    def init_app(self, app):
+        self.use(create_backend(app))
+        self.key_prefix = app.config['CACHE_KEY_PREFIX']
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        from insumos.extensions import db
+        if not event.contains(db.session, 'after_flush', self._collect_flushed):
+            event.listen(db.session, 'after_flush', self._collect_flushed)
+            event.listen(db.session, 'do_orm_execute', self._collect_executed)
+            event.listen(db.session, 'after_commit', self._invalidate_committed)
+            event.listen(db.session, 'after_soft_rollback', self._forget_writes)
+
+    def use(self, backend):
+        """
+        Replace the backend (e.g. a ``MemoryCacheBackend`` in tests)
+        """
+        self.backend = backend
+
+    def namespace(self, name, ttl=None, invalidated_by=()):
+        """
+        :param invalidated_by: models whose writes invalidate the namespace on commit
+        """
+        namespace = self._namespaces.setdefault(name, CacheNamespace(self, name, ttl))
+        for model in invalidated_by:
+            self._invalidated_by.setdefault(model.__table__.name, set()).add(name)
+        return namespace
+
+    def call(self, method, *args):
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            CACHE_ERRORS.inc((self.backend.name,))
+            logger.warning("Cache %s.%s failed: %r", self.backend.name, method, e)
+            return args[1] if method == 'add' else None
+
+    def _invalidate_on_commit(self, session, table_names):
+        pending = session.info.setdefault('cache_invalidate', set())
+        for table_name in table_names:
+            pending |= self._invalidated_by.get(table_name, set())
+
+    def _collect_flushed(self, session, flush_context):
+        self._invalidate_on_commit(session, {instance.__table__.name for instance in
+                                             (*session.new, *session.dirty, *session.deleted)})
+
+    def _collect_executed(self, orm_execute_state):
+        # Bulk and DML statements (stock reservations, batch edits) skip the flush
+        if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+            table = getattr(orm_execute_state.statement, 'table', None)
+            if table is not None:
+                self._invalidate_on_commit(orm_execute_state.session, [table.name])
+
+    def _invalidate_committed(self, session):
+        for name in session.info.pop('cache_invalidate', ()):
+            self.namespace(name).invalidate()
+
+    def _forget_writes(self, session, previous_transaction):
+        # Only when the whole transaction is gone: a rolled back savepoint (e.g. a lost race in
+        # order_summary._insert_computed) leaves the writes made before it pending
+        if previous_transaction.parent is None:
+            session.info.pop('cache_invalidate', None)
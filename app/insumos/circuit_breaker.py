@@ -0,0 +1,190 @@
+"""
+Circuit breaker for calls to an external service.
+
+The breaker keeps the outcome of the calls of the last ``window_seconds``.
+Once there are at least ``min_calls`` of them and the share of failed calls
+reaches ``failure_rate`` (or the share of calls slower than
+``slow_call_seconds`` reaches ``slow_call_rate``) it opens: for
+``open_seconds`` every call is rejected at once with ``CircuitOpenError``
+instead of waiting on a service that is down. It then lets
+``half_open_calls`` probe calls through; if they all succeed in time it
+closes again, otherwise it stays open for another period.
+
+State lives in the process, so each gunicorn worker trips on its own. The
+state, the current failure and slow call rates, the transitions and the
+rejected calls are exported in ``/metrics``.
+"""
+import threading
+import time
+from collections import deque
+
+from insumos.instrumentation import Counter, metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Gauge value of each state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_TRANSITIONS = metrics.register(Counter(
+    "insumos_circuit_breaker_transitions_total", "Circuit breaker state changes", ("breaker", "state")))
+BREAKER_REJECTED = metrics.register(Counter(
+    "insumos_circuit_breaker_rejected_total", "Calls rejected while the circuit was open", ("breaker",)))
+
+_breakers = []
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class _Call:
+    """
+    Returned by ``before_call``: the breaker generation (bumped on every transition) the call was
+    admitted in, and whether it is a half-open probe
+    """
+    __slots__ = ('generation', 'probe')
+
+    def __init__(self, generation, probe):
+        self.generation = generation
+        self.probe = probe
+
+
+class CircuitBreaker:
+    def __init__(self, name, window_seconds=30.0, min_calls=10, failure_rate=0.5, slow_call_seconds=2.0,
+                 slow_call_rate=0.5, open_seconds=15.0, half_open_calls=2, clock=time.monotonic):
+        self.name = name
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._generation = 0
+        self.configure(window_seconds, min_calls, failure_rate, slow_call_seconds, slow_call_rate, open_seconds,
+                       half_open_calls)
+        _breakers.append(self)
+
+    def configure(self, window_seconds=30.0, min_calls=10, failure_rate=0.5, slow_call_seconds=2.0,
+                  slow_call_rate=0.5, open_seconds=15.0, half_open_calls=2):
+        """
+        Replace the thresholds; the breaker starts closed with an empty window
+        """
+        with self._lock:
+            self.window_seconds = window_seconds
+            self.min_calls = min_calls
+            self.failure_rate = failure_rate
+            self.slow_call_seconds = slow_call_seconds
+            self.slow_call_rate = slow_call_rate
+            self.open_seconds = open_seconds
+            self.half_open_calls = half_open_calls
+            self.state = CLOSED
+            self._calls = deque()  # (time, failed, slow)
+            self._opened_at = None
+            self._probes_in_flight = 0
+            self._probes_succeeded = 0
+            self._generation += 1
+
+    def before_call(self):
+        """
+        Raises ``CircuitOpenError`` if the call must not be made; otherwise returns the call, whose
+        outcome the caller must report with ``record`` (or give up with ``discard``)
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if self._clock() - self._opened_at < self.open_seconds:
+                    BREAKER_REJECTED.inc((self.name,))
+                    raise CircuitOpenError(self.name)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_calls:
+                    BREAKER_REJECTED.inc((self.name,))
+                    raise CircuitOpenError(self.name)
+                self._probes_in_flight += 1
+                return _Call(self._generation, probe=True)
+            return _Call(self._generation, probe=False)
+
+    def record(self, call, failed, seconds):
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            if call.generation != self._generation:
+                # Admitted before the last transition (e.g. a call made while closed that ends once
+                # the circuit is half open): it says nothing about the current state
+                return
+            now = self._clock()
+            if call.probe:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed or slow:
+                    self._transition(OPEN)
+                else:
+                    self._probes_succeeded += 1
+                    if self._probes_succeeded >= self.half_open_calls:
+                        self._transition(CLOSED)
+                return
+            self._calls.append((now, failed, slow))
+            self._trim(now)
+            if len(self._calls) >= self.min_calls:
+                failure_rate, slow_rate = self._rates()
+                if failure_rate >= self.failure_rate or slow_rate >= self.slow_call_rate:
+                    self._transition(OPEN)
+
+    def discard(self, call):
+        """
+        The call was not made (e.g. no local slot was free): frees its probe, records no outcome
+        """
+        with self._lock:
+            if call.probe and call.generation == self._generation:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def rates(self):
+        """
+        ``(failure rate, slow call rate)`` of the current window
+        """
+        with self._lock:
+            self._trim(self._clock())
+            return self._rates()
+
+    def _rates(self):
+        if not self._calls:
+            return 0.0, 0.0
+        total = len(self._calls)
+        return (sum(1 for _, failed, _ in self._calls if failed) / total,
+                sum(1 for _, _, slow in self._calls if slow) / total)
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _transition(self, state):
+        self.state = state
+        self._generation += 1
+        self._probes_in_flight = 0
+        self._probes_succeeded = 0
+        if state == OPEN:
+            self._opened_at = self._clock()
+        if state == CLOSED:
+            self._calls.clear()
+        BREAKER_TRANSITIONS.inc((self.name, state))
+
+
+def _collect_breaker_gauges():
+    lines = [
+        "# HELP insumos_circuit_breaker_state Circuit breaker state (0 closed, 1 half open, 2 open)",
+        "# TYPE insumos_circuit_breaker_state gauge",
+    ]
+    lines.extend(f'insumos_circuit_breaker_state{{breaker="{breaker.name}"}} {STATE_VALUES[breaker.state]}'
+                 for breaker in _breakers)
+    lines.extend([
+        "# HELP insumos_circuit_breaker_failure_rate Share of failed calls in the breaker window",
+        "# TYPE insumos_circuit_breaker_failure_rate gauge",
+    ])
+    rates = [(breaker.name, breaker.rates()) for breaker in _breakers]
+    lines.extend(f'insumos_circuit_breaker_failure_rate{{breaker="{name}"}} {failure_rate}'
+                 for name, (failure_rate, _) in rates)
+    lines.extend([
+        "# HELP insumos_circuit_breaker_slow_call_rate Share of slow calls in the breaker window",
+        "# TYPE insumos_circuit_breaker_slow_call_rate gauge",
+    ])
+    lines.extend(f'insumos_circuit_breaker_slow_call_rate{{breaker="{name}"}} {slow_rate}'
+                 for name, (_, slow_rate) in rates)
+    return lines
+
+
+metrics.add_collector(_collect_breaker_gauges)
@@ -0,0 +1,158 @@
+"""
+Cognito access shared by the authentication views.
+
+All calls go through one boto3 client, so its HTTPS connections are pooled and
+reused between requests, with explicit connect/read timeouts. A bounded
+semaphore caps how many workers (or greenlets, under the gevent profile) can be
+waiting on Cognito at the same time: callers that cannot get a slot within
+``acquire_timeout`` seconds fail fast with ``CognitoUnavailableError`` instead
+of piling up behind a slow Cognito while database-backed pages wait.
+
+Each call also has a deadline (``COGNITO_CALL_DEADLINE``): botocore's retries
+stop, and the call fails with ``CognitoUnavailableError``, once it is spent.
+Connection errors, timeouts, throttling and 5xx answers feed the ``cognito``
+circuit breaker (insumos/circuit_breaker.py), as do calls slower than
+``COGNITO_BREAKER_SLOW_CALL_SECONDS``; while it is open every call fails at
+once with the same error, which the views show with their usual templates.
+Answers such as a wrong password or an unknown user are not failures, nor are
+calls that found no free slot (local congestion, not Cognito's).
+"""
+import threading
+import time
+from functools import wraps
+
+from botocore.exceptions import ClientError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+from botocore.exceptions import ReadTimeoutError
+
+from insumos.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+COGNITO_UNAVAILABLE_MESSAGE = ("El servicio de autenticación no está disponible en este momento. "
+                               "Intenta de nuevo en unos minutos.")
+
+
+class CognitoUnavailableError(Exception):
+    def __init__(self, message=COGNITO_UNAVAILABLE_MESSAGE):
+        super().__init__(message)
+
+
+class CognitoDeadlineExceeded(CognitoUnavailableError):
+    pass
+
+
+# Error codes meaning Cognito (not the request) is in trouble
+_UNAVAILABLE_ERROR_CODES = frozenset({
+    'InternalErrorException', 'TooManyRequestsException', 'ThrottlingException', 'ServiceUnavailable'})
+
+
+def _is_unavailable(error):
+    if isinstance(error, ClientError):
+        response = error.response
+        return (response.get('Error', {}).get('Code') in _UNAVAILABLE_ERROR_CODES
+                or response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500)
+    return False
+
+
+class CognitoGateway:
+    """
+    Drop-in proxy for a ``cognito-idp`` boto3 client: ``gateway.sign_up(...)``
+    and ``gateway.exceptions.X`` behave like the wrapped client.
+    """
+
+    def __init__(self, client, max_concurrency=10, acquire_timeout=2.0, call_deadline=6.0):
+        self._client = client
+        self._deadline = threading.local()
+        self._hooked_events = None
+        self.breaker = CircuitBreaker('cognito')
+        self.configure(max_concurrency, acquire_timeout, call_deadline)
+
+    def init_app(self, app):
+        config = app.config
+        self.configure(config['COGNITO_MAX_CONCURRENCY'], config['COGNITO_QUEUE_TIMEOUT'],
+                       config['COGNITO_CALL_DEADLINE'])
+        self.breaker.configure(
+            window_seconds=config['COGNITO_BREAKER_WINDOW'],
+            min_calls=config['COGNITO_BREAKER_MIN_CALLS'],
+            failure_rate=config['COGNITO_BREAKER_FAILURE_RATE'],
+            slow_call_seconds=config['COGNITO_BREAKER_SLOW_CALL_SECONDS'],
+            slow_call_rate=config['COGNITO_BREAKER_SLOW_CALL_RATE'],
+            open_seconds=config['COGNITO_BREAKER_OPEN_SECONDS'],
+            half_open_calls=config['COGNITO_BREAKER_HALF_OPEN_CALLS'])
+
+    def configure(self, max_concurrency, acquire_timeout, call_deadline=6.0):
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.acquire_timeout = acquire_timeout
+        self.call_deadline = call_deadline
+
+    @property
+    def exceptions(self):
+        return self._client.exceptions
+
+    @property
+    def meta(self):
+        return self._client.meta
+
+    def __getattr__(self, name):
+        operation = getattr(self._client, name)
+        if not callable(operation) or not self._is_api_operation(name):
+            # Local helpers (get_paginator, can_paginate, close) take no slot and do not feed the breaker
+            return operation
+
+        @wraps(operation)
+        def call(*args, **kwargs):
+            try:
+                breaker_call = self.breaker.before_call()
+            except CircuitOpenError as e:
+                raise CognitoUnavailableError() from e
+            start = time.monotonic()
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                # Local congestion, not a Cognito failure: it must not open the breaker
+                self.breaker.discard(breaker_call)
+                raise CognitoUnavailableError()
+            failed = False
+            try:
+                # Inside the try: building the lazy client can fail, and the slot must be released
+                self._hook_deadline()
+                self._deadline.at = start + self.call_deadline
+                return operation(*args, **kwargs)
+            except CognitoUnavailableError:
+                failed = True
+                raise
+            except (BotocoreConnectionError, ReadTimeoutError) as e:
+                failed = True
+                raise CognitoUnavailableError() from e
+            except Exception as e:
+                if _is_unavailable(e):
+                    failed = True
+                    raise CognitoUnavailableError() from e
+                raise
+            finally:
+                self._deadline.at = None
+                self._slots.release()
+                self.breaker.record(breaker_call, failed, time.monotonic() - start)
+
+        return call
+
+    def _is_api_operation(self, name):
+        # Local fakes have no operation mapping: all their methods stand for API calls
+        mapping = getattr(getattr(self._client, 'meta', None), 'method_to_api_mapping', None)
+        return mapping is None or name in mapping
+
+    def _hook_deadline(self):
+        # Registered on the client actually in use, which is built lazily (or is a local fake, without hooks)
+        meta = getattr(self._client, 'meta', None)
+        events = getattr(meta, 'events', None)
+        if events is None or events is self._hooked_events:
+            return
+        events.register('before-send', self._check_deadline, unique_id='insumos-cognito-deadline')
+        self._hooked_events = events
+
+    def _check_deadline(self, **kwargs):
+        """
+        botocore ``before-send`` hook: runs before every attempt, so retries stop once the deadline
+        is spent
+        """
+        deadline = getattr(self._deadline, 'at', None)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise CognitoDeadlineExceeded()
@@ -0,0 +1,166 @@
+"""
+Application settings.
+
+Nothing is read at import time: ``load_config`` reads the environment when
+``create_app`` runs, so the package can be imported (by tests, gunicorn
+--preload or scripts) without the AWS/RDS variables being set.
+"""
+import os
+import tempfile
+from datetime import timedelta
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+def _streaming_workers():
+    # Same variable as gunicorn.conf.py: only these workers serve other requests while a stream is open
+    return os.getenv("gunicorn_worker_class", "sync") in ('gthread', 'gevent')
+
+
+def database_uri():
+    """
+    database_url overrides the RDS connection (e.g. a local SQLite/Postgres for the benchmarks)
+    """
+    if os.getenv("database_url"):
+        return os.getenv("database_url")
+    db_host = (os.getenv("db_endpoint") or "localhost").split(":")[0]
+    db_name = "insumos_db"
+    db_user = "insumos_user"
+    db_password = os.getenv("db_password")
+    return f'postgresql+psycopg2://{db_user}:{db_password}@{db_host}:5432/{db_name}'
+
+
+def load_config():
+    cognito_max_concurrency = int(os.getenv("cognito_max_concurrency", 10))
+    return {
+        'SECRET_KEY': os.getenv("secret_key", 'xaldigitalcfobayer!'),
+        'SQLALCHEMY_DATABASE_URI': database_uri(),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+
+        # Worker warm-up (see insumos/warmup.py) and the on-disk cache of compiled templates
+        'WARMUP_ENABLED': _env_bool("warmup_enabled", True),
+        'WARMUP_DB_CONNECTIONS': int(os.getenv("warmup_db_connections", 2)),
+        'JINJA_BYTECODE_CACHE': _env_bool("jinja_bytecode_cache", True),
+        'JINJA_BYTECODE_CACHE_DIR': os.getenv("jinja_bytecode_cache_dir",
+                                              os.path.join(tempfile.gettempdir(), 'insumos_jinja')),
+
+        # Delivered/cancelled orders not updated for this many days are moved to orders_archive
+        'ORDER_RETENTION_DAYS': int(os.getenv("order_retention_days", 180)),
+
+        # Order notifications (see insumos/outbox.py): lambda or log, and how the dispatcher retries
+        'OUTBOX_SINK': os.getenv("outbox_sink", 'lambda' if os.getenv("outbox_lambda_function") else 'log'),
+        'OUTBOX_LAMBDA_FUNCTION': os.getenv("outbox_lambda_function"),
+        'OUTBOX_DISPATCHER_THREAD': _env_bool("outbox_dispatcher_thread", True),
+        'OUTBOX_BATCH_SIZE': int(os.getenv("outbox_batch_size", 25)),
+        'OUTBOX_MAX_ATTEMPTS': int(os.getenv("outbox_max_attempts", 8)),
+        'OUTBOX_BACKOFF_MAX': float(os.getenv("outbox_backoff_max", 600)),
+        'OUTBOX_POLL_INTERVAL': float(os.getenv("outbox_poll_interval", 2)),
+
+        # Status changes pushed to the order tables (see insumos/order_events.py): postgres, memory or off.
+        # Each open stream holds a worker thread, so unset means off with sync gunicorn workers and, with
+        # gthread/gevent, postgres on a PostgreSQL database and memory otherwise
+        'ORDER_EVENTS_BACKEND': os.getenv("order_events_backend") or (None if _streaming_workers() else 'off'),
+        'ORDER_EVENTS_STREAM_SECONDS': float(os.getenv("order_events_stream_seconds", 300)),
+        'ORDER_EVENTS_KEEPALIVE': float(os.getenv("order_events_keepalive", 15)),
+        'ORDER_EVENTS_RETRY_MS': int(os.getenv("order_events_retry_ms", 3000)),
+
+        # sql, file, memory or cookie (see insumos/sessions.py)
+        'SESSION_BACKEND': os.getenv("session_backend", 'sql'),
+        'SESSION_FILE_DIR': os.getenv("session_file_dir", os.path.join(tempfile.gettempdir(), 'insumos_sessions')),
+        'PERMANENT_SESSION_LIFETIME': timedelta(hours=float(os.getenv("session_lifetime_hours", 12))),
+
+        # sqlite, redis, memory or off (see insumos/cache.py); seconds entries live by default
+        'CACHE_BACKEND': os.getenv("cache_backend", 'redis' if os.getenv("cache_redis_url") else 'sqlite'),
+        'CACHE_SQLITE_PATH': os.getenv("cache_sqlite_path", os.path.join(tempfile.gettempdir(), 'insumos_cache.db')),
+        'CACHE_REDIS_URL': os.getenv("cache_redis_url"),
+        'CACHE_DEFAULT_TTL': float(os.getenv("cache_default_ttl", 300)),
+        'CACHE_MAX_ENTRIES': int(os.getenv("cache_max_entries", 10000)),
+        'CACHE_KEY_PREFIX': os.getenv("cache_key_prefix", 'insumos'),
+
+        # Admission control (see insumos/admission.py): host (slots shared by the workers), process or off;
+        # slots per class of endpoint, seconds a request waits for one, requests of a class waiting
+        # per worker, and the Retry-After (seconds) of the 503 sent beyond that
+        'ADMISSION_BACKEND': os.getenv("admission_backend", 'host'),
+        'ADMISSION_LOCK_DIR': os.getenv("admission_lock_dir", os.path.join(tempfile.gettempdir(), 'insumos_admission')),
+        'ADMISSION_LIMITS': {
+            'pdf': int(os.getenv("admission_pdf_limit", 2)),
+            'search': int(os.getenv("admission_search_limit", 4)),
+            'auth': int(os.getenv("admission_auth_limit", 8)),
+            'writes': int(os.getenv("admission_writes_limit", 4)),
+            'streams': int(os.getenv("admission_streams_limit", 4)),
+        },
+        'ADMISSION_QUEUE_TIMEOUT': float(os.getenv("admission_queue_timeout", 0.5)),
+        'ADMISSION_MAX_QUEUE': int(os.getenv("admission_max_queue", 8)),
+        'ADMISSION_RETRY_AFTER': int(os.getenv("admission_retry_after", 5)),
+
+        # Statements slower than this (milliseconds) are logged with the count and types of their
+        # parameters; the values themselves only with SLOW_QUERY_LOG_PARAMETERS
+        'SLOW_QUERY_THRESHOLD_MS': float(os.getenv("slow_query_ms", 200)),
+        'SLOW_QUERY_LOG_PARAMETERS': _env_bool("slow_query_log_parameters", False),
+        'METRICS_ENABLED': _env_bool("metrics_enabled", True),
+        # /metrics answers requests with "Authorization: Bearer <METRICS_TOKEN>" or from these
+        # addresses/networks (comma separated)
+        'METRICS_TOKEN': os.getenv("metrics_token"),
+        'METRICS_ALLOWED_IPS': [address.strip() for address in
+                                os.getenv("metrics_allowed_ips", "127.0.0.1,::1").split(",") if address.strip()],
+
+        'AWS_REGION': os.getenv("region_aws", 'us-east-1'),
+        'AWS_ACCESS_KEY_ID': os.getenv("accessKeyId"),
+        'AWS_SECRET_ACCESS_KEY': os.getenv("secretAccessKey"),
+        'S3_BUCKET_NAME': os.getenv("bucket_name"),
+        # s3 or local (see insumos/storage.py) and seconds a download URL stays valid. The local
+        # directory holds the only copy of letters and signatures: <instance folder>/storage if unset
+        'STORAGE_BACKEND': os.getenv("storage_backend", 's3' if os.getenv("bucket_name") else 'local'),
+        'STORAGE_LOCAL_DIR': os.getenv("storage_local_dir"),
+        'STORAGE_URL_EXPIRES': int(os.getenv("storage_url_expires", 300)),
+        # reportlab or xhtml2pdf (see insumos/letter_renderers.py)
+        'LETTER_RENDERER': os.getenv("letter_renderer", 'reportlab'),
+        # Processes rendering letters for the bulk ZIP download, also the number of letters in flight
+        'LETTER_ZIP_WORKERS': int(os.getenv("letter_zip_workers", min(4, os.cpu_count() or 1))),
+        # Seconds browsers may reuse a signature image before revalidating it with its ETag
+        'SIGNATURE_CACHE_MAX_AGE': int(os.getenv("signature_cache_max_age", 3600)),
+        # JSON API (insumos/api.py): rows per page by default and at most
+        'API_PAGE_SIZE': int(os.getenv("api_page_size", 100)),
+        'API_MAX_PAGE_SIZE': int(os.getenv("api_max_page_size", 1000)),
+        'COGNITO_CLIENT_ID': os.getenv("client_id"),
+        'COGNITO_USER_POOL_ID': os.getenv("user_pool"),
+
+        # boto3 clients: pool size, seconds to connect/read and retry policy
+        'AWS_MAX_POOL_CONNECTIONS': int(os.getenv("aws_max_pool_connections", 10)),
+        'AWS_CONNECT_TIMEOUT': float(os.getenv("aws_connect_timeout", 2)),
+        'AWS_READ_TIMEOUT': float(os.getenv("aws_read_timeout", 10)),
+        'AWS_RETRY_MODE': os.getenv("aws_retry_mode", 'adaptive'),
+        'AWS_MAX_ATTEMPTS': int(os.getenv("aws_max_attempts", 3)),
+        'AWS_ENDPOINT_URLS': {
+            service: os.getenv(f"{prefix}_endpoint_url")
+            for service, prefix in (('cognito-idp', 'cognito'), ('lambda', 'lambda'), ('s3', 's3'))
+            if os.getenv(f"{prefix}_endpoint_url")
+        },
+        # Cognito limits: seconds to open/read the HTTPS connection, concurrent calls per worker and
+        # seconds a request waits for a free slot before failing fast
+        'COGNITO_MAX_CONCURRENCY': cognito_max_concurrency,
+        'COGNITO_QUEUE_TIMEOUT': float(os.getenv("cognito_queue_timeout", 2)),
+        # Seconds a Cognito call may take, retries included
+        'COGNITO_CALL_DEADLINE': float(os.getenv("cognito_call_deadline", 6)),
+        # Circuit breaker (insumos/circuit_breaker.py): opens when, over the last WINDOW seconds and
+        # at least MIN_CALLS calls, the share of failed calls reaches FAILURE_RATE or the share of
+        # calls slower than SLOW_CALL_SECONDS reaches SLOW_CALL_RATE; rejects calls for OPEN_SECONDS
+        # and then lets HALF_OPEN_CALLS probes through
+        'COGNITO_BREAKER_WINDOW': float(os.getenv("cognito_breaker_window", 30)),
+        'COGNITO_BREAKER_MIN_CALLS': int(os.getenv("cognito_breaker_min_calls", 10)),
+        'COGNITO_BREAKER_FAILURE_RATE': float(os.getenv("cognito_breaker_failure_rate", 0.5)),
+        'COGNITO_BREAKER_SLOW_CALL_SECONDS': float(os.getenv("cognito_breaker_slow_call_seconds", 3)),
+        'COGNITO_BREAKER_SLOW_CALL_RATE': float(os.getenv("cognito_breaker_slow_call_rate", 0.8)),
+        'COGNITO_BREAKER_OPEN_SECONDS': float(os.getenv("cognito_breaker_open_seconds", 15)),
+        'COGNITO_BREAKER_HALF_OPEN_CALLS': int(os.getenv("cognito_breaker_half_open_calls", 2)),
+        'AWS_SERVICE_CONFIG': {
+            'cognito-idp': {
+                'connect_timeout': float(os.getenv("cognito_connect_timeout", 2)),
+                'read_timeout': float(os.getenv("cognito_read_timeout", 5)),
+                'max_pool_connections': cognito_max_concurrency,
+                'retries': {'mode': 'standard', 'max_attempts': 2},
+            },
+        },
+    }
@@ -0,0 +1,23 @@
+"""
+Extension singletons, bound to an app by ``create_app`` through ``init_app``.
+"""
+from flask_sqlalchemy import SQLAlchemy
+
+from insumos.aws_clients import AWSClientFactory
+from insumos.cache import Cache
+from insumos.cognito import CognitoGateway
+from insumos.storage import ObjectStorage
+
+db = SQLAlchemy()
+
+# boto3 clients: created lazily on first use from one shared session
+aws_clients = AWSClientFactory()
+cognito_client = CognitoGateway(aws_clients.lazy('cognito-idp'))
+lambda_client = aws_clients.lazy('lambda')
+s3_client = aws_clients.lazy('s3')
+
+# Letters and signature images (see insumos/storage.py)
+storage = ObjectStorage(s3_client)
+
+# Lookup data and rendered fragments shared by the workers (see insumos/cache.py)
+cache = Cache()
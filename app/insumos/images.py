@@ -0,0 +1,146 @@
+"""
+Signature image delivery helpers.
+
+The real content type is sniffed from the image bytes and stored with a
+SHA-256 of the content. Size variants are generated with Pillow on their
+first request and kept in object storage under that hash, so a replaced
+image never serves a stale variant. Recently served variants are also kept in
+a small per-process LRU, so repeated views do not reach the storage backend.
+
+Signatures from before object storage are still read from the
+``signature_image`` column; ``flask move-signatures`` copies them to storage
+and only then clears the column.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import click
+from sqlalchemy.orm import undefer
+
+from insumos.extensions import db, storage
+from insumos.models import Signature
+
+# Bounding box (width, height) of each variant; 'full' is the original image
+SIGNATURE_SIZES = {
+    'thumb': (160, 80),
+    'small': (400, 200),
+    'full': None,
+}
+
+_MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'RIFF', 'image/webp'),
+)
+
+
+def sniff_content_type(data):
+    for magic, content_type in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            if content_type == 'image/webp' and data[8:12] != b'WEBP':
+                continue
+            return content_type
+    return 'application/octet-stream'
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def variant_key(image_hash, size):
+    return f'signatures/variants/{image_hash}/{size}.png'
+
+
+def make_variant(data, size):
+    """
+    Downscale to fit the size's bounding box, keeping the aspect ratio; returns PNG bytes
+    """
+    from PIL import Image
+    with Image.open(BytesIO(data)) as image:
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        image.thumbnail(SIGNATURE_SIZES[size])
+        output = BytesIO()
+        image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+class VariantCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+variant_cache = VariantCache()
+
+
+def signature_original(signature_key, legacy_image):
+    """
+    Bytes of the original image: from object storage, or from the legacy column when not moved yet
+    """
+    if signature_key:
+        return storage.get(signature_key)
+    return legacy_image
+
+
+def record_signature_image(signature):
+    """
+    Set the real content type and hash of a signature; the image itself stays where it is
+    """
+    data = signature_original(signature.signature_key, signature.signature_image)
+    signature.content_type = sniff_content_type(data)
+    signature.content_hash = content_hash(data)
+    return data
+
+
+def move_legacy_signatures(batch_size=100):
+    """
+    Copy the images still kept in ``signature_image`` to object storage, read each copy back and
+    only then clear the column; one transaction per batch. Returns the number of signatures moved.
+    """
+    moved = 0
+    while True:
+        signatures = (Signature.query.options(undefer(Signature.signature_image))
+                      .filter(Signature.signature_key.is_(None), Signature.signature_image.isnot(None))
+                      .order_by(Signature.id).limit(batch_size).all())
+        if not signatures:
+            return moved
+        for signature in signatures:
+            data = record_signature_image(signature)
+            key = storage.put(f'signatures/{signature.id}/{signature.content_hash}', data, signature.content_type)
+            if content_hash(storage.get(key)) != signature.content_hash:
+                db.session.rollback()
+                raise RuntimeError(f"Signature {signature.id} was not stored intact under {key}")
+            signature.signature_key = key
+            signature.signature_image = None
+        db.session.commit()
+        moved += len(signatures)
+
+
+def init_app(app):
+    @app.cli.command('move-signatures')
+    @click.option('--batch-size', type=int, default=100, show_default=True,
+                  help='Signatures moved per transaction')
+    def move_signatures_command(batch_size):
+        """Move the signature images still kept in the database to object storage."""
+        moved = move_legacy_signatures(batch_size)
+        click.echo(f"{moved} signatures moved to object storage.")
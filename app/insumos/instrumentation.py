@@ -0,0 +1,366 @@
+"""
+Request profiling for the Insumos app.
+
+Every request is split in phases (SQL, Jinja templates, AWS calls and PDF
+rendering). The timings are returned in a ``Server-Timing`` header, written
+as one structured log line per request and aggregated in Prometheus
+histograms exposed at ``/metrics``, which only answers ``METRICS_ALLOWED_IPS``
+(loopback by default) and requests carrying ``METRICS_TOKEN``.
+"""
+import hmac
+import ipaddress
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import (Response, abort, current_app, g, has_app_context, has_request_context, request,
+                   template_rendered, before_render_template)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("insumos.profiling")
+slow_query_logger = logging.getLogger("insumos.slow_query")
+
+# Seconds, Prometheus default buckets plus a 30s bucket for PDF renders
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PHASE_DB = "db"
+PHASE_TEMPLATE = "tpl"
+PHASE_AWS = "aws"
+PHASE_PDF = "pdf"
+
+
+class Histogram:
+    """
+    Minimal thread-safe Prometheus histogram keyed by a tuple of label values
+    """
+
+    def __init__(self, name, documentation, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label_values, value):
+        label_values = tuple(str(v) for v in label_values)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = _format_labels(self.label_names, label_values)
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    bucket_labels = _merge_labels(labels, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                inf_labels = _merge_labels(labels, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf_labels} {series['count']}")
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Counter:
+    """
+    Minimal thread-safe Prometheus counter keyed by a tuple of label values
+    """
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series = defaultdict(float)
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._series[tuple(str(v) for v in label_values)] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _merge_labels(labels, extra):
+    if not labels:
+        return "{" + extra + "}"
+    return labels[:-1] + "," + extra + "}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Register a callable returning extra exposition lines (gauges computed on scrape)
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+REQUEST_LATENCY = metrics.register(Histogram(
+    "insumos_request_duration_seconds", "Request latency per endpoint", ("endpoint", "method", "status")))
+PHASE_LATENCY = metrics.register(Histogram(
+    "insumos_request_phase_duration_seconds", "Time spent per request phase", ("endpoint", "phase")))
+SLOW_QUERIES = metrics.register(Counter(
+    "insumos_slow_queries_total", "SQL statements slower than the slow query threshold", ("endpoint",)))
+AWS_CALL_LATENCY = metrics.register(Histogram(
+    "insumos_aws_call_duration_seconds", "Latency of AWS API calls per client and operation",
+    ("service", "operation")))
+AWS_CALL_ERRORS = metrics.register(Counter(
+    "insumos_aws_call_errors_total", "AWS API calls that raised an exception", ("service", "operation")))
+
+
+def record_phase(phase, elapsed):
+    """
+    Add elapsed seconds to a phase of the current request (no-op outside requests)
+    """
+    if not has_request_context():
+        return
+    timings = g.get("_phase_timings")
+    if timings is None:
+        return
+    timings[phase] += elapsed
+    g._phase_counts[phase] += 1
+
+
+@contextmanager
+def timed_phase(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - start)
+
+
+def timed(phase):
+    """
+    Decorator version of ``timed_phase``
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed_phase(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_boto3_client(client, phase=PHASE_AWS):
+    """
+    Time every API call of a boto3 client through botocore's event hooks,
+    both as a request phase and in the per service/operation histogram
+    """
+    service = client.meta.service_model.service_name
+
+    def before_call(context, **kwargs):
+        context["_insumos_call_start"] = time.perf_counter()
+
+    def after_call(context, event_name, **kwargs):
+        start = context.pop("_insumos_call_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        operation = event_name.rsplit(".", 1)[-1]
+        record_phase(phase, elapsed)
+        AWS_CALL_LATENCY.observe((service, operation), elapsed)
+        http_response = kwargs.get("http_response")
+        if event_name.startswith("after-call-error") or (http_response is not None and http_response.status_code >= 300):
+            AWS_CALL_ERRORS.inc((service, operation))
+
+    client.meta.events.register("before-call", before_call)
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("after-call-error", after_call)
+    return client
+
+
+def _current_endpoint():
+    if has_request_context():
+        return request.endpoint or "unknown"
+    return "none"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, not the pooled connection: after_cursor_execute
+    # does not fire for a failing statement, and its start then goes away with the context
+    if context is not None:
+        context._insumos_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_insumos_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    record_phase(PHASE_DB, elapsed)
+    if not has_app_context():
+        return
+    threshold_ms = current_app.config.get("SLOW_QUERY_THRESHOLD_MS")
+    if threshold_ms is not None and elapsed * 1000 >= threshold_ms:
+        endpoint = _current_endpoint()
+        SLOW_QUERIES.inc((endpoint,))
+        slow_query_logger.warning(json.dumps({
+            "event": "slow_query",
+            "endpoint": endpoint,
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": statement,
+            **_describe_parameters(parameters, executemany),
+        }, ensure_ascii=False))
+
+
+def _describe_parameters(parameters, executemany):
+    """
+    Count and types of the bound parameters: their values (emails, tokens, addresses) are only
+    logged with ``SLOW_QUERY_LOG_PARAMETERS``
+    """
+    if current_app.config.get("SLOW_QUERY_LOG_PARAMETERS"):
+        return {"parameters": repr(parameters)}
+    description = {}
+    if executemany:
+        description["parameter_sets"] = len(parameters)
+        parameters = parameters[0] if parameters else ()
+    if isinstance(parameters, dict):
+        description["parameter_count"] = len(parameters)
+        description["parameter_types"] = {name: type(value).__name__ for name, value in parameters.items()}
+    else:
+        parameters = parameters or ()
+        description["parameter_count"] = len(parameters)
+        description["parameter_types"] = [type(value).__name__ for value in parameters]
+    return description
+
+
+def _before_render_template(sender, template, context, **extra):
+    if has_request_context() and "_phase_timings" in g:
+        g._template_starts.append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    if has_request_context() and g.get("_template_starts"):
+        record_phase(PHASE_TEMPLATE, time.perf_counter() - g._template_starts.pop())
+
+
+def _start_request_profile():
+    g._request_start = time.perf_counter()
+    g._phase_timings = defaultdict(float)
+    g._phase_counts = defaultdict(int)
+    g._template_starts = []
+
+
+def _finish_request_profile(response):
+    start = g.get("_request_start")
+    if start is None:
+        return response
+    total = time.perf_counter() - start
+    endpoint = _current_endpoint()
+    timings = g._phase_timings
+    counts = g._phase_counts
+
+    server_timing = [
+        f'{phase};dur={elapsed * 1000:.1f};desc="{counts[phase]}"' for phase, elapsed in timings.items()
+    ]
+    server_timing.append(f"total;dur={total * 1000:.1f}")
+    response.headers.add("Server-Timing", ", ".join(server_timing))
+
+    REQUEST_LATENCY.observe((endpoint, request.method, response.status_code), total)
+    for phase, elapsed in timings.items():
+        PHASE_LATENCY.observe((endpoint, phase), elapsed)
+
+    logger.info(json.dumps({
+        "event": "request",
+        "method": request.method,
+        "path": request.path,
+        "endpoint": endpoint,
+        "status": response.status_code,
+        "duration_ms": round(total * 1000, 2),
+        "phases_ms": {phase: round(elapsed * 1000, 2) for phase, elapsed in timings.items()},
+        "phase_calls": dict(counts),
+    }, ensure_ascii=False))
+    return response
+
+
+def _metrics_allowed():
+    config = current_app.config
+    token = config.get("METRICS_TOKEN")
+    if token:
+        scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(credentials.encode(), token.encode()):
+            return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or "")
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(allowed, strict=False)
+               for allowed in config.get("METRICS_ALLOWED_IPS", ()))
+
+
+def metrics_view():
+    if not _metrics_allowed():
+        abort(403)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    """
+    Wire the profiling hooks into a Flask app
+    """
+    app.config.setdefault("SLOW_QUERY_THRESHOLD_MS", 200)
+    app.config.setdefault("METRICS_ENABLED", True)
+    app.config.setdefault("METRICS_ALLOWED_IPS", ["127.0.0.1", "::1"])
+    for profiling_logger in (logger, slow_query_logger):
+        if not profiling_logger.handlers:
+            profiling_logger.addHandler(logging.StreamHandler())
+            profiling_logger.setLevel(logging.INFO)
+
+    # Engine-wide listeners are shared by every app created in the process
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    app.before_request(_start_request_profile)
+    app.after_request(_finish_request_profile)
+    if app.config["METRICS_ENABLED"]:
+        app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,146 @@
+"""
+Batch edits of the insumo catalog (stock, unit cost, vendor and reorder threshold).
+
+``apply_insumo_changes`` applies any number of changes in one transaction:
+one ``SELECT ... FOR UPDATE`` locks the rows and reads their ``version``,
+one query checks the vendors, and the accepted rows are written with a
+single ORM bulk UPDATE by primary key (an ``executemany``).
+
+Concurrency is optimistic: every change carries the ``version`` the editor
+saw. A row edited (or deleted) by someone else since then is not written and
+comes back in the conflict report with its current values; the other rows
+are still applied. Stock reservations do not change the version: a stock in
+a batch is the count to set, as in the edit form.
+
+The check is on ``version`` rather than ``last_updated``: keeping
+``last_updated`` current on every write would bump it on each stock
+reservation, reshuffle the catalog lists ordered by it and turn every order
+into a batch conflict. ``last_updated`` is only set by catalog edits.
+"""
+import math
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from insumos.extensions import db
+from insumos.models import Insumo, Vendor
+
+
+def _non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise ValueError
+    return number
+
+
+def _unit_cost(value):
+    number = float(value)
+    if not math.isfinite(number) or number < 0:
+        raise ValueError
+    return number
+
+
+# Editable columns -> parser of the submitted value
+FIELDS = {
+    'stock': _non_negative_int,
+    'unit_cost': _unit_cost,
+    'vendor_id': int,
+    'reorder_threshold': _non_negative_int,
+}
+FIELD_LABELS = {'stock': 'stock', 'unit_cost': 'costo unitario', 'vendor_id': 'proveedor',
+                'reorder_threshold': 'punto de reorden'}
+
+
+class InvalidInsumoChange(ValueError):
+    pass
+
+
+def parse_change(raw):
+    """
+    ``(id, version seen by the editor, {column: value})`` of one submitted change; fields left out
+    (or empty) are not changed
+    """
+    try:
+        insumo_id = int(raw['id'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidInsumoChange("Insumo no válido")
+    try:
+        seen = int(raw['version'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidInsumoChange("Falta la versión del insumo")
+    values = {}
+    for name, parse in FIELDS.items():
+        value = raw.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            values[name] = parse(value)
+        except (TypeError, ValueError):
+            raise InvalidInsumoChange(f"Valor no válido en {FIELD_LABELS[name]}: {value}")
+    if not values:
+        raise InvalidInsumoChange("No hay cambios")
+    return insumo_id, seen, values
+
+
+def parse_batch(payload):
+    """
+    The changes of a JSON batch, ``{"insumos": [{...}, ...]}``
+    """
+    changes = payload.get('insumos') if isinstance(payload, dict) else None
+    if not isinstance(changes, list) or not all(isinstance(change, dict) for change in changes):
+        raise InvalidInsumoChange('Se esperaba {"insumos": [{"id": ..., "version": ..., ...}, ...]}')
+    return changes
+
+
+def _conflict(insumo_id, reason, current=None):
+    return {'id': insumo_id, 'reason': reason, 'current': current}
+
+
+def apply_insumo_changes(changes):
+    """
+    Apply ``changes`` (dicts with ``id``, ``version`` and any of ``FIELDS``) and commit.
+    Returns ``(ids of the updated insumos, conflicts)``; each conflict is a dict with the ``id``,
+    the ``reason`` and, for rows changed meanwhile, their ``current`` values.
+    """
+    parsed = {}
+    conflicts = []
+    for raw in changes:
+        try:
+            insumo_id, seen, values = parse_change(raw)
+        except InvalidInsumoChange as e:
+            conflicts.append(_conflict(raw.get('id'), f"Insumo {raw.get('id')}: {e}"))
+            continue
+        if insumo_id in parsed:
+            conflicts.append(_conflict(insumo_id, f"Insumo {insumo_id}: aparece más de una vez en el lote"))
+            continue
+        parsed[insumo_id] = (seen, values)
+    if not parsed:
+        db.session.rollback()
+        return [], conflicts
+
+    columns = [Insumo.id, Insumo.name, Insumo.version] + [getattr(Insumo, name) for name in FIELDS]
+    current = {row.id: row for row in db.session.execute(
+        select(*columns).where(Insumo.id.in_(parsed)).with_for_update())}
+    vendor_ids = {values['vendor_id'] for _, values in parsed.values() if 'vendor_id' in values}
+    existing_vendors = set(db.session.scalars(select(Vendor.id).where(Vendor.id.in_(vendor_ids)))) \
+        if vendor_ids else set()
+
+    now = datetime.utcnow()
+    mappings = []
+    for insumo_id, (seen, values) in parsed.items():
+        row = current.get(insumo_id)
+        if row is None:
+            conflicts.append(_conflict(insumo_id, f"Insumo {insumo_id}: fue eliminado"))
+        elif row.version != seen:
+            conflicts.append(_conflict(
+                insumo_id, f"{row.name} fue modificado por otro usuario; revisa sus valores actuales",
+                {'name': row.name, 'version': row.version, **{name: getattr(row, name) for name in FIELDS}}))
+        elif 'vendor_id' in values and values['vendor_id'] not in existing_vendors:
+            conflicts.append(_conflict(insumo_id, f"{row.name}: el proveedor no existe"))
+        else:
+            mappings.append({'id': insumo_id, 'last_updated': now, 'version': row.version + 1, **values})
+
+    if mappings:
+        db.session.execute(update(Insumo), mappings)
+    db.session.commit()
+    return [mapping['id'] for mapping in mappings], conflicts
@@ -0,0 +1,260 @@
+"""
+PDF renderers for the order letters.
+
+* ``reportlab`` (default): draws both layouts directly with ReportLab's
+  platypus, with no HTML/CSS parsing. Several times faster than xhtml2pdf.
+* ``xhtml2pdf``: renders the Jinja templates in templates/representante/ and
+  converts the HTML, as before. It is also the fallback when the ReportLab
+  renderer fails on a letter.
+
+Both receive the same letter context (see ``insumos.letters.letter_context``):
+the text fields, ``insumos_order`` (``Order.data``) and the logo and signature
+as raw image bytes.
+"""
+import base64
+import logging
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from flask import current_app, render_template
+
+from insumos.instrumentation import timed, PHASE_PDF
+
+logger = logging.getLogger(__name__)
+
+BAYER_ADDRESS = ("Bayer de Mélaco, SA de E V ~ Miguel de Cervantes Saavedra 259, Col Granada Miguel Hidalgo, "
+                 "Ciudad de México, México.")
+
+REQUEST_LETTER_BODY = (
+    "Por medio de la presente solicito el apoyo descrito a continuación (favor de colocar tipo de insumo y "
+    "cantidad), con el fin de que puedan utilizarse en los servicios médicos de la institución en beneficio "
+    "directo de los pacientes."
+)
+
+RESPONSE_LETTER_BODY = (
+    "En relación con la solicitud de apoyo de {nombre_representante}, hacemos de su conocimiento que la misma ha "
+    "sido aprobada conforme al procedimiento interno de Bayer, por lo que coordinaremos con la Institución la forma "
+    "en que se entregará éste apoyo. En virtud de lo anterior, mediante la firma de recepción de la presente, en "
+    "representación de la Institución, usted reconoce que el objetivo del apoyo tiene como objetivo su uso para "
+    "beneficio directo de los pacientes de la Institución y mejora en la calidad de atención a los pacientes de la "
+    "institución, por lo que acepto y me obligo a los siguientes lineamientos:<br/>"
+    "Este apoyo no constituye una obligación o incentivo para recomendar, prescribir, adquirir, suministrar, vender "
+    "o administrar cualquiera de los productos de Bayer. Informar a las autoridades correspondientes del hospital al "
+    "cual me encuentre adscrito durante la atención de dichos pacientes sobre el apoyo que Bayer a proporcionado, "
+    "conforme dichas notificaciones sean requeridas por la normatividad aplicable.<br/>"
+    "El apoyo solicitado no representa conflicto de interés según se defina en la normatividad legal. En caso de "
+    "que la recepción de dicho apoyo sea considerado como un “conflicto de intereses”, me obligo a informar a Bayer "
+    "previo a la recepción de este, con el fin de evaluar las medidas necesarias para la mitigación de riesgos.<br/>"
+    "Si durante mi práctica médica soy considerado como servidor o funcionario público, me obligo a informar sobre "
+    "la recepción de dicho apoyo a mi superior jerárquico o institución de gobierno para que le preste servicios y, "
+    "en su caso, obtener todas las aprobaciones necesarias incluso aunque el beneficiario del apoyo sea el paciente."
+)
+
+RESPONSE_LETTER_ACCEPTANCE = (
+    "En este acto expresamente acepto que la firma electrónica anterior sustituye a la firma autógrafa, por lo que "
+    "reconozco su autenticidad, veracidad y origen de la misma, en términos de la legislación aplican"
+)
+
+
+def _data_url(image):
+    """
+    The image as a JPEG ``data:`` URL, flattened on the white page. xhtml2pdf names each PDF image
+    after the bytes its decoder left unread, which for a PNG are the trailing ``IEND`` chunk shared
+    by every PNG: the signature was drawn as a second copy of the logo.
+    """
+    if not image:
+        return None
+    from PIL import Image
+    source = Image.open(BytesIO(image))
+    flattened = Image.new('RGB', source.size, 'white')
+    source = source.convert('RGBA')
+    flattened.paste(source, mask=source.getchannel('A'))
+    jpeg = BytesIO()
+    flattened.save(jpeg, 'JPEG', quality=95)
+    return f'data:image/jpeg;base64,{base64.b64encode(jpeg.getvalue()).decode("utf-8")}'
+
+
+class XHTML2PDFRenderer:
+    name = 'xhtml2pdf'
+
+    def render_request_letter(self, context):
+        return self._convert(render_template(
+            'representante/letter_representante_generate_order.html',
+            actual_date=context['actual_date'],
+            insumos_order=context['insumos_order'],
+            medico_solicitante=context['medico_solicitante'],
+            posicion_medico=context['posicion_medico'],
+            nombre_institucion=context['nombre_institucion'],
+            logo_bayer=_data_url(context['logo']),
+            doctor_signature=_data_url(context['doctor_signature']),
+        ))
+
+    def render_response_letter(self, context):
+        return self._convert(render_template(
+            'representante/letter_representante_response_generate_order.html',
+            order_id=context['order_id'],
+            actual_date=context['actual_date'],
+            medico_solicitante=context['medico_solicitante'],
+            posicion_medico=context['posicion_medico'],
+            nombre_institucion=context['nombre_institucion'],
+            doctor_signature=_data_url(context['doctor_signature']),
+            nombre_representante=context['nombre_representante'],
+            logo_bayer=_data_url(context['logo']),
+        ))
+
+    def _convert(self, html):
+        # xhtml2pdf takes ~0.5s to import: loaded on the first render (or preloaded by gunicorn.conf.py)
+        from xhtml2pdf import pisa
+        pdf = BytesIO()
+        pisa_status = pisa.CreatePDF(BytesIO(html.encode('utf-8')), dest=pdf)
+        if pisa_status.err:
+            return None
+        return pdf.getvalue()
+
+
+class ReportLabRenderer:
+    """
+    Same layout as the HTML templates: logo, address, date, subject, body, insumo table (request
+    letter only), signer data and the doctor's signature. Arial is drawn as Helvetica.
+    """
+    name = 'reportlab'
+
+    def __init__(self):
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_JUSTIFY
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.lib.units import cm
+
+        self.page_size = A4
+        self.margin = 1.5 * cm
+        self.style = ParagraphStyle('letter', fontName='Helvetica', fontSize=9, leading=12, spaceAfter=15)
+        self.body_style = ParagraphStyle('letter_body', parent=self.style, alignment=TA_JUSTIFY)
+        self.cell_style = ParagraphStyle('letter_cell', parent=self.style, spaceAfter=0)
+        self.header_style = ParagraphStyle('letter_header', parent=self.cell_style, textColor=colors.white)
+        self.table_style = [
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4CAF50')),
+            ('GRID', (0, 0), (-1, -1), 0.75, colors.HexColor('#dddddd')),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('TOPPADDING', (0, 0), (-1, -1), 6),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('LEFTPADDING', (0, 0), (-1, -1), 6),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+        ]
+
+    def render_request_letter(self, context):
+        from reportlab.platypus import Paragraph
+        story = self._heading(context)
+        story.append(Paragraph("Asunto: Solicitud de insumos", self.style))
+        story.append(Paragraph(REQUEST_LETTER_BODY, self.body_style))
+        story.append(self._insumos_table(context['insumos_order'] or []))
+        story.append(Paragraph("Agradeciendo la atención al presente,<br/>" + self._signer(context), self.style))
+        story.extend(self._signature(context['doctor_signature']))
+        return self._build(story, "Solicitud de Insumos")
+
+    def render_response_letter(self, context):
+        from reportlab.platypus import Paragraph
+        story = self._heading(context)
+        story.append(Paragraph(f"<b>CARTA RESPUESTA #{context['order_id']}</b>", self.style))
+        story.append(Paragraph(RESPONSE_LETTER_BODY.format(
+            nombre_representante=escape(context['nombre_representante'] or "")), self.body_style))
+        story.append(Paragraph(self._signer(context), self.style))
+        story.append(Paragraph(RESPONSE_LETTER_ACCEPTANCE, self.body_style))
+        story.extend(self._signature(context['doctor_signature']))
+        return self._build(story, f"CARTA RESPUESTA #{context['order_id']}")
+
+    def _heading(self, context):
+        from reportlab.platypus import Paragraph
+        story = []
+        if context['logo']:
+            story.append(self._image(context['logo'], 37.5, 37.5, h_align='LEFT'))
+        story.append(Paragraph(BAYER_ADDRESS, self.style))
+        story.append(Paragraph(f"Fecha: {context['actual_date']}", self.style))
+        return story
+
+    def _signer(self, context):
+        return (f"Nombre de solicitante: {escape(context['medico_solicitante'] or '')}<br/>"
+                f"Posición: {escape(context['posicion_medico'] or '')}<br/>"
+                f"Nombre de la Institución: {escape(context['nombre_institucion'] or '')}")
+
+    def _insumos_table(self, insumos_order):
+        from reportlab.platypus import Paragraph, Table, TableStyle
+        rows = [[Paragraph(title, self.header_style) for title in ("#", "Insumo", "Cantidad", "Costo")]]
+        for index, insumo in enumerate(insumos_order, start=1):
+            rows.append([
+                Paragraph(str(index), self.cell_style),
+                Paragraph(escape(str(insumo.get('name', ''))), self.cell_style),
+                Paragraph(escape(str(insumo.get('quantity', ''))), self.cell_style),
+                Paragraph(escape(str(insumo.get('cost', ''))), self.cell_style),
+            ])
+        width = self.page_size[0] - 2 * self.margin
+        table = Table(rows, colWidths=[width * 0.08, width * 0.52, width * 0.2, width * 0.2],
+                      repeatRows=1, spaceBefore=15, spaceAfter=15)
+        table.setStyle(TableStyle(self.table_style))
+        return table
+
+    def _signature(self, signature):
+        if not signature:
+            return []
+        # 200px box of the HTML template, keeping the aspect ratio of the signature pad
+        return [self._image(signature, 150, 150, h_align='LEFT')]
+
+    def _image(self, data, max_width, max_height, h_align):
+        from reportlab.lib.utils import ImageReader
+        from reportlab.platypus import Image
+        width, height = ImageReader(BytesIO(data)).getSize()
+        scale = min(max_width / width, max_height / height)
+        image = Image(BytesIO(data), width=width * scale, height=height * scale)
+        image.hAlign = h_align
+        return image
+
+    def _build(self, story, title):
+        from reportlab.platypus import SimpleDocTemplate
+        pdf = BytesIO()
+        document = SimpleDocTemplate(pdf, pagesize=self.page_size, title=title,
+                                     leftMargin=self.margin, rightMargin=self.margin,
+                                     topMargin=self.margin, bottomMargin=self.margin)
+        document.build(story)
+        return pdf.getvalue()
+
+
+RENDERERS = {
+    ReportLabRenderer.name: ReportLabRenderer,
+    XHTML2PDFRenderer.name: XHTML2PDFRenderer,
+}
+
+_instances = {}
+
+
+def get_renderer(name):
+    if name not in _instances:
+        _instances[name] = RENDERERS[name]()
+    return _instances[name]
+
+
+@timed(PHASE_PDF)
+def render_letter(response_letter, context):
+    """
+    PDF bytes of the request letter (or the response letter), or None if it could not be rendered.
+    Uses ``LETTER_RENDERER`` and falls back to xhtml2pdf if that renderer fails.
+    """
+    return render_letter_with(current_app.config['LETTER_RENDERER'], response_letter, context)
+
+
+def render_letter_with(name, response_letter, context):
+    """
+    ``render_letter`` with the renderer ``name``; only xhtml2pdf needs an app context, for its templates
+    """
+    renderer = get_renderer(name)
+    try:
+        if response_letter:
+            return renderer.render_response_letter(context)
+        return renderer.render_request_letter(context)
+    except Exception:
+        if name == XHTML2PDFRenderer.name:
+            raise
+        logger.exception("%s renderer failed for order %s, falling back to xhtml2pdf", name, context['order_id'])
+    fallback = get_renderer(XHTML2PDFRenderer.name)
+    if response_letter:
+        return fallback.render_response_letter(context)
+    return fallback.render_request_letter(context)
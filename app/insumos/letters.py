@@ -0,0 +1,208 @@
+"""
+Order letters: signature upload and PDF generation of the request and response letters.
+Generated PDFs and signature images are kept in object storage (see insumos/storage.py).
+"""
+import os
+import json
+import uuid
+import base64
+from datetime import date
+from functools import lru_cache
+
+from flask import (Blueprint, Response, abort, current_app, render_template, request, redirect, session,
+                   stream_with_context, url_for)
+
+from insumos.archive import get_order_or_archived_or_404
+from insumos.auth import token_required, requires_admin_email
+from insumos.bulk_letters import SIGNATURE_KEY_COLUMNS, reference_letter, store_letter, stream_letters_zip
+from insumos.extensions import db, storage
+from insumos.letter_renderers import render_letter
+from insumos.models import BayerUser, OrderStatus, Order
+from insumos.outbox import change_order_status
+
+letters_bp = Blueprint('letters', __name__)
+
+TYPE_LETTER_RESPONSE = 'letter_response'
+TYPE_LETTER = 'letter'
+
+# Letter type: (object storage key column, legacy PDF column, is the response letter)
+LETTER_COLUMNS = {
+    TYPE_LETTER: ('letter_key', 'letter', False),
+    TYPE_LETTER_RESPONSE: ('letter_response_key', 'letter_response', True),
+}
+
+
+@letters_bp.route('/order_pdf_letter/<int:order_id>/<type_letter>')
+@token_required
+def order_pdf_letter(order_id, type_letter):
+    """
+    Letters are rendered once and kept in object storage; every view after that is a redirect
+    to a short-lived download URL. A new signature discards the stored letter (see save_signature).
+    """
+    order = get_order_or_archived_or_404(order_id)
+    if type_letter == TYPE_LETTER_RESPONSE:
+        key_column = 'letter_response_key'
+        file_pdf_name = f'carta_respuesta_pedido_{order_id}.pdf'
+    else:
+        key_column = 'letter_key'
+        file_pdf_name = f'carta_solicitud_pedido_{order_id}.pdf'
+
+    letter_key = getattr(order, key_column)
+    if letter_key is None:
+        signature_key = getattr(order, SIGNATURE_KEY_COLUMNS[key_column])
+        pdf = render_letter(type_letter == TYPE_LETTER_RESPONSE, letter_context(order, type_letter))
+        if pdf is None:
+            return "Error al generar el PDF", 500
+        letter_key = store_letter(order_id, pdf)
+        won = reference_letter(type(order), order_id, key_column, signature_key, letter_key)
+        db.session.commit()
+        if not won:
+            # Another view stored the letter first, or a new signature discarded this one
+            letter_key = getattr(order, key_column)
+            if letter_key is None:
+                return redirect(url_for('letters.order_pdf_letter', order_id=order_id, type_letter=type_letter))
+    return redirect(storage.url(letter_key, content_type='application/pdf', filename=file_pdf_name))
+
+
+def letter_context(order, type_letter):
+    """
+    Values drawn by the letter renderers (see insumos/letter_renderers.py)
+    """
+    if type_letter == TYPE_LETTER_RESPONSE:
+        # The stored letter is shared by everyone who opens it: signed by the representante who owns
+        # the order, not by the user viewing it
+        representante = BayerUser.query.filter_by(email=order.user_email).first()
+        nombre_representante = representante.name if representante else ""
+        doctor_signature = signature_image(order.letter_response_signature_key, order.letter_response_signature)
+    else:
+        nombre_representante = None
+        doctor_signature = signature_image(order.letter_signature_key, order.letter_signature)
+    return {
+        'order_id': order.id,
+        'actual_date': date.today(),
+        'insumos_order': order.data,
+        'medico_solicitante': order.doctor_name,
+        'posicion_medico': order.doctor_position,
+        'nombre_institucion': order.delivery_institute,
+        'nombre_representante': nombre_representante,
+        'logo': get_bayer_logo(),
+        'doctor_signature': doctor_signature,
+    }
+
+
+def signature_image(signature_key, legacy_signature):
+    """
+    Signature image bytes, from object storage or the legacy data URL text column
+    """
+    if signature_key:
+        return storage.get(signature_key)
+    if legacy_signature:
+        return base64.b64decode(legacy_signature.split(',', 1)[-1])
+    return None
+
+
+def save_signature(order, type_letter, signature_data_url):
+    """
+    Upload the signature pad PNG (a ``data:image/png;base64,...`` URL) and discard the letter
+    rendered without it. Returns the object keys that are no longer referenced.
+    """
+    image = base64.b64decode(signature_data_url.split(',', 1)[-1])
+    key = storage.put(f'signatures/orders/{order.id}/{uuid.uuid4().hex}.png', image, 'image/png')
+    if type_letter == TYPE_LETTER_RESPONSE:
+        replaced = [order.letter_response_signature_key, order.letter_response_key]
+        order.letter_response_signature_key = key
+        order.letter_response_signature = None
+        order.letter_response_key = None
+    else:
+        replaced = [order.letter_signature_key, order.letter_key]
+        order.letter_signature_key = key
+        order.letter_signature = None
+        order.letter_key = None
+    return [old_key for old_key in replaced if old_key]
+
+
+@letters_bp.route('/api/orders_letters_zip', methods=["GET"])
+@token_required
+@requires_admin_email()
+def orders_letters_zip():
+    """
+    ZIP with the letters of the orders selected in the admin table (same ``orders_id_list`` as
+    get_orders_to_delete_html). ``letter_types``: comma separated letter types, both by default.
+    """
+    orders_ids = list(dict.fromkeys(int(order_id) for order_id in json.loads(request.args.get('orders_id_list', '[]'))))
+    requested_types = request.args.get('letter_types', f'{TYPE_LETTER},{TYPE_LETTER_RESPONSE}').split(',')
+    letter_types = [LETTER_COLUMNS[type_letter] for type_letter in requested_types if type_letter in LETTER_COLUMNS]
+    if not orders_ids or not letter_types:
+        abort(400)
+
+    def file_name(order_id, response_letter):
+        if response_letter:
+            return f'carta_respuesta_pedido_{order_id}.pdf'
+        return f'carta_solicitud_pedido_{order_id}.pdf'
+
+    def context(order, response_letter):
+        return letter_context(order, TYPE_LETTER_RESPONSE if response_letter else TYPE_LETTER)
+
+    return Response(
+        stream_with_context(stream_letters_zip(orders_ids, letter_types, context, file_name)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=cartas_pedidos.zip'})
+
+
+@letters_bp.route('/order_detail/<int:order_id>')
+@token_required
+def order_detail(order_id):
+    return render_template(
+        'representante/order_detail.html',
+        order_id=order_id,
+    )
+
+
+# Route to upload a file
+@letters_bp.route('/upload_signature', methods=['POST'])
+@token_required
+def upload_signature():
+    uploaded_key = None
+    try:
+        data_from_request = [key for key in request.form.keys()][0].split("_")
+        order_id = data_from_request[1]
+        order = Order.query.get_or_404(order_id)
+        if request.form.get(f'signature_{order_id}'):
+            replaced_keys = save_signature(order, TYPE_LETTER, request.form[f'signature_{order_id}'])
+            uploaded_key = order.letter_signature_key
+            change_order_status(order, OrderStatus.EN_CAMINO, changed_by=session.get('user_email'))
+        else:
+            replaced_keys = save_signature(order, TYPE_LETTER_RESPONSE,
+                                           request.form[f'signatureresponse_{order_id}'])
+            uploaded_key = order.letter_response_signature_key
+            change_order_status(order, OrderStatus.ENTREGADO, changed_by=session.get('user_email'))
+        db.session.commit()
+        for key in replaced_keys:
+            storage.delete(key)
+        return redirect(url_for('letters.get_letter_html', order_id=order_id))
+    except Exception as e:
+        db.session.rollback()
+        if uploaded_key:
+            storage.delete(uploaded_key)
+        return f"Ha ocurrido un error cargando la firma: {str(e)}"
+
+
+@letters_bp.route('/get_letter_html/<int:order_id>', methods=["GET"])
+def get_letter_html(order_id):
+    order = get_order_or_archived_or_404(order_id)
+    return render_template(
+        "representante/embed_letter.html",
+        order_id=order_id,
+        order_letter_signature=bool(order.letter_signature_key or order.letter_signature),
+        order_letter_response_signature=bool(order.letter_response_signature_key or order.letter_response_signature)
+    )
+
+
+def get_bayer_logo():
+    return _read_logo(os.path.join(current_app.root_path, 'static/assets/img/bayer_logo.png'))
+
+
+@lru_cache(maxsize=4)
+def _read_logo(image_path):
+    with open(image_path, 'rb') as image_file:
+        return image_file.read()
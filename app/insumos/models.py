@@ -0,0 +1,230 @@
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import DDL, Column, DateTime, String, Integer, Text, Numeric, JSON, event
+from sqlalchemy.orm import relationship, deferred
+
+from insumos.extensions import db
+
+# Trigram indexes back the ILIKE '%...%' searches on PostgreSQL
+event.listen(db.metadata, 'before_create',
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql'))
+
+
+class BayerUser(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(100), unique=True, nullable=False)
+    customer_team = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False)
+    cwid = db.Column(db.String(20), nullable=False)
+    address = db.Column(db.String(250), nullable=False)
+    ext_number = db.Column(db.String(100), nullable=False)
+    int_number = db.Column(db.String(100), nullable=False)
+    colonia = db.Column(db.String(250), nullable=False)
+    ciudad = db.Column(db.String(250), nullable=False)
+    edo = db.Column(db.String(100), nullable=False)
+    cp = db.Column(db.String(100), nullable=False)
+    cel_bayer = db.Column(db.String(250), nullable=False)
+    # Admin order search filters (see insumos/order_search.py)
+    __table_args__ = (
+        db.Index('ix_bayer_user_customer_team', 'customer_team'),
+        db.Index('ix_bayer_user_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+
+class UserSession(db.Model):
+    """
+    Server-side session data, the cookie only holds the signed ``sid`` (see insumos/sessions.py)
+    """
+    __tablename__ = 'sessions'
+    sid = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Vendor(db.Model):
+    """
+    Proveedor
+    """
+    __tablename__ = 'vendors'
+    id = db.Column(Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    cellphone = db.Column(db.String(80), nullable=False)
+    user_email = db.Column(String(80), nullable=False)
+    creation_date = Column(DateTime, nullable=False, default=datetime.utcnow)
+    insumos = relationship('Insumo', backref='vendor', lazy=True)
+
+
+class Insumo(db.Model):
+    __tablename__ = 'insumos'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    unit_cost = db.Column(db.Float, nullable=False)
+    vendor_id = Column(Integer, db.ForeignKey('vendors.id'), nullable=False)
+    order_id = Column(Integer, db.ForeignKey('orders.id'), nullable=True)
+    # Catalog edits only (admin forms and batch edits): stock reservations leave both untouched, so
+    # the lists keep their order and a reservation never conflicts with a batch edit
+    last_updated = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Optimistic concurrency of the batch edits (insumos/insumo_batch.py), bumped with last_updated
+    version = db.Column(Integer, nullable=False, default=1, server_default='1')
+    # Stock at or below this level needs reordering (see insumos/stock.py)
+    reorder_threshold = db.Column(Integer, nullable=False, default=0, server_default='0')
+    __table_args__ = (
+        db.CheckConstraint('stock >= 0', name='ck_insumos_stock_non_negative'),
+        # Only the insumos at risk are indexed, so the low stock list and badge never scan the catalog
+        db.Index('ix_insumos_low_stock', 'vendor_id',
+                 postgresql_where=db.text('stock <= reorder_threshold'),
+                 sqlite_where=db.text('stock <= reorder_threshold')),
+    )
+
+    def update(self, new_data):
+        # Update other fields in self based on new_data
+        self.last_updated = datetime.utcnow()
+        db.session.commit()
+
+
+class OrderStatus(Enum):
+    ENTREGADO = "Entregado"
+    EN_CAMINO = "En camino"
+    CANCELADO = "Cancelado"
+    CREADA = "Creado"
+    RECHAZADA = "Rechazado"
+
+
+class Signature(db.Model):
+    __tablename__ = 'signatures'
+    id = db.Column(Integer, primary_key=True)
+    user_email = db.Column(String(80), nullable=False)
+    # Legacy inline image, moved to object storage under signature_key by ``flask move-signatures``.
+    # Deferred so that loading a Signature never reads the blob unless it is used.
+    signature_image = deferred(db.Column(db.LargeBinary, nullable=True))
+    signature_key = db.Column(String(250), nullable=True)
+    # Sniffed from the image bytes and SHA-256 of the content, used for the ETag
+    content_type = db.Column(String(50), nullable=True)
+    content_hash = db.Column(String(64), nullable=True)
+    last_updated = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def update(self, new_data):
+        # Update other fields in self based on new_data
+        self.last_updated = datetime.utcnow()
+        db.session.commit()
+
+
+class Order(db.Model):
+    __tablename__ = 'orders'
+    id = db.Column(Integer, primary_key=True)
+    user_email = db.Column(String(80), nullable=False)
+    creation_date = Column(DateTime, nullable=False, default=datetime.utcnow)
+    estimated_delivery_date = Column(DateTime, nullable=True)
+    last_updated = Column(DateTime, nullable=False, default=datetime.utcnow)
+    insumos = relationship('Insumo', backref='order', lazy=True)
+    data = Column(JSON)
+    # Legacy PDF bytes, deferred so listing orders never reads them (new letters live in object storage)
+    letter = deferred(db.Column(db.LargeBinary, nullable=True))
+    letter_response = deferred(db.Column(db.LargeBinary, nullable=True))
+    letter_response_date = Column(DateTime, nullable=True)
+    status = db.Column(db.Enum(OrderStatus), default=OrderStatus.CREADA, nullable=False)
+    delivery_information = db.Column(Text(), nullable=True)
+    delivery_institute = db.Column(String(250), nullable=True)
+    doctor_name = db.Column(String(250), nullable=True)
+    doctor_position = db.Column(String(250), nullable=True)
+    total = db.Column(Numeric, nullable=False)
+    letter_signature = db.Column(db.Text, nullable=True)
+    letter_response_signature = db.Column(db.Text, nullable=True)
+    # Object storage keys (see insumos/storage.py); the Text/LargeBinary columns above are only read
+    # for rows written before the letters and signatures moved to object storage
+    letter_key = db.Column(String(250), nullable=True)
+    letter_response_key = db.Column(String(250), nullable=True)
+    letter_signature_key = db.Column(String(250), nullable=True)
+    letter_response_signature_key = db.Column(String(250), nullable=True)
+    # Admin order search filters and sorts (see insumos/order_search.py)
+    __table_args__ = (
+        db.Index('ix_orders_user_email', 'user_email'),
+        # Status filter with the default newest-first order: read in index order, stops at the page
+        db.Index('ix_orders_status_id', 'status', 'id'),
+        db.Index('ix_orders_creation_date', 'creation_date'),
+        db.Index('ix_orders_estimated_delivery_date', 'estimated_delivery_date'),
+        db.Index('ix_orders_delivery_institute_trgm', 'delivery_institute', postgresql_using='gin',
+                 postgresql_ops={'delivery_institute': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+    def update(self, new_data):
+        # Update other fields in self based on new_data
+        self.last_updated = datetime.utcnow()
+        db.session.commit()
+
+
+class ArchivedOrder(db.Model):
+    """
+    Delivered and cancelled orders moved out of ``orders`` after the retention window (see
+    insumos/archive.py). Same columns and ids as ``Order``, plus when it was archived.
+    """
+    __tablename__ = 'orders_archive'
+    id = db.Column(Integer, primary_key=True, autoincrement=False)
+    user_email = db.Column(String(80), nullable=False, index=True)
+    creation_date = Column(DateTime, nullable=False, index=True)
+    estimated_delivery_date = Column(DateTime, nullable=True)
+    last_updated = Column(DateTime, nullable=False)
+    data = Column(JSON)
+    letter = deferred(db.Column(db.LargeBinary, nullable=True))
+    letter_response = deferred(db.Column(db.LargeBinary, nullable=True))
+    letter_response_date = Column(DateTime, nullable=True)
+    status = db.Column(db.Enum(OrderStatus), nullable=False)
+    delivery_information = db.Column(Text(), nullable=True)
+    delivery_institute = db.Column(String(250), nullable=True)
+    doctor_name = db.Column(String(250), nullable=True)
+    doctor_position = db.Column(String(250), nullable=True)
+    total = db.Column(Numeric, nullable=False)
+    letter_signature = db.Column(db.Text, nullable=True)
+    letter_response_signature = db.Column(db.Text, nullable=True)
+    letter_key = db.Column(String(250), nullable=True)
+    letter_response_key = db.Column(String(250), nullable=True)
+    letter_signature_key = db.Column(String(250), nullable=True)
+    letter_response_signature_key = db.Column(String(250), nullable=True)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class RepresentanteOrderSummary(db.Model):
+    """
+    Order counters of one representante, archived orders included, updated in the transaction
+    that changes the orders (see insumos/order_summary.py)
+    """
+    __tablename__ = 'representante_order_summaries'
+    user_email = db.Column(String(80), primary_key=True)
+    created_count = db.Column(Integer, nullable=False, default=0)
+    in_transit_count = db.Column(Integer, nullable=False, default=0)
+    delivered_count = db.Column(Integer, nullable=False, default=0)
+    cancelled_count = db.Column(Integer, nullable=False, default=0)
+    rejected_count = db.Column(Integer, nullable=False, default=0)
+    # Total of the orders neither cancelled nor rejected
+    total_spent = db.Column(Numeric, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class OutboxEvent(db.Model):
+    """
+    Notification written in the same transaction as the change it reports and delivered later by
+    the dispatcher (see insumos/outbox.py)
+    """
+    __tablename__ = 'outbox_events'
+    id = db.Column(Integer, primary_key=True)
+    event_type = db.Column(String(50), nullable=False)
+    order_id = db.Column(Integer, nullable=False, index=True)
+    payload = Column(JSON, nullable=False)
+    # Sent with the event so consumers can drop redeliveries
+    idempotency_key = db.Column(String(64), nullable=False, unique=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Next delivery attempt, pushed back after each failure
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    attempts = db.Column(Integer, nullable=False, default=0)
+    last_error = db.Column(Text, nullable=True)
+    dispatched_at = Column(DateTime, nullable=True)
+    # Set when the event ran out of attempts; it is no longer retried
+    failed_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        db.Index('ix_outbox_events_pending', 'available_at', 'id',
+                 postgresql_where=db.text('dispatched_at IS NULL AND failed_at IS NULL'),
+                 sqlite_where=db.text('dispatched_at IS NULL AND failed_at IS NULL')),
+    )
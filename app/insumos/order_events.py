@@ -0,0 +1,263 @@
+"""
+Order status changes pushed to the browsers with server-sent events.
+
+``change_order_status`` (insumos/outbox.py) queues each change on the
+session; once the transaction commits it reaches every worker through the
+broker selected by ``ORDER_EVENTS_BACKEND``:
+
+* ``postgres``: ``pg_notify`` on the ``order_status`` channel, sent inside the
+  committing transaction (Postgres only delivers it on commit). One listener
+  thread per worker holds a dedicated connection with ``LISTEN`` and fans the
+  notifications out to that worker's streams.
+* ``memory``: in-process fan-out only, for a single worker, tests and the
+  SQLite benchmarks.
+* ``off``: no endpoint, the tables are only loaded on demand.
+
+``/api/order_events`` streams ``{"id", "status", "estado"}`` messages: admins
+get every change, representantes only those of their own orders. The tables
+(static/assets/js/order_events.js) swap the status cell of the row in place,
+so a status change never re-runs the paginated search.
+
+Each stream holds a connection (and, with ``sync`` gunicorn workers, a whole
+worker, which gunicorn kills after its ``timeout``) while open, so the
+endpoint is off unless ``gunicorn_worker_class`` is ``gthread`` or ``gevent``;
+the tables are then only loaded on demand. Open streams are capped by the
+``streams`` class of insumos/admission.py. Streams end after
+``ORDER_EVENTS_STREAM_SECONDS`` and the browser reconnects.
+"""
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+from flask import Blueprint, Response, abort, current_app, session, stream_with_context
+from sqlalchemy import event, text
+
+from insumos.auth import ADMIN_EMAILS, token_required
+from insumos.extensions import db
+
+logger = logging.getLogger("insumos.order_events")
+
+CHANNEL = 'order_status'
+
+order_events_bp = Blueprint('order_events', __name__)
+
+
+class Subscription:
+    def __init__(self, broker, accepts, max_pending=100):
+        self._broker = broker
+        self.accepts = accepts
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=max_pending)
+
+    def put(self, change):
+        try:
+            self._queue.put_nowait(change)
+        except queue.Full:
+            # A client this far behind is told to reload its table instead of replaying every change
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class MemoryBroker:
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = []
+
+    def subscribe(self, accepts):
+        """
+        :param accepts: ``accepts(change)`` filters the changes this subscriber receives
+        """
+        subscription = Subscription(self, accepts)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def deliver(self, change):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.accepts(change):
+                subscription.put(change)
+
+    def publish_in_transaction(self, session, changes):
+        return False
+
+    def publish(self, changes):
+        for change in changes:
+            self.deliver(change)
+
+
+class PostgresBroker(MemoryBroker):
+    name = 'postgres'
+
+    def __init__(self, app, reconnect_delay=2.0):
+        super().__init__()
+        self.app = app
+        self.reconnect_delay = reconnect_delay
+        self._listener = None
+
+    def subscribe(self, accepts):
+        self._start_listener()
+        return super().subscribe(accepts)
+
+    def publish_in_transaction(self, session, changes):
+        for change in changes:
+            session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                            {'channel': CHANNEL, 'payload': json.dumps(change)})
+        return True
+
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen_forever, name='order-events-listener',
+                                                  daemon=True)
+                self._listener.start()
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("LISTEN %s connection lost, reconnecting", CHANNEL)
+            time.sleep(self.reconnect_delay)
+
+    def _listen(self):
+        # Out of the pool for good: a LISTEN connection must not be handed to a request afterwards
+        with self.app.app_context():
+            pooled = db.engine.raw_connection()
+        pooled.detach()
+        connection = pooled.driver_connection
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            while True:
+                if select.select([connection], [], [], 30) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    self.deliver(json.loads(notification.payload))
+        finally:
+            pooled.close()
+
+
+def create_broker(app):
+    backend = app.config['ORDER_EVENTS_BACKEND']
+    if backend is None:
+        postgres = app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql')
+        backend = PostgresBroker.name if postgres else MemoryBroker.name
+    if backend == PostgresBroker.name:
+        return PostgresBroker(app)
+    return MemoryBroker()
+
+
+def get_broker():
+    return current_app.extensions['order_events']
+
+
+def queue_change(order):
+    """
+    Publish the order's new status once the current transaction commits
+    """
+    db.session.info.setdefault('order_changes', []).append({
+        'id': order.id,
+        'user_email': order.user_email,
+        'status': order.status.name,
+        'estado': order.status.value,
+    })
+
+
+@event.listens_for(db.session, 'before_commit')
+def _publish_in_transaction(session):
+    changes = session.info.get('order_changes')
+    if changes and 'order_events' in current_app.extensions:
+        if get_broker().publish_in_transaction(session, changes):
+            del session.info['order_changes']
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_after_commit(session):
+    changes = session.info.pop('order_changes', None)
+    if changes and 'order_events' in current_app.extensions:
+        get_broker().publish(changes)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_changes(session, previous_transaction):
+    # A rolled back savepoint leaves the changes made before it in the transaction
+    if previous_transaction.parent is None:
+        session.info.pop('order_changes', None)
+
+
+def _sse(data, event_name=None):
+    lines = [f"event: {event_name}"] if event_name else []
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+@order_events_bp.route('/api/order_events')
+@token_required
+def order_events():
+    if 'order_events' not in current_app.extensions:
+        abort(404)
+    user_email = session.get('user_email')
+    if user_email in ADMIN_EMAILS:
+        def accepts(change):
+            return True
+    else:
+        def accepts(change):
+            return change['user_email'] == user_email
+
+    config = current_app.config
+
+    def stream():
+        deadline = time.monotonic() + config['ORDER_EVENTS_STREAM_SECONDS']
+        # Subscribed here, not in the view: a client gone before the first chunk never runs the finally
+        subscription = get_broker().subscribe(accepts)
+        try:
+            yield f"retry: {config['ORDER_EVENTS_RETRY_MS']}\n\n"
+            while time.monotonic() < deadline:
+                change = subscription.get(timeout=config['ORDER_EVENTS_KEEPALIVE'])
+                if subscription.overflowed:
+                    yield _sse('{}', 'reload')
+                    return
+                if change is None:
+                    # Keeps proxies from closing an idle stream and detects gone clients
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(json.dumps({'id': change['id'], 'status': change['status'],
+                                       'estado': change['estado']}))
+        finally:
+            subscription.close()
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def init_app(app):
+    if app.config['ORDER_EVENTS_BACKEND'] == 'off':
+        return
+    if os.getenv("gunicorn_worker_class", "sync") not in ('gthread', 'gevent'):
+        logger.warning("Order event streams enabled with %s workers: each open stream holds a worker",
+                       os.getenv("gunicorn_worker_class", "sync"))
+    app.extensions['order_events'] = create_broker(app)
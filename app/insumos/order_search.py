@@ -0,0 +1,158 @@
+"""
+Order search for the admin table.
+
+Every filter is optional and they all combine: ``build_order_search``
+compiles them into one statement over ``orders``. The representante name and
+customer team filters are a semi-join (``user_email IN (SELECT email FROM
+bayer_user WHERE ...)``) evaluated once inside that statement, instead of a
+list of emails collected by a first query and sent back, so the database
+starts from the matching users and reaches their orders through
+``ix_orders_user_email``. ``bayer_user`` is only joined to sort by its
+columns. ``representantes_by_email`` then loads the names and teams of a page
+in one query.
+
+Sort keys are checked against ``ORDER_SORTS``; the order id is always the
+last sort key so pages are stable. The matching indexes are declared on the
+models (``ix_orders_*``, ``ix_bayer_user_*`` and, on PostgreSQL, the trigram
+indexes used by the ``ILIKE '%...%'`` filters).
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import select
+
+from insumos.archive import orders_with_archive
+from insumos.extensions import db
+from insumos.models import BayerUser, Order, OrderStatus
+
+# Query string arguments of the filters
+FILTER_ARGS = ('query_representante_name', 'query_customer_team', 'query_status', 'query_institucion',
+               'fecha_desde', 'fecha_hasta', 'entrega_desde', 'entrega_hasta', 'total_min', 'total_max')
+
+# Sort key -> column of the order entity (or of the joined BayerUser)
+ORDER_SORTS = {
+    'id': lambda order: order.id,
+    'fecha_pedido': lambda order: order.creation_date,
+    'fecha_entrega': lambda order: order.estimated_delivery_date,
+    'total': lambda order: order.total,
+    'estado': lambda order: order.status,
+    'institucion': lambda order: order.delivery_institute,
+    'representante': lambda order: BayerUser.name,
+    'customer_team': lambda order: BayerUser.customer_team,
+}
+DEFAULT_SORT = 'id'
+SORT_DIRECTIONS = ('asc', 'desc')
+
+
+class InvalidOrderSearch(ValueError):
+    pass
+
+
+def _date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise InvalidOrderSearch(f"Fecha no válida en {name}: {value}")
+
+
+def _amount(value, name):
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite():
+        raise InvalidOrderSearch(f"Importe no válido en {name}: {value}")
+    return amount
+
+
+def _status(value, name):
+    if value == 'todos':
+        return None
+    try:
+        return OrderStatus[value]
+    except KeyError:
+        raise InvalidOrderSearch(f"Estado no válido: {value}")
+
+
+def _text(value, name):
+    return value.strip() or None
+
+
+# Sorts on BayerUser columns
+REPRESENTANTE_SORTS = ('representante', 'customer_team')
+
+# Filter argument -> (parse, apply(query, order, value))
+FILTERS = {
+    'query_representante_name': (_text, lambda query, order, value: query.filter(
+        order.user_email.in_(_representante_emails(BayerUser.name.ilike(f'%{value}%'))))),
+    'query_customer_team': (_text, lambda query, order, value: query.filter(
+        order.user_email.in_(_representante_emails(BayerUser.customer_team == value)))),
+    'query_status': (_status, lambda query, order, value: query.filter(order.status == value)),
+    'query_institucion': (_text, lambda query, order, value: query.filter(
+        order.delivery_institute.ilike(f'%{value}%'))),
+    'fecha_desde': (_date, lambda query, order, value: query.filter(order.creation_date >= value)),
+    # Inclusive: the whole "hasta" day
+    'fecha_hasta': (_date, lambda query, order, value: query.filter(
+        order.creation_date < value + timedelta(days=1))),
+    'entrega_desde': (_date, lambda query, order, value: query.filter(order.estimated_delivery_date >= value)),
+    'entrega_hasta': (_date, lambda query, order, value: query.filter(
+        order.estimated_delivery_date < value + timedelta(days=1))),
+    'total_min': (_amount, lambda query, order, value: query.filter(order.total >= value)),
+    'total_max': (_amount, lambda query, order, value: query.filter(order.total <= value)),
+}
+
+
+def _representante_emails(condition):
+    # Semi-join: evaluated once, then the orders are reached through ix_orders_user_email
+    return select(BayerUser.email).where(condition).scalar_subquery()
+
+
+def parse_order_filters(args):
+    """
+    ``{argument: value}`` of the filters present in ``args`` (a request's query string)
+    """
+    filters = {}
+    for name in FILTER_ARGS:
+        raw = args.get(name, '')
+        if not raw:
+            continue
+        parse, _ = FILTERS[name]
+        value = parse(raw, name)
+        if value is not None:
+            filters[name] = value
+    return filters
+
+
+def build_order_search(filters, sort=DEFAULT_SORT, direction='desc', include_archive=False):
+    """
+    Query of the matching orders, orders with status CREADA excluded
+    """
+    if sort not in ORDER_SORTS:
+        raise InvalidOrderSearch(f"Orden no válido: {sort}")
+    if direction not in SORT_DIRECTIONS:
+        raise InvalidOrderSearch(f"Dirección no válida: {direction}")
+
+    order = orders_with_archive() if include_archive else Order
+    query = db.session.query(order).filter(order.status != OrderStatus.CREADA)
+    if sort in REPRESENTANTE_SORTS:
+        query = query.outerjoin(BayerUser, BayerUser.email == order.user_email)
+    for name, value in filters.items():
+        _, apply = FILTERS[name]
+        query = apply(query, order, value)
+
+    sort_columns = [ORDER_SORTS[sort](order)]
+    if sort != 'id':
+        sort_columns.append(order.id)
+    return query.order_by(*[column.asc() if direction == 'asc' else column.desc() for column in sort_columns])
+
+
+def representantes_by_email(orders):
+    """
+    ``{email: (name, customer team)}`` of the orders' representantes, in one query
+    """
+    emails = {order.user_email for order in orders}
+    if not emails:
+        return {}
+    rows = (db.session.query(BayerUser.email, BayerUser.name, BayerUser.customer_team)
+            .filter(BayerUser.email.in_(emails)))
+    return {email: (name, customer_team) for email, name, customer_team in rows}
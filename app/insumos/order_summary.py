@@ -0,0 +1,162 @@
+"""
+Order counters per representante.
+
+``representante_order_summaries`` holds, for each representante, how many of
+their orders are in each status and how much they have spent (orders neither
+cancelled nor rejected), archived orders included, so the summary on their
+landing page is one read by primary key instead of a scan of their orders.
+
+Rows are kept in step by the writes themselves, in the same transaction:
+``record_new_order`` from ``add_order_record`` and ``record_status_change``
+from ``change_order_status`` (signatures, admin edits and cancellations). Each
+is one ``UPDATE`` of relative increments, so concurrent writers never
+overwrite each other. A representante without a row yet (orders from before
+the table existed) gets it computed from their orders on the first read or
+write.
+
+``flask rebuild-order-summaries`` recomputes every row from ``orders`` and
+``orders_archive``, to repair drift (orders changed with SQL by hand, a
+restored backup).
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+import click
+from sqlalchemy import delete, func, insert, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+
+from insumos.extensions import db
+from insumos.models import ArchivedOrder, Order, OrderStatus, RepresentanteOrderSummary
+
+# Status -> counter column
+STATUS_COLUMNS = {
+    OrderStatus.CREADA: 'created_count',
+    OrderStatus.EN_CAMINO: 'in_transit_count',
+    OrderStatus.ENTREGADO: 'delivered_count',
+    OrderStatus.CANCELADO: 'cancelled_count',
+    OrderStatus.RECHAZADA: 'rejected_count',
+}
+# Orders in these statuses do not count in total_spent
+VOID_STATUSES = (OrderStatus.CANCELADO, OrderStatus.RECHAZADA)
+
+
+def _spent(status, total):
+    return Decimal(0) if status in VOID_STATUSES else Decimal(str(total or 0))
+
+
+def record_new_order(order):
+    """
+    Count ``order`` (added to the session, not flushed yet) in its representante's summary; the
+    caller commits both
+    """
+    _apply(order.user_email, {order.status or OrderStatus.CREADA: 1},
+           _spent(order.status, order.total))
+
+
+def record_status_change(order, previous, status):
+    if previous is None or previous == status:
+        return
+    _apply(order.user_email, {previous: -1, status: 1},
+           _spent(status, order.total) - _spent(previous, order.total))
+
+
+def _apply(user_email, deltas, spent_delta):
+    table = RepresentanteOrderSummary.__table__
+    increments = {STATUS_COLUMNS[status]: table.c[STATUS_COLUMNS[status]] + delta
+                  for status, delta in deltas.items()}
+    statement = (update(table).where(table.c.user_email == user_email)
+                 .values(**increments, total_spent=table.c.total_spent + spent_delta,
+                         updated_at=datetime.utcnow()))
+    if db.session.execute(statement).rowcount:
+        return
+    # First change since the table exists: the row is computed from the orders, this one included
+    if not _insert_computed(user_email):
+        # Inserted meanwhile by a concurrent transaction, which cannot see this order yet
+        db.session.execute(statement)
+
+
+def _insert_computed(user_email):
+    """
+    Insert the summary of ``user_email`` computed from their orders (and the changes pending in
+    the session); False if it was inserted meanwhile
+    """
+    db.session.flush()
+    rows = compute_summaries(user_email)
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(RepresentanteOrderSummary.__table__), rows)
+    except IntegrityError:
+        return False
+    return True
+
+
+def compute_summaries(user_email=None):
+    """
+    Summary rows computed from ``orders`` and ``orders_archive``, of one representante or all
+    """
+    parts = []
+    for table in (Order.__table__, ArchivedOrder.__table__):
+        part = select(table.c.user_email, table.c.status, table.c.total)
+        if user_email is not None:
+            part = part.where(table.c.user_email == user_email)
+        parts.append(part)
+    orders = union_all(*parts).subquery('orders_all')
+    now = datetime.utcnow()
+    summaries = defaultdict(lambda: {**{column: 0 for column in STATUS_COLUMNS.values()},
+                                     'total_spent': Decimal(0), 'updated_at': now})
+    if user_email is not None:
+        # Even without orders, so the next change finds the row
+        summaries[user_email]
+    for email, status, count, total in db.session.execute(
+            select(orders.c.user_email, orders.c.status, func.count(), func.sum(orders.c.total))
+            .group_by(orders.c.user_email, orders.c.status)):
+        summary = summaries[email]
+        summary[STATUS_COLUMNS[status]] = count
+        summary['total_spent'] += _spent(status, total)
+    return [{'user_email': email, **summary} for email, summary in summaries.items()]
+
+
+def rebuild_order_summaries():
+    """
+    Replace every summary with one computed from the orders and commit. Returns the number of
+    representantes whose summary was missing or wrong.
+    """
+    table = RepresentanteOrderSummary.__table__
+    if db.session.get_bind().dialect.name == 'postgresql':
+        # Writers wait (their increments land after the rebuild) and the rebuild waits for the
+        # writers already in flight, so it counts their orders
+        db.session.execute(db.text(f'LOCK TABLE {table.name} IN EXCLUSIVE MODE'))
+    counters = [*STATUS_COLUMNS.values(), 'total_spent']
+    current = {row.user_email: tuple(row[1:]) for row in db.session.execute(
+        select(table.c.user_email, *[table.c[name] for name in counters]))}
+    rows = compute_summaries()
+    drifted = sum(1 for row in rows
+                  if current.pop(row['user_email'], None) != tuple(row[name] for name in counters))
+    db.session.execute(delete(table))
+    if rows:
+        db.session.execute(insert(table), rows)
+    db.session.commit()
+    # Rows left in current belonged to representantes without orders any more
+    return drifted + len(current)
+
+
+def order_summary(user_email):
+    """
+    The ``RepresentanteOrderSummary`` of ``user_email``
+    """
+    summary = db.session.get(RepresentanteOrderSummary, user_email)
+    if summary is None:
+        # Orders from before the table existed: counted once, then kept up to date by the writes
+        _insert_computed(user_email)
+        db.session.commit()
+        summary = db.session.get(RepresentanteOrderSummary, user_email)
+    return summary
+
+
+def init_app(app):
+    @app.cli.command('rebuild-order-summaries')
+    def rebuild_order_summaries_command():
+        """Recompute the order counters of every representante from the orders."""
+        drifted = rebuild_order_summaries()
+        click.echo(f"Order summaries rebuilt, {drifted} corrected.")
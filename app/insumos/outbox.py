@@ -0,0 +1,274 @@
+"""
+Transactional outbox for order notifications.
+
+Handlers never call Lambda (or anything else downstream) themselves.
+``change_order_status`` sets the status and adds an ``OutboxEvent`` to the
+same session, so the event is committed together with the change, or not at
+all. A dispatcher then delivers pending events in batches:
+
+* ``lambda``: one asynchronous ``Invoke`` of ``OUTBOX_LAMBDA_FUNCTION`` per
+  batch, with the payload ``{"events": [...]}``.
+* ``log``: writes each event as a JSON line to the ``insumos.outbox`` logger,
+  a local stub for development and the benchmarks.
+
+Delivery is at least once: a failed batch is retried with exponential backoff
+and jitter, up to ``OUTBOX_MAX_ATTEMPTS`` times, and every event carries an
+``idempotency_key`` so consumers can drop duplicates. Pending rows are claimed
+with ``FOR UPDATE SKIP LOCKED``, so several dispatchers (one per gunicorn
+worker, see gunicorn.conf.py, or ``flask dispatch-outbox``) never send the
+same batch at once.
+"""
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import event
+
+from insumos.extensions import db, lambda_client
+from insumos.instrumentation import Counter, Histogram, metrics
+from insumos.models import OrderStatus, OutboxEvent
+from insumos.order_events import queue_change
+from insumos.order_summary import record_status_change
+
+logger = logging.getLogger("insumos.outbox")
+
+ORDER_STATUS_CHANGED = 'order.status_changed'
+
+OUTBOX_EVENTS = metrics.register(Counter(
+    "insumos_outbox_events_total", "Outbox events by delivery result (delivered, retried, failed)", ("result",)))
+OUTBOX_BATCH_LATENCY = metrics.register(Histogram(
+    "insumos_outbox_batch_duration_seconds", "Time to deliver one outbox batch", ("sink",)))
+
+# Set after a commit that added events, so this worker's dispatcher does not wait for its next poll
+_wake = threading.Event()
+
+
+class OutboxDeliveryError(Exception):
+    pass
+
+
+def change_order_status(order, status, changed_by=None):
+    """
+    Set ``order.status``, update the representante's order summary and queue an
+    ``order.status_changed`` event in the current session. The caller commits all of it. Returns
+    the event, or None if the status did not change.
+
+    :param status: ``OrderStatus`` or its name, as sent by the forms
+    """
+    status = OrderStatus[status] if isinstance(status, str) else status
+    previous = order.status
+    order.status = status
+    if previous == status:
+        return None
+    # Also the retention clock of insumos/archive.py
+    order.last_updated = datetime.utcnow()
+    outbox_event = queue_event(ORDER_STATUS_CHANGED, order.id, {
+        'order_id': order.id,
+        'user_email': order.user_email,
+        'previous_status': previous.name if previous else None,
+        'status': status.name,
+        'changed_by': changed_by,
+        'changed_at': datetime.utcnow().isoformat(),
+    })
+    record_status_change(order, previous, status)
+    queue_change(order)
+    return outbox_event
+
+
+def queue_event(event_type, order_id, payload):
+    """
+    Add an event to the current session, delivered once the caller commits
+    """
+    outbox_event = OutboxEvent(
+        event_type=event_type,
+        order_id=order_id,
+        idempotency_key=uuid.uuid4().hex,
+        payload=payload)
+    db.session.add(outbox_event)
+    db.session.info['outbox_pending'] = True
+    return outbox_event
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_dispatcher(session):
+    if session.info.pop('outbox_pending', False):
+        _wake.set()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_pending(session, previous_transaction):
+    # Events added before a rolled back savepoint are still in the transaction
+    if previous_transaction.parent is None:
+        session.info.pop('outbox_pending', None)
+
+
+class LambdaSink:
+    name = 'lambda'
+
+    def __init__(self, client, function_name):
+        self.client = client
+        self.function_name = function_name
+
+    def send(self, messages):
+        response = self.client.invoke(
+            FunctionName=self.function_name,
+            InvocationType='Event',
+            Payload=json.dumps({'events': messages}).encode('utf-8'))
+        if response.get('FunctionError') or response.get('StatusCode', 0) >= 300:
+            raise OutboxDeliveryError(f"Lambda {self.function_name} answered {response.get('StatusCode')} "
+                                      f"{response.get('FunctionError') or ''}".strip())
+
+
+class LogSink:
+    name = 'log'
+
+    def send(self, messages):
+        for message in messages:
+            logger.info(json.dumps({"event": "outbox_delivery", **message}))
+
+
+def create_sink(app):
+    if app.config['OUTBOX_SINK'] == LambdaSink.name:
+        return LambdaSink(lambda_client, app.config['OUTBOX_LAMBDA_FUNCTION'])
+    return LogSink()
+
+
+def _message(outbox_event):
+    return {
+        'id': outbox_event.id,
+        'type': outbox_event.event_type,
+        'idempotency_key': outbox_event.idempotency_key,
+        'created_at': outbox_event.created_at.isoformat(),
+        'payload': outbox_event.payload,
+    }
+
+
+class OutboxDispatcher:
+    def __init__(self, sink, batch_size=25, max_attempts=8, backoff_base=2.0, backoff_max=600.0):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def dispatch_batch(self):
+        """
+        Deliver one batch of due events; returns how many were claimed
+        """
+        now = datetime.utcnow()
+        events = (OutboxEvent.query
+                  .filter(OutboxEvent.dispatched_at.is_(None), OutboxEvent.failed_at.is_(None),
+                          OutboxEvent.available_at <= now)
+                  .order_by(OutboxEvent.available_at, OutboxEvent.id)
+                  .limit(self.batch_size)
+                  .with_for_update(skip_locked=True)
+                  .all())
+        if not events:
+            db.session.rollback()
+            return 0
+
+        start = time.perf_counter()
+        try:
+            self.sink.send([_message(outbox_event) for outbox_event in events])
+        except Exception as e:
+            logger.warning("Outbox batch of %s events failed: %s", len(events), e)
+            for outbox_event in events:
+                self._retry_later(outbox_event, e, now)
+        else:
+            for outbox_event in events:
+                outbox_event.attempts += 1
+                outbox_event.dispatched_at = now
+            OUTBOX_EVENTS.inc(('delivered',), len(events))
+        finally:
+            OUTBOX_BATCH_LATENCY.observe((self.sink.name,), time.perf_counter() - start)
+        db.session.commit()
+        return len(events)
+
+    def _retry_later(self, outbox_event, error, now):
+        outbox_event.attempts += 1
+        outbox_event.last_error = f"{type(error).__name__}: {error}"[:1000]
+        if outbox_event.attempts >= self.max_attempts:
+            outbox_event.failed_at = now
+            OUTBOX_EVENTS.inc(('failed',))
+            return
+        # Full jitter, so events failed together are not all retried at the same moment
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (outbox_event.attempts - 1))
+        outbox_event.available_at = now + timedelta(seconds=random.uniform(delay / 2, delay))
+        OUTBOX_EVENTS.inc(('retried',))
+
+    def run(self, poll_interval, stop=None):
+        """
+        Dispatch until ``stop`` is set; sleeps ``poll_interval`` seconds (or until woken by a commit)
+        when there is nothing due
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                claimed = self.dispatch_batch()
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+                db.session.rollback()
+                claimed = 0
+            if claimed < self.batch_size:
+                _wake.wait(poll_interval)
+                _wake.clear()
+
+
+def create_dispatcher(app):
+    return OutboxDispatcher(
+        create_sink(app),
+        batch_size=app.config['OUTBOX_BATCH_SIZE'],
+        max_attempts=app.config['OUTBOX_MAX_ATTEMPTS'],
+        backoff_max=app.config['OUTBOX_BACKOFF_MAX'])
+
+
+def start_background_dispatcher(app):
+    """
+    Daemon thread dispatching in this process (gunicorn.conf.py starts one per worker)
+    """
+    dispatcher = create_dispatcher(app)
+
+    def target():
+        with app.app_context():
+            dispatcher.run(app.config['OUTBOX_POLL_INTERVAL'])
+
+    thread = threading.Thread(target=target, name='outbox-dispatcher', daemon=True)
+    thread.start()
+    return thread
+
+
+def init_app(app):
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+        logger.setLevel(logging.INFO)
+
+    @app.cli.command('dispatch-outbox')
+    @click.option('--once', is_flag=True, help='Deliver the events due now and exit')
+    def dispatch_outbox(once):
+        """Deliver pending outbox events."""
+        dispatcher = create_dispatcher(current_app)
+        if not once:
+            dispatcher.run(current_app.config['OUTBOX_POLL_INTERVAL'])
+            return
+        delivered = 0
+        while True:
+            claimed = dispatcher.dispatch_batch()
+            delivered += claimed
+            if claimed < dispatcher.batch_size:
+                break
+        click.echo(f"{delivered} outbox events processed.")
+
+    @app.cli.command('cleanup-outbox')
+    @click.option('--days', default=30, show_default=True, help='Keep delivered events this many days')
+    def cleanup_outbox(days):
+        """Delete delivered outbox events."""
+        removed = OutboxEvent.query.filter(
+            OutboxEvent.dispatched_at < datetime.utcnow() - timedelta(days=days)).delete(synchronize_session=False)
+        db.session.commit()
+        click.echo(f"{removed} delivered outbox events deleted.")
@@ -0,0 +1,285 @@
+"""
+Representante views: insumo catalog, order creation and the representante's orders.
+"""
+import re
+import json
+from datetime import datetime
+
+from flask import Blueprint, current_app, render_template, request, redirect, session, jsonify, make_response, abort
+
+from insumos.admin import search_query_insumos
+from insumos.archive import archived_ids, orders_with_archive
+from insumos.auth import token_required, requires_representante_email
+from insumos.extensions import cache, db, storage
+from insumos.storage import StorageObjectNotFound
+from insumos.images import (SIGNATURE_SIZES, make_variant, record_signature_image, signature_original,
+                            variant_cache, variant_key)
+from insumos.models import BayerUser, Insumo, OrderStatus, Signature, Order, Vendor
+from insumos.order_summary import order_summary, record_new_order
+from insumos.outbox import change_order_status
+from insumos.stock import queue_low_stock_alerts, reserve_stock
+
+representante_bp = Blueprint('representante', __name__)
+
+# Rendered pages of the representante insumo table; changed by any insumo or vendor write
+insumo_table_cache = cache.namespace('insumo_tables', invalidated_by=(Insumo, Vendor))
+
+
+@representante_bp.route('/representante', methods=["GET"])
+@token_required
+@requires_representante_email()
+def representante():
+    return render_template('representante/representante_index.html', admin_user=False)
+
+
+@representante_bp.route('/image/<int:signature_id>')
+@token_required
+def get_image(signature_id):
+    """
+    ``?size=thumb|small|full`` (default full). Revalidations are answered from the stored hash
+    without reading the image; thumb/small are served with a strong ETag, full redirects to storage
+    (or is served from the legacy column until ``flask move-signatures`` runs).
+    """
+    size = request.args.get('size', 'full')
+    if size not in SIGNATURE_SIZES:
+        abort(404)
+    image = signature_image_info(signature_id)
+    if image is None:
+        abort(404)
+    if image.content_hash is None:
+        record_signature_image(db.session.get(Signature, signature_id))
+        db.session.commit()
+        image = signature_image_info(signature_id)
+
+    etag = f'{image.content_hash}-{size}'
+    cache_control = f"private, max-age={current_app.config['SIGNATURE_CACHE_MAX_AGE']}"
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    if size == 'full' and image.signature_key:
+        response = redirect(storage.url(image.signature_key, content_type=image.content_type))
+        # The presigned URL expires, the redirect must not be reused after that
+        response.headers['Cache-Control'] = f'private, max-age={storage.url_expires // 2}'
+        return response
+
+    if size == 'full':
+        # Not moved to object storage yet (flask move-signatures)
+        data, mimetype = legacy_signature_image(signature_id), image.content_type
+    else:
+        data, mimetype = signature_variant(signature_id, image, size), 'image/png'
+    response = make_response(data)
+    response.mimetype = mimetype
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def signature_image_info(signature_id):
+    # Only the small columns: the legacy signature_image blob is never read here
+    return (db.session.query(Signature.content_hash, Signature.content_type, Signature.signature_key)
+            .filter(Signature.id == signature_id).first())
+
+
+def legacy_signature_image(signature_id):
+    return db.session.query(Signature.signature_image).filter(Signature.id == signature_id).scalar()
+
+
+def signature_variant(signature_id, image, size):
+    key = variant_key(image.content_hash, size)
+    data = variant_cache.get(key)
+    if data is None:
+        try:
+            data = storage.get(key)
+        except StorageObjectNotFound:
+            original = signature_original(
+                image.signature_key, None if image.signature_key else legacy_signature_image(signature_id))
+            data = make_variant(original, size)
+            storage.put(key, data, 'image/png')
+        variant_cache.set(key, data)
+    return data
+
+
+@representante_bp.route('/search_insumos_representante', methods=['GET'])
+@token_required
+def search_insumos_representante():
+    query = request.args.get('query', '')
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+    insumos = search_query_insumos(query=query, per_page=per_page, page=page)
+    return render_template(
+        'representante/insumos_table_representante.html',
+        insumos=insumos.items,
+        pagination=insumos)
+
+
+@representante_bp.route('/api/insumos_representante', methods=["GET"])
+@token_required
+@requires_representante_email()
+def insumos_representante_list():
+    page = request.args.get('page', 1, type=int)
+
+    def render_page():
+        per_page = 10  # Number of records per page
+        pagination = Insumo.query.order_by(Insumo.last_updated.desc()).paginate(
+            page=page, per_page=per_page, max_per_page=10, count=True, error_out=False)
+        return render_template('representante/insumos_table_representante.html',
+                               insumos=pagination.items,
+                               pagination=pagination)
+
+    # The table is the same for every representante: rendered once per catalog change
+    return insumo_table_cache.get_or_set(f'representante:{page}', render_page)
+
+
+@representante_bp.route('/api/order_summary_representante', methods=["GET"])
+@token_required
+@requires_representante_email()
+def order_summary_representante():
+    # One row by primary key, kept up to date by the order writes (see insumos/order_summary.py)
+    return render_template('representante/order_summary.html',
+                           summary=order_summary(session.get('user_email')))
+
+
+@representante_bp.route('/pedidos_representante', methods=["GET"])
+@token_required
+@requires_representante_email()
+def pedidos_representante():
+    return render_template('representante/orders_representante.html',
+                           user_admin=False)
+
+
+@representante_bp.route('/api/orders_representante', methods=["GET"])
+@token_required
+@requires_representante_email()
+def orders_representante_list():
+    email = session.get("user_email")
+    include_archive = request.args.get('include_archive') == 'on'
+    page = request.args.get('page', 1, type=int)
+    per_page = 10  # Number of records per page
+    orders_source = orders_with_archive() if include_archive else Order
+    pagination = (db.session.query(orders_source).filter(orders_source.user_email == email)
+                  .order_by(orders_source.id.desc())
+                  .paginate(page=page, per_page=per_page, max_per_page=10, count=True, error_out=False))
+    orders = pagination.items
+    archived = archived_ids([order.id for order in orders]) if include_archive else set()
+    new_dict_orders_list_representante = []
+    bayer_user = BayerUser.query.filter_by(email=email).first()
+    for order in orders:
+        new_dict_orders_list_representante.append({
+            "id": order.id,
+            "representante": bayer_user.name,
+            "institucion_entrega": order.delivery_institute,
+            "customer_team": bayer_user.customer_team,
+            "total": order.total,
+            "fecha_pedido": order.creation_date,
+            "fecha_entrega": datetime.strftime(order.estimated_delivery_date, "%d-%m-%Y")
+            if order.estimated_delivery_date else "",
+            "estado": order.status.value,
+            "direccion_entrega": order.delivery_information,
+            "archivado": order.id in archived
+        })
+    return render_template('representante/orders_table_representante.html',
+                           orders=new_dict_orders_list_representante,
+                           pagination=pagination,
+                           include_archive=include_archive)
+
+
+@representante_bp.route('/api/generate_insumos_list_html', methods=["GET"])
+@token_required
+def generate_insumos_list_html():
+    lista_insumos_id_raw = request.args.get('insumos_id_list')
+    insumos_ids = [int(insumo_id) for insumo_id in json.loads(lista_insumos_id_raw)]
+    filtered_insumos = Insumo.query.filter(Insumo.id.in_(insumos_ids)).all()
+    user_email = session.get("user_email")
+    user_signature = Signature.query.filter_by(user_email=user_email).first()
+    return render_template(
+        'representante/modal_fields_get_insumos_list.html',
+        insumos=filtered_insumos,
+        user_signature=user_signature
+    )
+
+
+@representante_bp.route('/api/cancel_order', methods=["POST"])
+@token_required
+@requires_representante_email()
+def cancel_order():
+    order_id = request.args.get('order_id')
+    order = Order.query.get_or_404(order_id)
+    change_order_status(order, OrderStatus.CANCELADO, changed_by=session.get('user_email'))
+    db.session.commit()
+    return jsonify({"message": "Pedido cancelado!"})
+
+
+@representante_bp.route('/add_order_record', methods=["POST"])
+@token_required
+def add_order_record():
+    """
+    Adding an Order record to the datatabase
+    """
+    # Counter of quantity_insumo
+    user_email = session.get("user_email")
+    medico_solicitante = request.form.get('medico_solicitante')
+    posicion_medico = request.form.get('posicion_medico')
+    nombre_institucion = request.form.get('nombre_institucion')
+    direccion_entrega = request.form.get('direccion_entrega')
+
+    # Filtrar los valores que contienen 'quantity_insumo'
+    values = [key for key in request.form.keys()]
+    quantity_values = [value for value in values if 'quantity_insumo' in value]
+
+    # Extraer los números de los valores filtrados
+    quantity_numbers = [re.search(r'\d+', value).group() for value in quantity_values]
+
+    insumos_for_order = []
+    low_stock = []
+    try:
+        total_cost = 0
+        for insumoid in quantity_numbers:
+            insumoid = int(insumoid)
+            insumo = Insumo.query.filter_by(id=insumoid).first()
+            quantity_insumo_ordered = int(request.form.get(f"quantity_insumo_{insumoid}"))
+            name_insumo_ordered = request.form.get(f"name_{insumoid}")
+            # updating insumo stock
+            if reserve_stock(insumo, quantity_insumo_ordered):
+                low_stock.append(insumo)
+            total_cost += (insumo.unit_cost * quantity_insumo_ordered)
+            insumos_for_order.append(
+                {
+                    "id": insumo.id,
+                    "name": name_insumo_ordered,
+                    "quantity": quantity_insumo_ordered,
+                    "cost": insumo.unit_cost
+                }
+            )
+
+        order = Order(
+            user_email=user_email,
+            status=OrderStatus.CREADA,
+            delivery_institute=nombre_institucion,
+            doctor_name=medico_solicitante,
+            doctor_position=posicion_medico,
+            total=total_cost,
+            data=insumos_for_order,
+            delivery_information=direccion_entrega
+        )
+        db.session.add(order)
+        record_new_order(order)
+        if low_stock:
+            db.session.flush()
+            queue_low_stock_alerts(order, low_stock)
+        db.session.commit()
+        return render_template(
+            'representante/button_go_to_order_detail.html',
+            order_id=order.id
+        )
+    except Exception as e:
+        # Stock reserved for the items before the failing one is given back
+        db.session.rollback()
+        message = str(e)
+        error = True
+        return render_template(
+            "custom_alert_message.html",
+            message=message,
+            error=error)
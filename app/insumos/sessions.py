@@ -0,0 +1,287 @@
+"""
+Server-side sessions.
+
+The session data (Cognito access/id tokens and the user email, several KB)
+stays on the server; the cookie only carries an opaque, signed session id.
+htmx partials and static assets therefore upload a few dozen bytes instead of
+the whole signed payload, and a forged or unknown id is rejected by the
+signature check before the store is queried.
+
+Stores:
+
+* ``sql`` (default): the ``sessions`` table, with an index on ``expires_at``
+  for the cleanup. Reads and writes use their own short connection, so they
+  never commit or roll back the view's ``db.session`` work.
+* ``file``: one file per session under ``SESSION_FILE_DIR`` (local runs).
+* ``memory``: a dict in the worker process (tests and benchmarks).
+* ``cookie``: Flask's signed cookie session, as before.
+
+A session is loaded once per request and written back only when it was
+modified, or when less than half of its lifetime is left; requests under the
+static path do not load it at all. Writing the user or access token (a login)
+issues a new id and deletes the old record. Expired sessions are removed in
+batches by ``flask cleanup-sessions``.
+"""
+import os
+import secrets
+import tempfile
+import threading
+from datetime import datetime
+
+import click
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, select
+from werkzeug.datastructures import CallbackDict
+
+from insumos.extensions import db
+
+serializer = TaggedJSONSerializer()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    # Writing any of these (a login) issues a new sid, see ServerSideSessionInterface.save_session
+    AUTH_KEYS = ('user_email', 'access_token')
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.loaded_auth = self.auth_values()
+
+    def auth_values(self):
+        return tuple(dict.get(self, key) for key in self.AUTH_KEYS)
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class MemorySessionStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def load(self, sid):
+        with self._lock:
+            record = self._sessions.get(sid)
+        if record is None or record[1] <= datetime.utcnow():
+            return None
+        return serializer.loads(record[0]), record[1]
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._sessions[sid] = (serializer.dumps(data), expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def cleanup(self, batch_size=1000):
+        now = datetime.utcnow()
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+
+class FileSessionStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def load(self, sid):
+        try:
+            with open(self._path(sid), encoding='utf-8') as f:
+                expires_at, payload = f.read().split('\n', 1)
+        except (OSError, ValueError):
+            return None
+        expires_at = datetime.fromisoformat(expires_at)
+        if expires_at <= datetime.utcnow():
+            return None
+        return serializer.loads(payload), expires_at
+
+    def save(self, sid, data, expires_at):
+        # Write then rename, so a concurrent request never reads a half written file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(expires_at.isoformat() + '\n' + serializer.dumps(data))
+        os.replace(tmp_path, self._path(sid))
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except FileNotFoundError:
+            pass
+
+    def cleanup(self, batch_size=1000):
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp-'):
+                continue
+            if self.load(name) is None:
+                self.delete(name)
+                removed += 1
+        return removed
+
+
+class SQLSessionStore:
+    def __init__(self):
+        from insumos.models import UserSession
+        self.table = UserSession.__table__
+
+    def load(self, sid):
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.data, self.table.c.expires_at)
+                .where(self.table.c.sid == sid, self.table.c.expires_at > datetime.utcnow())
+            ).first()
+        if row is None:
+            return None
+        return serializer.loads(row.data), row.expires_at
+
+    def save(self, sid, data, expires_at):
+        values = {'data': serializer.dumps(data), 'expires_at': expires_at}
+        with db.engine.begin() as conn:
+            updated = conn.execute(self.table.update().where(self.table.c.sid == sid).values(**values))
+            if not updated.rowcount:
+                conn.execute(self.table.insert().values(sid=sid, **values))
+
+    def delete(self, sid):
+        with db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.sid == sid))
+
+    def cleanup(self, batch_size=1000):
+        """
+        Delete expired sessions ``batch_size`` rows per transaction, so the cleanup never holds
+        long locks on the table the login and every request use
+        """
+        removed = 0
+        while True:
+            expired = (select(self.table.c.sid)
+                       .where(self.table.c.expires_at <= datetime.utcnow())
+                       .limit(batch_size)
+                       .scalar_subquery())
+            with db.engine.begin() as conn:
+                deleted = conn.execute(delete(self.table).where(self.table.c.sid.in_(expired))).rowcount
+            removed += deleted
+            if deleted < batch_size:
+                return removed
+
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='insumos-session')
+
+    def open_session(self, app, request):
+        if app.static_url_path and request.path.startswith(app.static_url_path + '/'):
+            return self.make_null_session(app)
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            record = self.store.load(sid) if sid else None
+            if record is not None:
+                data, expires_at = record
+                return ServerSession(data, sid=sid, expires_at=expires_at)
+        # Ids not found in the store are never reused: a new one is issued on the first write
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+                response.vary.add("Cookie")
+            return
+
+        lifetime = app.permanent_session_lifetime
+        now = datetime.utcnow()
+        stale = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not session.modified and not stale:
+            return
+
+        if session.sid is not None and session.auth_values() != session.loaded_auth:
+            # Session fixation: an id planted before the login must not end up holding the user's tokens
+            self.store.delete(session.sid)
+            session.sid = None
+        new_sid = session.sid is None
+        if new_sid:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires_at = now + lifetime
+        self.store.save(session.sid, dict(session), session.expires_at)
+
+        if new_sid or session.permanent:
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=httponly,
+                domain=domain,
+                path=path,
+                secure=secure,
+                samesite=samesite,
+            )
+            response.vary.add("Cookie")
+
+
+def create_store(app):
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'sql':
+        return SQLSessionStore()
+    if backend == 'file':
+        return FileSessionStore(app.config['SESSION_FILE_DIR'])
+    if backend == 'memory':
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+
+def init_app(app):
+    if app.config['SESSION_BACKEND'] == 'cookie':
+        app.session_interface = SecureCookieSessionInterface()
+        return
+    app.session_interface = ServerSideSessionInterface(create_store(app))
+
+    @app.cli.command('cleanup-sessions')
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows deleted per transaction')
+    def cleanup_sessions(batch_size):
+        """Delete expired server-side sessions."""
+        removed = app.session_interface.store.cleanup(batch_size)
+        click.echo(f"{removed} expired sessions deleted.")
@@ -0,0 +1,98 @@
+"""
+Insumo stock: reservations for new orders and low stock alerts.
+
+``reserve_stock`` takes the ordered quantity off an insumo with one
+conditional ``UPDATE ... WHERE stock >= quantity``, so two orders racing for
+the last units cannot drive the stock negative (``ck_insumos_stock_non_negative``
+backs it in the database).
+
+An insumo is low on stock when ``stock <= reorder_threshold``. The check is
+incremental: the reservation that crosses the threshold queues one
+``insumo.low_stock`` event in the outbox, in the order's own transaction, and
+nothing ever scans the catalog for it. The admin list and badge read the
+partial index ``ix_insumos_low_stock``, which only holds the insumos at risk.
+"""
+import logging
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from insumos.extensions import db
+from insumos.instrumentation import Counter, metrics
+from insumos.models import Insumo
+from insumos.outbox import queue_event
+
+logger = logging.getLogger("insumos.stock")
+
+INSUMO_LOW_STOCK = 'insumo.low_stock'
+
+LOW_STOCK_ALERTS = metrics.register(Counter(
+    "insumos_low_stock_alerts_total", "Insumos that fell to their reorder threshold", ()))
+
+
+class InsufficientStockError(ValueError):
+    pass
+
+
+def low_stock_condition():
+    # Same predicate as ix_insumos_low_stock, so the planner can use the partial index
+    return Insumo.stock <= Insumo.reorder_threshold
+
+
+def reserve_stock(insumo, quantity):
+    """
+    Take ``quantity`` units off ``insumo`` in the current transaction.
+    Returns True if this reservation took the insumo to its reorder threshold.
+    """
+    if quantity <= 0:
+        raise InsufficientStockError(f"Cantidad no válida para {insumo.name}: {quantity}")
+    row = db.session.execute(
+        update(Insumo)
+        .where(Insumo.id == insumo.id, Insumo.stock >= quantity)
+        .values(stock=Insumo.stock - quantity)
+        .returning(Insumo.stock, Insumo.reorder_threshold)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        db.session.refresh(insumo, ['stock'])
+        raise InsufficientStockError(
+            f"No hay stock suficiente de {insumo.name}: quedan {insumo.stock}, se pidieron {quantity}")
+    stock, reorder_threshold = row
+    set_committed_value(insumo, 'stock', stock)
+    return stock + quantity > reorder_threshold >= stock
+
+
+def queue_low_stock_alerts(order, insumos):
+    """
+    Queue one ``insumo.low_stock`` event per insumo, for the order that crossed the threshold
+    """
+    for insumo in insumos:
+        queue_event(INSUMO_LOW_STOCK, order.id, {
+            'insumo_id': insumo.id,
+            'name': insumo.name,
+            'stock': insumo.stock,
+            'reorder_threshold': insumo.reorder_threshold,
+            'vendor_id': insumo.vendor_id,
+            'vendor_name': insumo.vendor.name,
+            'order_id': order.id,
+        })
+        logger.warning("Insumo %s (%s) at %s units, reorder threshold %s",
+                       insumo.id, insumo.name, insumo.stock, insumo.reorder_threshold)
+    LOW_STOCK_ALERTS.inc((), len(insumos))
+
+
+def low_stock_insumos(limit=100):
+    """
+    Insumos at or below their reorder threshold with their vendor, the furthest below first
+    """
+    return (Insumo.query
+            .options(joinedload(Insumo.vendor))
+            .filter(low_stock_condition())
+            .order_by((Insumo.stock - Insumo.reorder_threshold).asc(), Insumo.id)
+            .limit(limit)
+            .all())
+
+
+def low_stock_count():
+    return db.session.query(func.count(Insumo.id)).filter(low_stock_condition()).scalar()
@@ -0,0 +1,148 @@
+"""
+Object storage for generated letters and signature images.
+
+Only the object key is kept in the database. Downloads are redirects to a
+short-lived URL, so the PDF and image bytes are served by S3 and never pass
+through a gunicorn worker.
+
+Backends:
+
+* ``s3``: the ``bucket_name`` bucket through the shared ``s3`` boto3 client
+  (a moto or in-memory client can be registered in ``aws_clients`` for tests).
+* ``local``: files under ``STORAGE_LOCAL_DIR`` (by default ``storage/`` in the
+  instance folder, never a temporary directory), served by the signed
+  ``/storage/<token>`` route. Meant for local runs and tests.
+"""
+import os
+
+from flask import Blueprint, abort, current_app, send_file, url_for
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+storage_bp = Blueprint('storage', __name__)
+
+
+class StorageObjectNotFound(Exception):
+    pass
+
+
+class S3Storage:
+    def __init__(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+
+    def put(self, key, data, content_type):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+
+    def get(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            raise StorageObjectNotFound(key)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def url(self, key, expires_in, content_type=None, filename=None):
+        # Signed locally by botocore: no request to S3 is made here
+        params = {'Bucket': self.bucket, 'Key': key}
+        if content_type:
+            params['ResponseContentType'] = content_type
+        if filename:
+            params['ResponseContentDisposition'] = f'inline; filename={filename}'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+
+class LocalStorage:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.directory, key))
+        if not path.startswith(os.path.abspath(self.directory) + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key, data, content_type):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise StorageObjectNotFound(key)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key, expires_in, content_type=None, filename=None):
+        token = _url_serializer().dumps({'key': key, 'type': content_type, 'filename': filename})
+        return url_for('storage.local_object', token=token)
+
+
+def _url_serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='insumos-storage')
+
+
+class ObjectStorage:
+    """
+    Storage facade bound by ``create_app``; the backend is picked from ``STORAGE_BACKEND``
+    """
+
+    def __init__(self, s3_client):
+        self._s3_client = s3_client
+        self.backend = None
+        self.url_expires = 300
+
+    def init_app(self, app):
+        backend = app.config['STORAGE_BACKEND']
+        if backend == 's3':
+            self.use(S3Storage(self._s3_client, app.config['S3_BUCKET_NAME']))
+        elif backend == 'local':
+            self.use(LocalStorage(app.config['STORAGE_LOCAL_DIR'] or os.path.join(app.instance_path, 'storage')))
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+        self.url_expires = app.config['STORAGE_URL_EXPIRES']
+
+    def use(self, backend):
+        """
+        Replace the backend (e.g. a ``LocalStorage`` on a temporary directory in tests)
+        """
+        self.backend = backend
+
+    def put(self, key, data, content_type):
+        self.backend.put(key, data, content_type)
+        return key
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def url(self, key, content_type=None, filename=None):
+        return self.backend.url(key, self.url_expires, content_type=content_type, filename=filename)
+
+
+@storage_bp.route('/storage/<token>')
+def local_object(token):
+    from insumos.extensions import storage
+    if not isinstance(storage.backend, LocalStorage):
+        abort(404)
+    try:
+        data = _url_serializer().loads(token, max_age=storage.url_expires)
+    except BadSignature:
+        abort(403)
+    try:
+        path = storage.backend._path(data['key'])
+    except ValueError:
+        abort(404)
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype=data['type'], download_name=data['filename'])
@@ -0,0 +1,117 @@
+"""
+Worker warm-up.
+
+Without it the first requests served by each gunicorn worker pay for
+compiling the Jinja templates, opening database connections, building the
+boto3 clients (loading their service models) and loading the ReportLab fonts
+on the first PDF. ``warm_up`` does that work up front; gunicorn.conf.py runs it
+in ``post_worker_init``, before the worker accepts requests. It can be turned
+off with ``warmup_enabled=false`` and run by hand with ``flask warmup``.
+
+Compiled templates are also kept in a Jinja bytecode cache on disk
+(``JINJA_BYTECODE_CACHE_DIR``), shared by the workers and by restarts, so
+after the first start templates are loaded instead of compiled.
+"""
+import json
+import logging
+import os
+import time
+from datetime import date
+
+import click
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import text
+
+from insumos.extensions import db, aws_clients
+
+logger = logging.getLogger("insumos.warmup")
+
+
+def init_app(app):
+    """
+    Must run before anything renders a template: the Jinja environment is created on first use
+    """
+    if app.config['JINJA_BYTECODE_CACHE']:
+        os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+        app.jinja_options = {
+            **app.jinja_options,
+            'bytecode_cache': FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR']),
+        }
+
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+        logger.setLevel(logging.INFO)
+
+    @app.cli.command('warmup')
+    def warmup_command():
+        """Run the worker warm-up and print how long each step took."""
+        for step, seconds in warm_up(app).items():
+            click.echo(f"{step:12} {seconds * 1000:8.1f} ms")
+
+
+def warm_up(app):
+    """
+    Returns ``{step: seconds}``. A failing step is logged and skipped: warm-up must never keep a
+    worker from starting.
+    """
+    timings = {}
+    with app.app_context():
+        for step, function in (
+                ('templates', _compile_templates),
+                ('database', _open_connections),
+                ('aws_clients', _build_aws_clients),
+                ('letters', _render_throwaway_letter),
+        ):
+            start = time.perf_counter()
+            try:
+                function(app)
+            except Exception:
+                logger.exception("Warm-up step %s failed", step)
+            timings[step] = time.perf_counter() - start
+    timings['total'] = sum(timings.values())
+    logger.info(json.dumps({
+        "event": "warmup",
+        **{f"{step}_ms": round(seconds * 1000, 1) for step, seconds in timings.items()},
+    }))
+    return timings
+
+
+def _compile_templates(app):
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        app.jinja_env.get_template(name)
+
+
+def _open_connections(app):
+    # Checked out at the same time so the pool really holds several open connections afterwards
+    connections = []
+    try:
+        for _ in range(app.config['WARMUP_DB_CONNECTIONS']):
+            connection = db.engine.connect()
+            connection.execute(text("SELECT 1"))
+            connections.append(connection)
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def _build_aws_clients(app):
+    for service_name in ('cognito-idp', 's3'):
+        aws_clients.client(service_name)
+
+
+def _render_throwaway_letter(app):
+    from insumos.letters import get_bayer_logo
+    from insumos.letter_renderers import get_renderer
+    context = {
+        'order_id': 0,
+        'actual_date': date.today(),
+        'insumos_order': [{'name': 'Insumo', 'quantity': 1, 'cost': 1.0}],
+        'medico_solicitante': '',
+        'posicion_medico': '',
+        'nombre_institucion': '',
+        'nombre_representante': '',
+        'logo': get_bayer_logo(),
+        'doctor_signature': None,
+    }
+    # Not through render_letter: the throwaway render must not show up in the PDF latency metrics
+    get_renderer(app.config['LETTER_RENDERER']).render_request_letter(context)
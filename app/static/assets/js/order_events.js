@@ -0,0 +1,33 @@
+// Order status changes pushed by /api/order_events (see insumos/order_events.py): only the status
+// cell of the changed row is replaced, the table itself is not fetched again.
+(function () {
+    const STATUS_COLORS = {'Entregado': '#118632', 'Cancelado': '#D71A1AF2', 'En camino': '#FF8832', 'Creado': 'blue'};
+    // Same rule as orders_table_representante.html: these orders can no longer be cancelled
+    const NOT_CANCELLABLE = ['EN_CAMINO', 'ENTREGADO'];
+
+    function update_row(change) {
+        const row = document.getElementById('order-row-' + change.id);
+        if (!row) {
+            return;
+        }
+        const color = STATUS_COLORS[change.estado] || 'black';
+        const cell = row.querySelector('.order-status-cell');
+        cell.style.color = color;
+        cell.querySelector('button').style.backgroundColor = color;
+        cell.querySelector('b').textContent = change.estado;
+        const cancel_cell = row.querySelector('.order-cancel-cell');
+        if (cancel_cell && NOT_CANCELLABLE.includes(change.status)) {
+            cancel_cell.innerHTML = '';
+        }
+        row.classList.add('table-info');
+        setTimeout(() => row.classList.remove('table-info'), 1500);
+    }
+
+    window.listen_order_events = function (events_url, table_selector, reload_url) {
+        const source = new EventSource(events_url);
+        source.onmessage = (message) => update_row(JSON.parse(message.data));
+        // Sent when this page fell too far behind: fetch the table once instead
+        source.addEventListener('reload', () => htmx.ajax('GET', reload_url, {target: table_selector}));
+        return source;
+    };
+})();
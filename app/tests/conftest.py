@@ -0,0 +1,42 @@
+import time
+
+import jwt
+import pytest
+
+from insumos import create_app
+from insumos.auth import ADMIN_EMAILS
+from insumos.extensions import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """
+    App on an in-memory SQLite database, with every backend kept inside ``tmp_path``
+    """
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'CACHE_BACKEND': 'memory',
+        'SESSION_BACKEND': 'sql',
+        'STORAGE_BACKEND': 'local',
+        'STORAGE_LOCAL_DIR': str(tmp_path / 'storage'),
+        'ADMISSION_BACKEND': 'off',
+        'ORDER_EVENTS_BACKEND': 'off',
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def admin_client(app):
+    """
+    Test client with an admin session, as left by /login
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_email'] = ADMIN_EMAILS[0]
+        # token_required only reads the expiry, the signature is not verified
+        session['access_token'] = jwt.encode({'exp': int(time.time()) + 3600}, 'x' * 32, algorithm='HS256')
+    return client
@@ -0,0 +1,120 @@
+"""
+Closed orders past the retention window move to orders_archive, with every column, and stay
+readable through orders_with_archive and get_order_or_archived_or_404.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+from werkzeug.exceptions import NotFound
+
+from insumos.archive import archive_orders, get_order_or_archived_or_404, orders_with_archive
+from insumos.extensions import db
+from insumos.models import ArchivedOrder, Insumo, Order, OrderStatus, Vendor
+
+OLD = datetime.utcnow() - timedelta(days=400)
+RECENT = datetime.utcnow() - timedelta(days=10)
+
+
+def make_order(status, last_updated, **values):
+    order = Order(user_email='rep@example.com', total=100, status=status, last_updated=last_updated, **values)
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+@pytest.fixture
+def orders(app):
+    """
+    Order ids by case (the instances are gone once archived)
+    """
+    return {
+        'delivered': make_order(OrderStatus.ENTREGADO, OLD).id,
+        'cancelled': make_order(OrderStatus.CANCELADO, OLD).id,
+        'recent': make_order(OrderStatus.ENTREGADO, RECENT).id,
+        'in_transit': make_order(OrderStatus.EN_CAMINO, OLD).id,
+        'created': make_order(OrderStatus.CREADA, OLD).id,
+    }
+
+
+def order_ids(model):
+    return set(db.session.execute(select(model.id)).scalars())
+
+
+def test_only_closed_orders_past_the_cutoff_move(orders):
+    assert archive_orders(retention_days=365, batch_size=1) == 2
+    moved = {orders['delivered'], orders['cancelled']}
+    assert order_ids(ArchivedOrder) == moved
+    assert order_ids(Order) == set(orders.values()) - moved
+    assert archive_orders(retention_days=365) == 0
+
+
+def test_every_column_is_copied(app):
+    order = make_order(
+        OrderStatus.ENTREGADO, OLD, creation_date=OLD - timedelta(days=5),
+        estimated_delivery_date=OLD - timedelta(days=1), data=[{'name': 'Guantes', 'quantity': 3}],
+        letter=b'%PDF-legacy', letter_response=b'%PDF-legacy-response', letter_response_date=OLD,
+        delivery_information='Calle 1', delivery_institute='Hospital Central', doctor_name='Dra. Ana Ruiz',
+        doctor_position='Jefa de Urgencias', letter_signature='data:image/png;base64,AAAA',
+        letter_response_signature='data:image/png;base64,BBBB', letter_key='letters/1.pdf',
+        letter_response_key='letters/2.pdf', letter_signature_key='signatures/1.png',
+        letter_response_signature_key='signatures/2.png')
+    columns = [column.name for column in Order.__table__.columns]
+    expected = {name: getattr(order, name) for name in columns}
+
+    archive_orders(retention_days=365)
+    db.session.expire_all()
+    archived = db.session.get(ArchivedOrder, expected['id'])
+    assert {name: getattr(archived, name) for name in columns} == expected
+    assert archived.archived_at is not None
+
+
+def test_insumos_are_detached_from_moved_orders(orders):
+    vendor = Vendor(name='Proveedor', cellphone='5550000000', user_email='admin@example.com')
+    moved = Insumo(name='Guantes', stock=1, unit_cost=1, vendor=vendor, order_id=orders['delivered'])
+    kept = Insumo(name='Jeringas', stock=1, unit_cost=1, vendor=vendor, order_id=orders['recent'])
+    db.session.add_all([vendor, moved, kept])
+    db.session.commit()
+    archive_orders(retention_days=365)
+    db.session.expire_all()
+    assert moved.order_id is None
+    assert kept.order_id == orders['recent']
+
+
+def test_status_changed_after_the_select_stays(orders, monkeypatch):
+    reopened = orders['delivered']
+    execute = db.session.execute
+    statements = []
+
+    def execute_then_reopen(statement, *args, **kwargs):
+        result = execute(statement, *args, **kwargs)
+        statements.append(statement)
+        if len(statements) == 1:
+            # A writer changes the status after the ids were selected (SQLite has no row locks)
+            execute(update(Order).where(Order.id == reopened)
+                    .values(status=OrderStatus.EN_CAMINO, last_updated=datetime.utcnow()))
+        return result
+
+    monkeypatch.setattr(db.session, 'execute', execute_then_reopen)
+    assert archive_orders(retention_days=365) == 1
+    monkeypatch.undo()
+    assert order_ids(ArchivedOrder) == {orders['cancelled']}
+    assert reopened in order_ids(Order)
+    assert db.session.get(Order, reopened).status == OrderStatus.EN_CAMINO
+
+
+def test_archived_orders_stay_readable(orders):
+    archive_orders(retention_days=365)
+    entity = orders_with_archive()
+    ids = set(db.session.execute(select(entity.id)).scalars())
+    assert ids == set(orders.values())
+    delivered = db.session.execute(
+        select(entity).where(entity.id == orders['delivered'])).scalar_one()
+    assert delivered.status == OrderStatus.ENTREGADO
+
+    # The letters are another request: rows read through the union are not in its identity map
+    db.session.remove()
+    assert isinstance(get_order_or_archived_or_404(orders['delivered']), ArchivedOrder)
+    assert isinstance(get_order_or_archived_or_404(orders['recent']), Order)
+    with pytest.raises(NotFound):
+        get_order_or_archived_or_404(9999)
@@ -0,0 +1,49 @@
+"""
+boto3 clients are only built when first used.
+"""
+import pytest
+
+from benchmarks.fakes import FakeLambdaClient
+from insumos.aws_clients import AWSClientFactory
+from insumos.extensions import aws_clients
+
+
+@pytest.fixture
+def factory():
+    return AWSClientFactory(region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test',
+                            endpoint_urls={'s3': 'http://localhost:9000'},
+                            service_config={'s3': {'read_timeout': 30}})
+
+
+def test_lazy_client_builds_on_first_use(factory):
+    s3 = factory.lazy('s3')
+    assert factory.created_clients() == []
+    assert s3.meta.endpoint_url == 'http://localhost:9000'
+    assert factory.created_clients() == ['s3']
+    assert factory.client('s3') is factory.client('s3')
+
+
+def test_service_config_overrides_defaults(factory):
+    config = factory.client('s3').meta.config
+    assert config.read_timeout == 30
+    assert config.connect_timeout == 2
+    assert config.max_pool_connections == 10
+
+
+def test_register_replaces_client(factory):
+    fake = FakeLambdaClient()
+    factory.register('lambda', fake)
+    factory.lazy('lambda').invoke(FunctionName='notify')
+    assert fake.invocations == [('notify', b'')]
+    assert factory.created_clients() == ['lambda']
+
+
+def test_configure_discards_clients(factory):
+    factory.client('s3')
+    factory.configure(region_name='us-west-2')
+    assert factory.created_clients() == []
+    assert factory.client('sqs').meta.region_name == 'us-west-2'
+
+
+def test_create_app_builds_no_client(app):
+    assert aws_clients.created_clients() == []
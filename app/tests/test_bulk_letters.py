@@ -0,0 +1,87 @@
+"""
+Bulk letter ZIP: stored letters are copied, the rest rendered in the pool and kept afterwards,
+unless the order got a new letter or signature meanwhile.
+"""
+import json
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from insumos.bulk_letters import reference_letter, store_letter
+from insumos.extensions import db, storage
+from insumos.models import Order
+from insumos.storage import StorageObjectNotFound
+
+
+def make_order(**values):
+    order = Order(user_email='rep@example.com', total=100, doctor_name='Dra. Ana Ruiz',
+                  doctor_position='Jefa de Urgencias', delivery_institute='Hospital Central',
+                  data=[{'name': 'Guantes de nitrilo', 'quantity': 3, 'cost': 12.5}], **values)
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+@pytest.fixture
+def app(app):
+    app.config['LETTER_ZIP_WORKERS'] = 1
+    return app
+
+
+def test_zip_copies_stored_and_renders_the_rest(admin_client):
+    stored_key = storage.put('letters/stored.pdf', b'%PDF-stored', 'application/pdf')
+    stored = make_order(letter_key=stored_key)
+    rendered = make_order()
+
+    response = admin_client.get('/api/orders_letters_zip', query_string={
+        'orders_id_list': json.dumps([stored.id, rendered.id, 9999]), 'letter_types': 'letter'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+
+    with zipfile.ZipFile(BytesIO(response.data)) as zip_file:
+        assert zip_file.namelist() == [f'carta_solicitud_pedido_{stored.id}.pdf',
+                                       f'carta_solicitud_pedido_{rendered.id}.pdf', 'errores.txt']
+        assert zip_file.read(f'carta_solicitud_pedido_{stored.id}.pdf') == b'%PDF-stored'
+        pdf = zip_file.read(f'carta_solicitud_pedido_{rendered.id}.pdf')
+        assert pdf.startswith(b'%PDF')
+        assert 'Pedido 9999: no encontrado' in zip_file.read('errores.txt').decode()
+
+    db.session.expire_all()
+    # Kept for the next download, and only referenced once
+    assert storage.get(db.session.get(Order, rendered.id).letter_key) == pdf
+    assert db.session.get(Order, stored.id).letter_key == stored_key
+
+
+def test_zip_requires_orders(admin_client):
+    assert admin_client.get('/api/orders_letters_zip').status_code == 400
+
+
+def test_reference_letter(app):
+    order = make_order(letter_signature_key='signatures/a.png')
+    letter_key = store_letter(order.id, b'%PDF')
+    assert reference_letter(Order, order.id, 'letter_key', 'signatures/a.png', letter_key)
+    db.session.commit()
+    assert db.session.get(Order, order.id).letter_key == letter_key
+
+
+def test_letter_stored_meanwhile_wins(app):
+    order = make_order(letter_key='letters/first.pdf')
+    letter_key = store_letter(order.id, b'%PDF')
+    assert not reference_letter(Order, order.id, 'letter_key', None, letter_key)
+    assert db.session.get(Order, order.id).letter_key == 'letters/first.pdf'
+    with pytest.raises(StorageObjectNotFound):
+        storage.get(letter_key)
+
+
+def test_letter_drawn_with_a_replaced_signature_is_dropped(app):
+    order = make_order(letter_signature_key='signatures/old.png')
+    letter_key = store_letter(order.id, b'%PDF-unsigned')
+    # upload_signature committed while the letter was rendered: new signature, letter_key cleared
+    order.letter_signature_key = 'signatures/new.png'
+    db.session.commit()
+    assert not reference_letter(Order, order.id, 'letter_key', 'signatures/old.png', letter_key)
+    db.session.commit()
+    assert db.session.get(Order, order.id).letter_key is None
+    with pytest.raises(StorageObjectNotFound):
+        storage.get(letter_key)
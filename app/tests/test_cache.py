@@ -0,0 +1,170 @@
+"""
+Cache backends, namespace versions, and invalidation following the outcome of the transaction
+that wrote the rows.
+"""
+import time
+
+import pytest
+from sqlalchemy import insert
+
+from benchmarks.fakes import FakeRedisClient
+from insumos.cache import Cache, MemoryCacheBackend, RedisCacheBackend, SQLiteCacheBackend
+from insumos.extensions import cache, db
+from insumos.models import Insumo, RepresentanteOrderSummary, Vendor
+from insumos.order_summary import _insert_computed
+from insumos.stock import reserve_stock
+
+REPRESENTANTE = 'rep@example.com'
+
+
+@pytest.fixture
+def tables(app):
+    vendor = Vendor(name='Proveedor', cellphone='5550000000', user_email='admin@example.com')
+    insumo = Insumo(name='Guantes', stock=10, unit_cost=12.5, vendor=vendor)
+    db.session.add_all([vendor, insumo])
+    db.session.commit()
+    namespace = cache.namespace('test_insumo_tables', invalidated_by=(Insumo,))
+    namespace.set('page:1', b'cached')
+    return namespace, insumo
+
+
+def test_commit_invalidates(tables):
+    namespace, insumo = tables
+    reserve_stock(insumo, 1)
+    db.session.commit()
+    assert namespace.get('page:1') is None
+
+
+def test_rollback_keeps_entries(tables):
+    namespace, insumo = tables
+    reserve_stock(insumo, 1)
+    db.session.rollback()
+    assert namespace.get('page:1') == b'cached'
+
+
+def test_savepoint_rollback_keeps_pending_invalidation(tables):
+    namespace, insumo = tables
+    reserve_stock(insumo, 1)
+    # A concurrent first order of the representante inserted the summary row meanwhile: the
+    # savepoint of _insert_computed rolls back, the reservation stays in the transaction
+    db.session.execute(insert(RepresentanteOrderSummary.__table__).values(user_email=REPRESENTANTE))
+    assert _insert_computed(REPRESENTANTE) is False
+    db.session.commit()
+    assert namespace.get('page:1') is None
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteCacheBackend(str(tmp_path / 'cache.sqlite'))
+    if request.param == 'redis':
+        return RedisCacheBackend(client=FakeRedisClient())
+    return MemoryCacheBackend()
+
+
+@pytest.fixture
+def local_cache(backend):
+    local_cache = Cache()
+    local_cache.use(backend)
+    return local_cache
+
+
+def test_backend_get_set_many(backend):
+    backend.set_many({'a': b'1', 'b': b'2'}, 60)
+    assert backend.get_many(['a', 'b', 'c']) == {'a': b'1', 'b': b'2'}
+    assert backend.get_many([]) == {}
+    backend.delete_many(['a'])
+    assert backend.get_many(['a', 'b']) == {'b': b'2'}
+
+
+def test_backend_ttl(backend, monkeypatch):
+    backend.set_many({'short': b'1'}, 1)
+    backend.set_many({'forever': b'2'})
+    now = time.time()
+    monkeypatch.setattr('time.time', lambda: now + 2)
+    assert backend.get_many(['short', 'forever']) == {'forever': b'2'}
+
+
+def test_backend_add_keeps_first_value(backend):
+    assert backend.add('token', b'first') == b'first'
+    assert backend.add('token', b'second') == b'first'
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set_many({'a': b'1', 'b': b'2'})
+    backend.get_many(['a'])
+    backend.set_many({'c': b'3'})
+    assert backend.get_many(['a', 'b', 'c']) == {'a': b'1', 'c': b'3'}
+
+
+def test_sqlite_backend_caps_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(SQLiteCacheBackend, 'PURGE_EVERY', 1)
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.sqlite'), max_entries=2)
+    backend.add('version', b'v1')
+    backend.set_many({'a': b'1'}, 10)
+    backend.set_many({'b': b'2'}, 20)
+    backend.set_many({'c': b'3'}, 30)
+    # The entries closest to expiring go first; version tokens never do
+    assert backend.get_many(['version', 'a', 'b', 'c']) == {'version': b'v1', 'c': b'3'}
+
+
+def test_sqlite_backend_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    first, second = Cache(), Cache()
+    first.use(SQLiteCacheBackend(path))
+    second.use(SQLiteCacheBackend(path))
+    first.namespace('vendors').set('options', ['Proveedor'])
+    assert second.namespace('vendors').get('options') == ['Proveedor']
+    second.namespace('vendors').invalidate()
+    assert first.namespace('vendors').get('options') is None
+
+
+def test_namespace_round_trip(local_cache):
+    namespace = local_cache.namespace('vendors')
+    namespace.set_many({'options': [{'id': 1, 'name': 'Proveedor'}], 'count': 1})
+    assert namespace.get_many(['options', 'count', 'missing']) == {
+        'options': [{'id': 1, 'name': 'Proveedor'}], 'count': 1}
+    assert namespace.get('missing', 'default') == 'default'
+
+
+def test_invalidate_orphans_entries(local_cache):
+    namespace = local_cache.namespace('vendors')
+    other = local_cache.namespace('customer_teams')
+    namespace.set('options', ['Proveedor'])
+    other.set('options', ['Team'])
+    namespace.invalidate()
+    assert namespace.get('options') is None
+    assert other.get('options') == ['Team']
+
+
+def test_get_or_set_computes_once(local_cache):
+    namespace = local_cache.namespace('vendors')
+    calls = []
+    assert namespace.get_or_set('options', lambda: calls.append(1) or 'rendered') == 'rendered'
+    assert namespace.get_or_set('options', lambda: calls.append(1) or 'again') == 'rendered'
+    assert calls == [1]
+
+
+def test_get_or_set_invalidated_while_creating(local_cache):
+    namespace = local_cache.namespace('insumo_tables')
+
+    def create():
+        # A writer commits while the value is being computed from the old rows
+        namespace.invalidate()
+        return 'stale-render'
+
+    assert namespace.get_or_set('representante:1', create) == 'stale-render'
+    assert namespace.get('representante:1') is None
+    assert namespace.get_or_set('representante:1', lambda: 'fresh-render') == 'fresh-render'
+
+
+def test_backend_errors_are_misses(local_cache, monkeypatch):
+    namespace = local_cache.namespace('vendors')
+    namespace.set('options', ['Proveedor'])
+
+    def fail(*args):
+        raise ConnectionError('cache down')
+
+    monkeypatch.setattr(local_cache.backend, 'get_many', fail)
+    assert namespace.get_or_set('options', lambda: ['from the database']) == ['from the database']
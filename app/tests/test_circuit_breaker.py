@@ -0,0 +1,250 @@
+"""
+Circuit breaker transitions, and the Cognito gateway's call deadline and breaker wiring.
+"""
+import pytest
+from botocore.exceptions import ReadTimeoutError
+
+from benchmarks.fakes import FakeCognitoClient
+from insumos.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from insumos.cognito import CognitoDeadlineExceeded, CognitoGateway, CognitoUnavailableError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker('test', window_seconds=30, min_calls=4, failure_rate=0.5, slow_call_seconds=2.0,
+                          slow_call_rate=0.5, open_seconds=15, half_open_calls=2, clock=clock)
+
+
+def call(breaker, failed=False, seconds=0.1):
+    breaker.record(breaker.before_call(), failed, seconds)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        call(breaker, failed=True)
+    assert breaker.state == OPEN
+
+
+def test_stays_closed_below_min_calls(breaker):
+    for _ in range(breaker.min_calls - 1):
+        call(breaker, failed=True)
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_failure_rate(breaker):
+    call(breaker)
+    call(breaker)
+    call(breaker, failed=True)
+    assert breaker.state == CLOSED
+    call(breaker, failed=True)
+    assert breaker.state == OPEN
+
+
+def test_opens_on_slow_call_rate(breaker):
+    call(breaker)
+    call(breaker)
+    call(breaker, seconds=2.5)
+    call(breaker, seconds=3.0)
+    assert breaker.state == OPEN
+    assert breaker.rates() == (0.0, 0.5)
+
+
+def test_calls_out_of_the_window_are_forgotten(breaker, clock):
+    for _ in range(breaker.min_calls - 1):
+        call(breaker, failed=True)
+    clock.now += 31
+    call(breaker, failed=True)
+    assert breaker.state == CLOSED
+    assert breaker.rates() == (1.0, 0.0)
+
+
+def test_rejects_while_open(breaker, clock):
+    trip(breaker)
+    clock.now += 14
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.state == OPEN
+
+
+def test_half_open_limits_probes(breaker, clock):
+    trip(breaker)
+    clock.now += 15
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_successful_probes_close(breaker, clock):
+    trip(breaker)
+    clock.now += 15
+    call(breaker)
+    assert breaker.state == HALF_OPEN
+    call(breaker)
+    assert breaker.state == CLOSED
+    assert breaker.rates() == (0.0, 0.0)
+
+
+@pytest.mark.parametrize('failed, seconds', [(True, 0.1), (False, 2.5)])
+def test_failed_or_slow_probe_reopens(breaker, clock, failed, seconds):
+    trip(breaker)
+    clock.now += 15
+    call(breaker)
+    call(breaker, failed=failed, seconds=seconds)
+    assert breaker.state == OPEN
+    clock.now += 14
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_late_result_while_open_is_ignored(breaker):
+    late = breaker.before_call()
+    trip(breaker)
+    breaker.record(late, False, 0.1)
+    assert breaker.state == OPEN
+
+
+@pytest.mark.parametrize('failed', [False, True])
+def test_late_result_while_half_open_is_not_a_probe(breaker, clock, failed):
+    late = [breaker.before_call() for _ in range(2)]
+    trip(breaker)
+    clock.now += 15
+    probe = breaker.before_call()
+    # Calls admitted while closed end now: they neither close nor reopen the circuit...
+    for call_ in late:
+        breaker.record(call_, failed, 0.1)
+    assert breaker.state == HALF_OPEN
+    # ...nor free probe places
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(probe, False, 0.1)
+    assert breaker.state == HALF_OPEN
+
+
+def test_late_result_after_closing_is_ignored(breaker, clock):
+    late = breaker.before_call()
+    trip(breaker)
+    clock.now += 15
+    call(breaker)
+    call(breaker)
+    assert breaker.state == CLOSED
+    breaker.record(late, True, 0.1)
+    assert breaker.rates() == (0.0, 0.0)
+
+
+def test_discarded_probe_frees_its_place(breaker, clock):
+    trip(breaker)
+    clock.now += 15
+    first = breaker.before_call()
+    breaker.before_call()
+    breaker.discard(first)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+class FakeEvents:
+    def __init__(self):
+        self.handlers = []
+
+    def register(self, event_name, handler, unique_id=None):
+        self.handlers.append(handler)
+
+
+class FakeMeta:
+    def __init__(self):
+        self.events = FakeEvents()
+
+
+class RetryingClient:
+    """
+    Runs the ``before-send`` handlers before each attempt, as botocore does, and fails the first
+    ``failed_attempts`` attempts with a read timeout
+    """
+
+    def __init__(self, clock, failed_attempts, attempt_seconds):
+        self.meta = FakeMeta()
+        self.clock = clock
+        self.failed_attempts = failed_attempts
+        self.attempt_seconds = attempt_seconds
+        self.attempts = 0
+
+    def admin_initiate_auth(self, **kwargs):
+        while True:
+            for handler in self.meta.events.handlers:
+                handler(request=None)
+            self.attempts += 1
+            self.clock.now += self.attempt_seconds
+            if self.attempts > self.failed_attempts:
+                return {'AuthenticationResult': {}}
+
+
+@pytest.fixture
+def gateway_clock(monkeypatch, clock):
+    monkeypatch.setattr('insumos.cognito.time.monotonic', clock)
+    return clock
+
+
+def test_deadline_stops_retries(gateway_clock):
+    client = RetryingClient(gateway_clock, failed_attempts=10, attempt_seconds=2)
+    gateway = CognitoGateway(client, call_deadline=5)
+    with pytest.raises(CognitoDeadlineExceeded):
+        gateway.admin_initiate_auth(AuthParameters={})
+    assert client.attempts == 3
+    assert gateway.breaker.rates()[0] == 1.0
+
+
+def test_call_within_deadline_succeeds(gateway_clock):
+    client = RetryingClient(gateway_clock, failed_attempts=1, attempt_seconds=2)
+    gateway = CognitoGateway(client, call_deadline=5)
+    assert gateway.admin_initiate_auth(AuthParameters={}) == {'AuthenticationResult': {}}
+    assert gateway._deadline.at is None
+
+
+def test_gateway_opens_breaker_and_probes(clock):
+    client = FakeCognitoClient(failure_rate=1.0)
+    gateway = CognitoGateway(client)
+    gateway.breaker = CircuitBreaker('test-cognito', min_calls=3, open_seconds=15, half_open_calls=1, clock=clock)
+    for _ in range(3):
+        with pytest.raises(CognitoUnavailableError) as excinfo:
+            gateway.sign_up(Username='rep@example.com')
+        assert isinstance(excinfo.value.__cause__, ReadTimeoutError)
+    assert gateway.breaker.state == OPEN
+
+    with pytest.raises(CognitoUnavailableError) as excinfo:
+        gateway.sign_up(Username='rep@example.com')
+    assert isinstance(excinfo.value.__cause__, CircuitOpenError)
+    assert client.calls == 3
+
+    client.failure_rate = 0.0
+    clock.now += 15
+    gateway.sign_up(Username='rep@example.com')
+    assert client.calls == 4
+    assert gateway.breaker.state == CLOSED
+
+
+def test_client_errors_are_not_failures():
+    client = FakeCognitoClient()
+
+    def wrong_password(**kwargs):
+        raise client.exceptions.NotAuthorizedException('Incorrect username or password.')
+
+    client.admin_initiate_auth = wrong_password
+    gateway = CognitoGateway(client)
+    with pytest.raises(client.exceptions.NotAuthorizedException):
+        gateway.admin_initiate_auth(AuthParameters={})
+    assert gateway.breaker.rates() == (0.0, 0.0)
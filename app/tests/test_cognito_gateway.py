@@ -0,0 +1,130 @@
+"""
+The Cognito gateway's semaphore bounds the calls in flight.
+"""
+import threading
+import time
+
+import pytest
+
+from insumos.aws_clients import AWSClientFactory
+from insumos.cognito import CognitoGateway, CognitoUnavailableError
+
+
+class BlockingClient:
+    """
+    ``sign_up`` waits until ``release`` is set, and counts the calls in flight
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def sign_up(self, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.release.wait(5)
+        with self._lock:
+            self.in_flight -= 1
+        return {'UserConfirmed': False}
+
+
+def start_calls(gateway, count):
+    errors = []
+
+    def target():
+        try:
+            gateway.sign_up(Username='rep@example.com')
+        except CognitoUnavailableError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, errors
+
+
+def wait_in_flight(client, count):
+    for _ in range(500):
+        if client.in_flight == count:
+            return
+        time.sleep(0.01)
+    pytest.fail(f"{client.in_flight} calls in flight, expected {count}")
+
+
+def test_caps_calls_in_flight():
+    client = BlockingClient()
+    gateway = CognitoGateway(client, max_concurrency=2, acquire_timeout=5)
+    threads, errors = start_calls(gateway, 5)
+    wait_in_flight(client, 2)
+    client.release.set()
+    for thread in threads:
+        thread.join()
+    assert client.max_in_flight == 2
+    assert errors == []
+
+
+def test_fails_fast_when_no_slot_frees():
+    client = BlockingClient()
+    gateway = CognitoGateway(client, max_concurrency=1, acquire_timeout=0.05)
+    threads, _ = start_calls(gateway, 1)
+    wait_in_flight(client, 1)
+    with pytest.raises(CognitoUnavailableError):
+        gateway.sign_up(Username='rep@example.com')
+    # Local congestion says nothing about Cognito
+    assert gateway.breaker.rates() == (0.0, 0.0)
+    client.release.set()
+    for thread in threads:
+        thread.join()
+    # The slot is given back once the call ends
+    gateway.sign_up(Username='rep@example.com')
+
+
+def test_slot_released_on_error():
+    class FailingClient:
+        def sign_up(self, **kwargs):
+            raise ValueError('bad request')
+
+    gateway = CognitoGateway(FailingClient(), max_concurrency=1, acquire_timeout=0.05)
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            gateway.sign_up(Username='rep@example.com')
+
+
+def test_init_app_applies_limits(app):
+    gateway = CognitoGateway(BlockingClient())
+    app.config.update(COGNITO_MAX_CONCURRENCY=3, COGNITO_QUEUE_TIMEOUT=0.5)
+    gateway.init_app(app)
+    assert (gateway.max_concurrency, gateway.acquire_timeout) == (3, 0.5)
+
+
+def test_slot_released_when_the_client_cannot_be_built():
+    class BrokenMeta:
+        @property
+        def events(self):
+            raise RuntimeError('invalid region')
+
+    class LazyBrokenClient:
+        meta = BrokenMeta()
+
+        def sign_up(self, **kwargs):
+            return {}
+
+    gateway = CognitoGateway(LazyBrokenClient(), max_concurrency=1, acquire_timeout=0.05)
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            gateway.sign_up(Username='rep@example.com')
+
+
+def test_local_helpers_take_no_slot():
+    client = AWSClientFactory(region_name='us-east-1', aws_access_key_id='test',
+                              aws_secret_access_key='test').client('cognito-idp')
+    gateway = CognitoGateway(client, max_concurrency=1, acquire_timeout=0.05)
+    # Every slot taken: API operations would be rejected, helpers still answer
+    gateway._slots.acquire()
+    assert gateway.can_paginate('list_users')
+    assert gateway.get_paginator('list_users') is not None
+    with pytest.raises(CognitoUnavailableError):
+        gateway.list_users(UserPoolId='us-east-1_test')
@@ -0,0 +1,88 @@
+"""
+Slow query log redaction and access to /metrics.
+"""
+import json
+import logging
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from insumos.extensions import db
+
+SECRET = 'rep@example.com'
+
+
+@pytest.fixture
+def slow_queries(app, caplog):
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+    caplog.set_level(logging.WARNING, logger='insumos.slow_query')
+
+    def run(statement, parameters):
+        db.session.execute(text(statement), parameters)
+        return [json.loads(record.getMessage()) for record in caplog.records
+                if record.name == 'insumos.slow_query']
+
+    return run
+
+
+def test_slow_query_log_omits_values(slow_queries):
+    entry = slow_queries("SELECT :email, :amount", {'email': SECRET, 'amount': 3})[-1]
+    assert SECRET not in json.dumps(entry)
+    assert entry['parameter_count'] == 2
+    # Named (dict) or positional (list) depending on the driver's paramstyle
+    types = entry['parameter_types']
+    assert sorted(types.values() if isinstance(types, dict) else types) == ['int', 'str']
+
+
+def test_slow_query_log_values_opt_in(app, slow_queries):
+    app.config['SLOW_QUERY_LOG_PARAMETERS'] = True
+    entry = slow_queries("SELECT :email", {'email': SECRET})[-1]
+    assert SECRET in entry['parameters']
+
+
+def test_slow_query_log_executemany(slow_queries):
+    db.session.execute(text("CREATE TABLE emails (email VARCHAR)"))
+    entry = slow_queries("INSERT INTO emails (email) VALUES (:email)",
+                         [{'email': SECRET}, {'email': 'other@example.com'}])[-1]
+    assert SECRET not in json.dumps(entry)
+    assert entry['parameter_sets'] == 2
+    assert entry['parameter_count'] == 1
+
+
+def test_failing_statement_leaves_nothing_on_the_connection(slow_queries):
+    connection = db.session.connection()
+    with pytest.raises(OperationalError):
+        connection.execute(text("SELECT * FROM no_such_table"))
+    db.session.rollback()
+    # The pooled connection carries no start time of the failed statement into the next ones
+    assert slow_queries("SELECT :email", {'email': SECRET})[-1]['duration_ms'] < 1000
+    assert not any(key.startswith('_insumos') for key in db.session.connection().info)
+
+
+def test_metrics_from_loopback(app):
+    response = app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert b'insumos_request_duration_seconds' in response.data
+
+
+def test_metrics_rejects_other_addresses(app):
+    client = app.test_client()
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'}).status_code == 403
+
+
+def test_metrics_allowed_network(app):
+    app.config['METRICS_ALLOWED_IPS'] = ['10.0.0.0/8']
+    client = app.test_client()
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.1.2.3'}).status_code == 200
+    assert client.get('/metrics').status_code == 403
+
+
+def test_metrics_token(app):
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+    client = app.test_client()
+    remote = {'REMOTE_ADDR': '203.0.113.7'}
+    assert client.get('/metrics', environ_base=remote,
+                      headers={'Authorization': 'Bearer scrape-token'}).status_code == 200
+    assert client.get('/metrics', environ_base=remote,
+                      headers={'Authorization': 'Bearer wrong'}).status_code == 403
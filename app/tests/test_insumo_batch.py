@@ -0,0 +1,72 @@
+"""
+Batch edits of the insumo catalog: optimistic concurrency on ``Insumo.version``.
+"""
+import pytest
+
+from insumos.extensions import db
+from insumos.insumo_batch import apply_insumo_changes
+from insumos.models import Insumo, Vendor
+from insumos.stock import reserve_stock
+
+
+@pytest.fixture
+def insumo(app):
+    vendor = Vendor(name='Proveedor', cellphone='5550000000', user_email='admin@example.com')
+    insumo = Insumo(name='Guantes', stock=10, unit_cost=12.5, vendor=vendor)
+    db.session.add_all([vendor, insumo])
+    db.session.commit()
+    return insumo
+
+
+def test_edit_bumps_version(insumo):
+    last_updated = insumo.last_updated
+    updated, conflicts = apply_insumo_changes([{'id': insumo.id, 'version': 1, 'unit_cost': '15'}])
+    assert (updated, conflicts) == ([insumo.id], [])
+    db.session.refresh(insumo)
+    assert (insumo.unit_cost, insumo.version) == (15, 2)
+    assert insumo.last_updated > last_updated
+
+
+def test_stale_version_conflicts(insumo):
+    apply_insumo_changes([{'id': insumo.id, 'version': 1, 'unit_cost': '15'}])
+    updated, conflicts = apply_insumo_changes([{'id': insumo.id, 'version': 1, 'unit_cost': '20'}])
+    assert updated == []
+    assert conflicts[0]['current']['version'] == 2
+    assert conflicts[0]['current']['unit_cost'] == 15
+
+
+def test_stock_reservation_does_not_conflict(insumo):
+    last_updated = insumo.last_updated
+    reserve_stock(insumo, 3)
+    db.session.commit()
+    db.session.refresh(insumo)
+    assert (insumo.stock, insumo.version, insumo.last_updated) == (7, 1, last_updated)
+
+    updated, conflicts = apply_insumo_changes([{'id': insumo.id, 'version': 1, 'unit_cost': '15'}])
+    assert (updated, conflicts) == ([insumo.id], [])
+
+
+def test_json_batch(admin_client, insumo):
+    response = admin_client.post('/bulk_edit_insumos',
+                                 json={'insumos': [{'id': insumo.id, 'version': 1, 'stock': 4}]})
+    assert response.status_code == 200
+    assert response.get_json() == {'updated': [insumo.id], 'conflicts': []}
+
+
+@pytest.mark.parametrize('payload', [
+    [{'id': 1, 'version': 1, 'stock': 4}],
+    {'insumos': [1, 2]},
+    {'insumos': {'id': 1}},
+    {'cambios': []},
+    'insumos',
+])
+def test_json_batch_of_another_shape(admin_client, insumo, payload):
+    response = admin_client.post('/bulk_edit_insumos', json=payload)
+    assert response.status_code == 400
+    assert set(response.get_json()) == {'error'}
+
+
+def test_json_batch_not_json(admin_client, insumo):
+    response = admin_client.post('/bulk_edit_insumos', data='{"insumos": [', content_type='application/json')
+    assert response.status_code == 400
+    assert set(response.get_json()) == {'error'}
@@ -0,0 +1,75 @@
+"""
+Both letter renderers draw the same letter from the same context: same text, same images.
+"""
+import difflib
+import os
+import re
+from datetime import date
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from pypdf import PdfReader
+
+from insumos.letter_renderers import ReportLabRenderer, XHTML2PDFRenderer
+
+LETTERS = ('render_request_letter', 'render_response_letter')
+# Words of the text both renderers draw, allowing for line breaks and spacing around the table
+MIN_TEXT_SIMILARITY = 0.98
+
+
+@pytest.fixture
+def context(app):
+    with open(os.path.join(app.root_path, 'static/assets/img/bayer_logo.png'), 'rb') as logo:
+        logo = logo.read()
+    # The signature pad sends a transparent PNG
+    signature = BytesIO()
+    Image.new('RGBA', (600, 300), (20, 20, 120, 128)).save(signature, 'PNG')
+    return {
+        'order_id': 42,
+        'actual_date': date(2026, 1, 15),
+        'insumos_order': [{'name': 'Guantes de nitrilo', 'quantity': 3, 'cost': 12.5},
+                          {'name': 'Jeringas 5 ml', 'quantity': 10, 'cost': 4}],
+        'medico_solicitante': 'Dra. Ana Ruiz',
+        'posicion_medico': 'Jefa de Urgencias',
+        'nombre_institucion': 'Hospital Central',
+        'nombre_representante': 'Luis Pérez',
+        'logo': logo,
+        'doctor_signature': signature.getvalue(),
+    }
+
+
+def _summary(pdf):
+    reader = PdfReader(BytesIO(pdf))
+    text = ' '.join(page.extract_text() for page in reader.pages)
+    return {
+        'pages': len(reader.pages),
+        'images': sorted(image.image.size for page in reader.pages for image in page.images),
+        'words': re.findall(r'\w+', text),
+    }
+
+
+@pytest.mark.parametrize('letter', LETTERS)
+def test_renderers_draw_the_same_letter(app, context, letter):
+    reportlab = _summary(getattr(ReportLabRenderer(), letter)(context))
+    xhtml2pdf = _summary(getattr(XHTML2PDFRenderer(), letter)(context))
+
+    assert reportlab['pages'] == xhtml2pdf['pages'] == 1
+    # Logo and signature, each once and at its own size
+    assert reportlab['images'] == xhtml2pdf['images'] == sorted([(119, 119), (600, 300)])
+    similarity = difflib.SequenceMatcher(None, reportlab['words'], xhtml2pdf['words'], autojunk=False).ratio()
+    assert similarity >= MIN_TEXT_SIMILARITY
+    for value in ('Ruiz', 'Urgencias', 'Central', '2026'):
+        assert value in reportlab['words'] and value in xhtml2pdf['words']
+
+
+def test_request_letter_lists_every_insumo(app, context):
+    for renderer in (ReportLabRenderer(), XHTML2PDFRenderer()):
+        words = _summary(renderer.render_request_letter(context))['words']
+        assert {'Guantes', 'nitrilo', 'Jeringas', '12', '5'} <= set(words)
+
+
+def test_letter_without_signature(app, context):
+    context['doctor_signature'] = None
+    for renderer in (ReportLabRenderer(), XHTML2PDFRenderer()):
+        assert _summary(renderer.render_response_letter(context))['images'] == [(119, 119)]
@@ -0,0 +1,109 @@
+"""
+Letters are rendered once and kept in object storage, never over a signature uploaded meanwhile.
+"""
+import base64
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from sqlalchemy import update
+
+from insumos import letters
+from insumos.extensions import db
+from insumos.models import Order
+
+
+@pytest.fixture
+def order(app):
+    order = Order(user_email='rep@example.com', total=100, doctor_name='Dra. Ana Ruiz',
+                  data=[{'name': 'Guantes de nitrilo', 'quantity': 3, 'cost': 12.5}])
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    calls = []
+
+    def render_letter(response_letter, context):
+        calls.append(context['order_id'])
+        return b'%PDF-1.4'
+
+    monkeypatch.setattr(letters, 'render_letter', render_letter)
+    return calls
+
+
+def stored_objects(app, prefix):
+    root = os.path.join(app.config['STORAGE_LOCAL_DIR'], prefix)
+    return [name for _, _, names in os.walk(root) for name in names]
+
+
+def test_letter_rendered_once(app, admin_client, order, renders):
+    first = admin_client.get(f'/order_pdf_letter/{order.id}/letter')
+    assert first.status_code == 302
+    assert first.location.startswith('/storage/')
+    assert admin_client.get(first.location).data == b'%PDF-1.4'
+    second = admin_client.get(f'/order_pdf_letter/{order.id}/letter')
+    assert second.status_code == 302
+    assert renders == [order.id]
+    assert len(stored_objects(app, 'letters')) == 1
+
+
+def test_signature_uploaded_while_rendering(app, admin_client, order, monkeypatch):
+    def render_letter(response_letter, context):
+        # upload_signature commits in another request while this letter is drawn unsigned
+        db.session.execute(update(Order).where(Order.id == order.id)
+                           .values(letter_signature_key='signatures/new.png', letter_key=None))
+        return b'%PDF-unsigned'
+
+    monkeypatch.setattr(letters, 'render_letter', render_letter)
+    response = admin_client.get(f'/order_pdf_letter/{order.id}/letter')
+    # Drawn again, with the new signature
+    assert response.status_code == 302
+    assert response.location == f'/order_pdf_letter/{order.id}/letter'
+    db.session.expire_all()
+    assert db.session.get(Order, order.id).letter_key is None
+    assert stored_objects(app, 'letters') == []
+
+
+def test_letter_stored_by_a_concurrent_view(app, admin_client, order, monkeypatch):
+    def render_letter(response_letter, context):
+        db.session.execute(update(Order).where(Order.id == order.id).values(letter_key='letters/first.pdf'))
+        return b'%PDF-1.4'
+
+    monkeypatch.setattr(letters, 'render_letter', render_letter)
+    admin_client.get(f'/order_pdf_letter/{order.id}/letter')
+    db.session.expire_all()
+    assert db.session.get(Order, order.id).letter_key == 'letters/first.pdf'
+    assert stored_objects(app, 'letters') == []
+
+
+def signature_form(order_id):
+    png = BytesIO()
+    Image.new('RGBA', (60, 30), (20, 20, 120, 255)).save(png, 'PNG')
+    return {f'signature_{order_id}': 'data:image/png;base64,' + base64.b64encode(png.getvalue()).decode()}
+
+
+def test_upload_signature_discards_the_unsigned_letter(app, admin_client, order, renders):
+    admin_client.get(f'/order_pdf_letter/{order.id}/letter')
+    response = admin_client.post('/upload_signature', data=signature_form(order.id))
+    assert response.status_code == 302
+    db.session.expire_all()
+    order = db.session.get(Order, order.id)
+    assert order.letter_key is None
+    assert order.letter_signature_key.startswith(f'signatures/orders/{order.id}/')
+    assert stored_objects(app, 'letters') == []
+
+
+def test_failed_upload_leaves_no_signature_object(app, admin_client, order, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(letters, 'change_order_status', fail)
+    response = admin_client.post('/upload_signature', data=signature_form(order.id))
+    assert 'Ha ocurrido un error' in response.get_data(as_text=True)
+    assert stored_objects(app, 'signatures') == []
+    db.session.expire_all()
+    assert db.session.get(Order, order.id).letter_signature_key is None
@@ -0,0 +1,123 @@
+"""
+Admin order search: combined filters, inclusive "hasta" dates, the sort allowlist and the
+archive.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from insumos.archive import archive_orders
+from insumos.extensions import db
+from insumos.models import BayerUser, Order, OrderStatus
+from insumos.order_search import InvalidOrderSearch, build_order_search, parse_order_filters
+
+OLD = datetime.utcnow() - timedelta(days=400)
+
+
+def make_user(email, name, customer_team):
+    db.session.add(BayerUser(email=email, name=name, customer_team=customer_team, cwid='X1', address='Calle 1',
+                             ext_number='1', int_number='', colonia='Centro', ciudad='CDMX', edo='CDMX',
+                             cp='01000', cel_bayer='5550000000'))
+
+
+def make_order(user_email, status, total, creation_date, **values):
+    order = Order(user_email=user_email, status=status, total=total, creation_date=creation_date, **values)
+    db.session.add(order)
+    db.session.commit()
+    return order.id
+
+
+@pytest.fixture
+def orders(app):
+    make_user('ana@example.com', 'Ana Ruiz', 'Oncología')
+    make_user('luis@example.com', 'Luis Pérez', 'Cardiología')
+    return {
+        'ana_delivered': make_order('ana@example.com', OrderStatus.ENTREGADO, 120, datetime(2024, 3, 10, 23, 30),
+                                    delivery_institute='Hospital Central',
+                                    estimated_delivery_date=datetime(2024, 3, 20, 18, 0)),
+        'ana_in_transit': make_order('ana@example.com', OrderStatus.EN_CAMINO, 80, datetime(2024, 3, 11, 9, 0),
+                                     delivery_institute='Clínica Norte'),
+        'luis_delivered': make_order('luis@example.com', OrderStatus.ENTREGADO, 300, datetime(2024, 3, 10, 8, 0),
+                                     delivery_institute='Hospital Central'),
+        'created': make_order('ana@example.com', OrderStatus.CREADA, 50, datetime(2024, 3, 10, 12, 0)),
+    }
+
+
+def search(args=None, **kwargs):
+    return [order.id for order in build_order_search(parse_order_filters(MultiDict(args or {})), **kwargs)]
+
+
+def test_filters_combine(orders):
+    assert search({'query_representante_name': 'ana', 'query_status': 'ENTREGADO',
+                   'query_institucion': 'central'}) == [orders['ana_delivered']]
+    assert search({'query_customer_team': 'Cardiología', 'total_min': '100', 'total_max': '300'}) == \
+        [orders['luis_delivered']]
+    assert search({'query_representante_name': 'ana', 'total_min': '200'}) == []
+
+
+def test_created_orders_are_never_listed(orders):
+    assert orders['created'] not in search()
+    assert search({'query_status': 'todos'}) == search()
+
+
+@pytest.mark.parametrize('args, expected', [
+    ({'fecha_hasta': '2024-03-10'}, {'ana_delivered', 'luis_delivered'}),
+    ({'fecha_desde': '2024-03-11', 'fecha_hasta': '2024-03-11'}, {'ana_in_transit'}),
+    ({'entrega_desde': '2024-03-20', 'entrega_hasta': '2024-03-20'}, {'ana_delivered'}),
+])
+def test_hasta_dates_include_the_whole_day(orders, args, expected):
+    assert set(search(args)) == {orders[name] for name in expected}
+
+
+@pytest.mark.parametrize('args', [{'fecha_desde': '10/03/2024'}, {'total_min': 'NaN'},
+                                  {'total_max': 'mucho'}, {'query_status': 'PERDIDA'}])
+def test_invalid_filters_are_rejected(app, args):
+    with pytest.raises(InvalidOrderSearch):
+        parse_order_filters(MultiDict(args))
+
+
+def test_sorts_with_the_id_as_tie_breaker(orders):
+    assert search(sort='total', direction='asc') == \
+        [orders['ana_in_transit'], orders['ana_delivered'], orders['luis_delivered']]
+    # Same representante: the id decides
+    assert search(sort='representante', direction='desc') == \
+        [orders['luis_delivered'], orders['ana_in_transit'], orders['ana_delivered']]
+
+
+@pytest.mark.parametrize('sort, direction', [('user_email', 'asc'), ('letter_signature', 'desc'),
+                                             ('id; DROP TABLE orders', 'asc'), ('id', 'sideways')])
+def test_sort_outside_the_allowlist_is_rejected(app, sort, direction):
+    with pytest.raises(InvalidOrderSearch):
+        build_order_search({}, sort=sort, direction=direction)
+
+
+def test_admin_view_rejects_unknown_sort(admin_client, orders):
+    response = admin_client.get('/search_orders_admin?sort=letter_signature')
+    assert 'Orden no válido' in response.get_data(as_text=True)
+
+
+def test_include_archive(orders):
+    db.session.execute(db.update(Order).where(Order.id == orders['luis_delivered']).values(last_updated=OLD))
+    db.session.commit()
+    assert archive_orders(retention_days=365) == 1
+
+    assert orders['luis_delivered'] not in search()
+    args = {'query_institucion': 'central'}
+    assert search(args, include_archive=True, sort='total', direction='desc') == \
+        [orders['luis_delivered'], orders['ana_delivered']]
+    assert search({'query_customer_team': 'Cardiología'}, include_archive=True) == [orders['luis_delivered']]
+
+
+def test_admin_view_marks_archived_orders(admin_client, orders):
+    db.session.execute(db.update(Order).where(Order.id == orders['luis_delivered']).values(last_updated=OLD))
+    db.session.commit()
+    archive_orders(retention_days=365)
+
+    detail = f'/order_detail/{orders["luis_delivered"]}'
+    hidden = admin_client.get('/search_orders_admin?query_customer_team=Cardiología').get_data(as_text=True)
+    assert detail not in hidden
+    shown = admin_client.get('/search_orders_admin?query_customer_team=Cardiología&include_archive=on')
+    shown = shown.get_data(as_text=True)
+    assert detail in shown
+    assert 'Archivado' in shown
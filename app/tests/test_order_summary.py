@@ -0,0 +1,110 @@
+"""
+Order counters kept by the writes match the ones computed from the orders.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import update
+
+from insumos.archive import archive_orders
+from insumos.extensions import db
+from insumos.models import Order, OrderStatus, RepresentanteOrderSummary
+from insumos.order_summary import (STATUS_COLUMNS, compute_summaries, order_summary, rebuild_order_summaries,
+                                   record_new_order)
+from insumos.outbox import change_order_status
+
+REPRESENTANTE = 'rep@example.com'
+COUNTERS = [*STATUS_COLUMNS.values(), 'total_spent']
+
+
+def new_order(total, user_email=REPRESENTANTE):
+    order = Order(user_email=user_email, status=OrderStatus.CREADA, total=total)
+    # As add_order_record: added first, so a first row computed from the orders counts it
+    db.session.add(order)
+    record_new_order(order)
+    db.session.commit()
+    return order
+
+
+def stored(user_email=REPRESENTANTE):
+    db.session.expire_all()
+    summary = db.session.get(RepresentanteOrderSummary, user_email)
+    return {name: getattr(summary, name) for name in COUNTERS}
+
+
+def computed(user_email=REPRESENTANTE):
+    row, = compute_summaries(user_email)
+    return {name: row[name] for name in COUNTERS}
+
+
+def test_writes_keep_the_summary(app):
+    created = new_order(100)
+    cancelled = new_order(40)
+    delivered = new_order('12.50')
+    new_order(7, user_email='other@example.com')
+
+    change_order_status(cancelled, OrderStatus.CANCELADO)
+    db.session.commit()
+    # Admin status edits, back and forth
+    change_order_status(delivered, 'EN_CAMINO')
+    db.session.commit()
+    change_order_status(delivered, OrderStatus.ENTREGADO)
+    db.session.commit()
+    change_order_status(created, OrderStatus.RECHAZADA)
+    db.session.commit()
+    change_order_status(created, OrderStatus.CREADA)
+    db.session.commit()
+    # Same status again: nothing to count
+    change_order_status(created, OrderStatus.CREADA)
+    db.session.commit()
+
+    assert stored() == computed()
+    assert stored() == {'created_count': 1, 'in_transit_count': 0, 'delivered_count': 1, 'cancelled_count': 1,
+                        'rejected_count': 0, 'total_spent': Decimal('112.50')}
+    assert rebuild_order_summaries() == 0
+
+
+def test_first_change_computes_the_row(app):
+    # Orders from before the summaries table: no row yet
+    db.session.add_all([Order(user_email=REPRESENTANTE, status=OrderStatus.ENTREGADO, total=30),
+                        Order(user_email=REPRESENTANTE, status=OrderStatus.CANCELADO, total=5)])
+    db.session.commit()
+    new_order(20)
+    assert stored() == computed()
+    assert stored()['created_count'] == 1
+    assert stored()['total_spent'] == Decimal(50)
+
+
+def test_first_read_computes_the_row(app):
+    db.session.add(Order(user_email=REPRESENTANTE, status=OrderStatus.EN_CAMINO, total=10))
+    db.session.commit()
+    assert order_summary(REPRESENTANTE).in_transit_count == 1
+    assert rebuild_order_summaries() == 0
+    assert order_summary('nobody@example.com').created_count == 0
+
+
+def test_archived_orders_still_count(app):
+    order = new_order(60)
+    change_order_status(order, OrderStatus.ENTREGADO)
+    db.session.commit()
+    db.session.execute(update(Order).values(last_updated=datetime.utcnow() - timedelta(days=400)))
+    db.session.commit()
+    assert archive_orders(retention_days=365) == 1
+    assert stored() == computed()
+    assert stored()['delivered_count'] == 1
+    assert rebuild_order_summaries() == 0
+
+
+@pytest.mark.parametrize('drift', ['counter', 'missing row'])
+def test_rebuild_repairs_drift(app, drift):
+    order = new_order(100)
+    # Orders changed with SQL by hand
+    db.session.execute(update(Order).where(Order.id == order.id).values(status=OrderStatus.ENTREGADO))
+    if drift == 'missing row':
+        db.session.execute(db.delete(RepresentanteOrderSummary))
+    db.session.commit()
+    assert rebuild_order_summaries() == 1
+    assert stored() == computed()
+    assert stored()['delivered_count'] == 1
+    assert rebuild_order_summaries() == 0
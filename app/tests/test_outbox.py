@@ -0,0 +1,137 @@
+"""
+Outbox dispatcher: delivery, retries with backoff, giving up after max_attempts, and the
+wake-up after a commit that queued events.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from insumos import outbox
+from insumos.extensions import db
+from insumos.models import Order, OrderStatus, OutboxEvent
+from insumos.outbox import ORDER_STATUS_CHANGED, OutboxDispatcher, change_order_status, queue_event
+
+
+@pytest.fixture
+def app(app):
+    yield app
+    outbox._wake.clear()
+
+
+class StubSink:
+    name = 'stub'
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def send(self, messages):
+        self.batches.append(messages)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('sink unavailable')
+
+
+def queue(count=1):
+    events = [queue_event(ORDER_STATUS_CHANGED, order_id, {'order_id': order_id}) for order_id in range(count)]
+    db.session.commit()
+    return [event.id for event in events]
+
+
+def event(event_id):
+    db.session.expire_all()
+    return db.session.get(OutboxEvent, event_id)
+
+
+def make_due(event_id):
+    db.session.get(OutboxEvent, event_id).available_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_delivers_in_batches(app):
+    ids = queue(3)
+    sink = StubSink()
+    dispatcher = OutboxDispatcher(sink, batch_size=2)
+    assert dispatcher.dispatch_batch() == 2
+    assert dispatcher.dispatch_batch() == 1
+    assert dispatcher.dispatch_batch() == 0
+    assert [len(batch) for batch in sink.batches] == [2, 1]
+    message = sink.batches[0][0]
+    assert message['type'] == ORDER_STATUS_CHANGED
+    assert message['idempotency_key'] == event(ids[0]).idempotency_key
+    assert all(event(event_id).dispatched_at is not None for event_id in ids)
+
+
+def test_failed_batch_is_retried_with_backoff(app):
+    event_id, = queue()
+    dispatcher = OutboxDispatcher(StubSink(failures=2), backoff_base=2.0)
+
+    before = datetime.utcnow()
+    assert dispatcher.dispatch_batch() == 1
+    failed = event(event_id)
+    assert (failed.attempts, failed.dispatched_at, failed.failed_at) == (1, None, None)
+    assert failed.last_error == 'ConnectionError: sink unavailable'
+    # Full jitter over the first delay (2s)
+    assert before + timedelta(seconds=1) <= failed.available_at <= datetime.utcnow() + timedelta(seconds=2)
+    # Not due yet
+    assert dispatcher.dispatch_batch() == 0
+
+    make_due(event_id)
+    before = datetime.utcnow()
+    dispatcher.dispatch_batch()
+    assert event(event_id).available_at >= before + timedelta(seconds=2)
+
+    make_due(event_id)
+    dispatcher.dispatch_batch()
+    delivered = event(event_id)
+    assert delivered.attempts == 3
+    assert delivered.dispatched_at is not None
+
+
+def test_backoff_is_capped(app):
+    event_id, = queue()
+    dispatcher = OutboxDispatcher(StubSink(failures=10), max_attempts=20, backoff_base=2.0, backoff_max=5.0)
+    for _ in range(6):
+        make_due(event_id)
+        before = datetime.utcnow()
+        dispatcher.dispatch_batch()
+    assert event(event_id).available_at <= before + timedelta(seconds=5, milliseconds=100)
+
+
+def test_gives_up_after_max_attempts(app):
+    event_id, = queue()
+    sink = StubSink(failures=10)
+    dispatcher = OutboxDispatcher(sink, max_attempts=3)
+    for _ in range(3):
+        make_due(event_id)
+        dispatcher.dispatch_batch()
+    failed = event(event_id)
+    assert failed.attempts == 3
+    assert failed.failed_at is not None
+    make_due(event_id)
+    assert dispatcher.dispatch_batch() == 0
+    assert len(sink.batches) == 3
+
+
+def test_commit_with_events_wakes_the_dispatcher(app):
+    order = Order(user_email='rep@example.com', total=10, status=OrderStatus.CREADA)
+    db.session.add(order)
+    db.session.commit()
+    outbox._wake.clear()
+
+    order.delivery_institute = 'Hospital Central'
+    db.session.commit()
+    assert not outbox._wake.is_set()
+
+    change_order_status(order, OrderStatus.EN_CAMINO)
+    db.session.commit()
+    assert outbox._wake.is_set()
+
+
+def test_rolled_back_events_do_not_wake_the_dispatcher(app):
+    outbox._wake.clear()
+    queue_event(ORDER_STATUS_CHANGED, 1, {'order_id': 1})
+    db.session.rollback()
+    db.session.commit()
+    assert not outbox._wake.is_set()
+    assert OutboxEvent.query.count() == 0
@@ -0,0 +1,129 @@
+"""
+Server-side session stores and the session cookie.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import request, session
+
+from benchmarks.fakes import FakeCognitoClient
+from insumos.auth import ADMIN_EMAILS
+from insumos.extensions import aws_clients
+from insumos.sessions import FileSessionStore, MemorySessionStore, SQLSessionStore
+
+DATA = {'user_email': 'rep@example.com', 'access_token': 'a' * 2000, 'tokens': [1, 2]}
+
+
+@pytest.fixture(params=['sql', 'file', 'memory'])
+def store(request, app, tmp_path):
+    if request.param == 'sql':
+        return SQLSessionStore()
+    if request.param == 'file':
+        return FileSessionStore(str(tmp_path / 'sessions'))
+    return MemorySessionStore()
+
+
+def test_round_trip(store):
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    store.save('sid-1', DATA, expires_at)
+    assert store.load('sid-1') == (DATA, expires_at)
+    store.save('sid-1', {**DATA, 'user_email': 'other@example.com'}, expires_at)
+    assert store.load('sid-1')[0]['user_email'] == 'other@example.com'
+    store.delete('sid-1')
+    assert store.load('sid-1') is None
+
+
+def test_unknown_sid(store):
+    assert store.load('missing') is None
+    store.delete('missing')
+
+
+def test_expired_sessions(store):
+    store.save('expired', DATA, datetime.utcnow() - timedelta(seconds=1))
+    store.save('live', DATA, datetime.utcnow() + timedelta(hours=1))
+    assert store.load('expired') is None
+    assert store.cleanup(batch_size=1) == 1
+    assert store.load('live') is not None
+
+
+@pytest.fixture
+def session_client(app):
+    @app.route('/_test/session', methods=['GET', 'POST', 'DELETE'])
+    def session_view():
+        if request.method == 'POST':
+            session.update(DATA)
+        elif request.method == 'DELETE':
+            session.clear()
+        return {'user_email': session.get('user_email')}
+
+    return app.test_client()
+
+
+def test_cookie_carries_only_the_signed_id(app, session_client):
+    response = session_client.post('/_test/session')
+    cookie = session_client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    assert len(cookie.value) < 100
+    sid = cookie.value.rsplit('.', 1)[0]
+    assert app.session_interface.store.load(sid)[0] == DATA
+    assert 'Cookie' in response.vary
+    assert session_client.get('/_test/session').json == {'user_email': DATA['user_email']}
+
+
+def test_tampered_cookie_is_a_new_session(app, session_client):
+    session_client.post('/_test/session')
+    name = app.config['SESSION_COOKIE_NAME']
+    cookie = session_client.get_cookie(name)
+    session_client.set_cookie(name, cookie.value[:-2] + 'xx')
+    assert session_client.get('/_test/session').json == {'user_email': None}
+
+
+def test_expired_session_is_not_loaded(app, session_client):
+    session_client.post('/_test/session')
+    sid = session_client.get_cookie(app.config['SESSION_COOKIE_NAME']).value.rsplit('.', 1)[0]
+    app.session_interface.store.save(sid, DATA, datetime.utcnow() - timedelta(seconds=1))
+    assert session_client.get('/_test/session').json == {'user_email': None}
+
+
+def test_unmodified_session_is_not_written(app, session_client, monkeypatch):
+    session_client.post('/_test/session')
+    saves = []
+    monkeypatch.setattr(app.session_interface.store, 'save', lambda *args: saves.append(args))
+    session_client.get('/_test/session')
+    assert saves == []
+
+
+def test_cleared_session_is_deleted(app, session_client):
+    session_client.post('/_test/session')
+    name = app.config['SESSION_COOKIE_NAME']
+    sid = session_client.get_cookie(name).value.rsplit('.', 1)[0]
+    session_client.delete('/_test/session')
+    assert app.session_interface.store.load(sid) is None
+    assert session_client.get_cookie(name) is None
+
+
+def session_id(app, client):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    return cookie.value.rsplit('.', 1)[0] if cookie else None
+
+
+def test_login_issues_a_new_session_id(app):
+    aws_clients.register('cognito-idp', FakeCognitoClient())
+    client = app.test_client()
+    # A session id the attacker got for their own login, planted in the victim's browser
+    client.post('/login', data={'username': ADMIN_EMAILS[0], 'password': 'Attacker1!'})
+    planted = session_id(app, client)
+    assert planted is not None
+
+    client.post('/login', data={'username': ADMIN_EMAILS[1], 'password': 'Victim1!'})
+    issued = session_id(app, client)
+    assert issued != planted
+    assert app.session_interface.store.load(planted) is None
+    assert app.session_interface.store.load(issued)[0]['user_email'] == ADMIN_EMAILS[1]
+
+
+def test_other_writes_keep_the_session_id(app, session_client):
+    session_client.post('/_test/session')
+    sid = session_id(app, session_client)
+    with session_client.session_transaction() as session_data:
+        session_data['theme'] = 'dark'
+    assert session_id(app, session_client) == sid
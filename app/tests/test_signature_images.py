@@ -0,0 +1,130 @@
+"""
+Signature images: ETag revalidation, size variants, and legacy images kept in the database until
+``flask move-signatures`` copies them to object storage.
+"""
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from insumos import create_app
+from insumos.extensions import db, storage
+from insumos.images import SIGNATURE_SIZES, content_hash, move_legacy_signatures, variant_cache, variant_key
+from insumos.models import Signature
+
+
+def png(size=(600, 300)):
+    output = BytesIO()
+    Image.new('RGBA', size, (20, 20, 120, 255)).save(output, 'PNG')
+    return output.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def clear_variant_cache():
+    variant_cache._entries.clear()
+    yield
+    variant_cache._entries.clear()
+
+
+@pytest.fixture
+def legacy(app):
+    signature = Signature(user_email='rep@example.com', signature_image=png())
+    db.session.add(signature)
+    db.session.commit()
+    return signature.id
+
+
+def signature(signature_id):
+    db.session.expire_all()
+    return db.session.get(Signature, signature_id)
+
+
+def test_viewing_a_legacy_signature_keeps_it_in_place(admin_client, legacy):
+    response = admin_client.get(f'/image/{legacy}')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+    assert response.data == png()
+    stored = signature(legacy)
+    assert (stored.content_type, stored.content_hash) == ('image/png', content_hash(png()))
+    assert stored.signature_key is None
+    assert stored.signature_image == png()
+
+
+def test_revalidation_answers_304_without_reading_the_image(admin_client, legacy, monkeypatch):
+    etag = admin_client.get(f'/image/{legacy}?size=thumb').get_etag()[0]
+    assert etag == f'{content_hash(png())}-thumb'
+
+    def unreadable(*args, **kwargs):
+        raise AssertionError('image read on a revalidation')
+
+    monkeypatch.setattr(storage, 'get', unreadable)
+    monkeypatch.setattr('insumos.representante.legacy_signature_image', unreadable)
+    response = admin_client.get(f'/image/{legacy}?size=thumb', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.get_etag()[0] == etag
+    assert response.headers['Cache-Control'].startswith('private, max-age=')
+
+    # Another size has another ETag
+    monkeypatch.undo()
+    small = admin_client.get(f'/image/{legacy}?size=small', headers={'If-None-Match': f'"{etag}"'})
+    assert small.status_code == 200
+
+
+@pytest.mark.parametrize('size', ['thumb', 'small'])
+def test_variants_are_generated_once(admin_client, legacy, monkeypatch, size):
+    response = admin_client.get(f'/image/{legacy}?size={size}')
+    assert response.mimetype == 'image/png'
+    with Image.open(BytesIO(response.data)) as variant:
+        width, height = SIGNATURE_SIZES[size]
+        assert variant.width <= width and variant.height <= height
+        assert variant.width == width or variant.height == height
+    assert storage.get(variant_key(content_hash(png()), size)) == response.data
+
+    # Stored by content hash: another worker (empty LRU) reads it back instead of drawing it again
+    variant_cache._entries.clear()
+    monkeypatch.setattr('insumos.representante.make_variant', None)
+    assert admin_client.get(f'/image/{legacy}?size={size}').data == response.data
+
+
+def test_unknown_size_or_signature(admin_client, legacy):
+    assert admin_client.get(f'/image/{legacy}?size=huge').status_code == 404
+    assert admin_client.get('/image/9999').status_code == 404
+
+
+def test_move_signatures(app, admin_client, legacy):
+    assert move_legacy_signatures(batch_size=1) == 1
+    moved = signature(legacy)
+    assert moved.signature_image is None
+    assert storage.get(moved.signature_key) == png()
+    assert moved.content_hash == content_hash(png())
+    assert move_legacy_signatures() == 0
+
+    response = admin_client.get(f'/image/{legacy}')
+    assert response.status_code == 302
+    assert admin_client.get(response.location).data == png()
+
+
+def test_move_signatures_keeps_the_column_if_the_copy_differs(app, legacy, monkeypatch):
+    monkeypatch.setattr(storage, 'get', lambda key: b'truncated')
+    with pytest.raises(RuntimeError):
+        move_legacy_signatures()
+    kept = signature(legacy)
+    assert kept.signature_image == png()
+    assert kept.signature_key is None
+
+
+def test_move_signatures_command(app, legacy):
+    result = app.test_cli_runner().invoke(args=['move-signatures'])
+    assert '1 signatures moved' in result.output
+    assert signature(legacy).signature_image is None
+
+
+def test_local_storage_defaults_to_the_instance_folder(app):
+    default = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'STORAGE_BACKEND': 'local',
+                          'STORAGE_LOCAL_DIR': None, 'CACHE_BACKEND': 'memory', 'ADMISSION_BACKEND': 'off',
+                          'ORDER_EVENTS_BACKEND': 'off'})
+    try:
+        assert storage.backend.directory == os.path.join(default.instance_path, 'storage')
+    finally:
+        storage.init_app(app)
@@ -0,0 +1,77 @@
+"""
+Local storage backend and its signed download URLs.
+"""
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeS3Client
+from insumos.extensions import storage
+from insumos.storage import LocalStorage, S3Storage, StorageObjectNotFound
+
+KEY = 'letters/order-1/carta.pdf'
+
+
+def test_put_get_delete(app):
+    assert isinstance(storage.backend, LocalStorage)
+    assert storage.put(KEY, b'%PDF-1.4', 'application/pdf') == KEY
+    assert storage.get(KEY) == b'%PDF-1.4'
+    storage.delete(KEY)
+    with pytest.raises(StorageObjectNotFound):
+        storage.get(KEY)
+    storage.delete(KEY)
+
+
+@pytest.mark.parametrize('key', ['../outside.pdf', '/etc/passwd', 'letters/../../outside.pdf'])
+def test_keys_stay_in_the_directory(app, key):
+    with pytest.raises(ValueError):
+        storage.put(key, b'data', 'application/pdf')
+
+
+def test_signed_url_serves_the_object(app):
+    storage.put(KEY, b'%PDF-1.4', 'application/pdf')
+    with app.test_request_context():
+        url = storage.url(KEY, content_type='application/pdf', filename='carta.pdf')
+    response = app.test_client().get(url)
+    assert response.status_code == 200
+    assert response.data == b'%PDF-1.4'
+    assert response.mimetype == 'application/pdf'
+    assert 'carta.pdf' in response.headers['Content-Disposition']
+
+
+def test_tampered_url_is_rejected(app):
+    storage.put(KEY, b'%PDF-1.4', 'application/pdf')
+    with app.test_request_context():
+        url = storage.url(KEY)
+    assert app.test_client().get(url[:-2] + 'xx').status_code == 403
+
+
+def test_expired_url_is_rejected(app, monkeypatch):
+    storage.put(KEY, b'%PDF-1.4', 'application/pdf')
+    with app.test_request_context():
+        url = storage.url(KEY)
+    now = time.time()
+    monkeypatch.setattr('itsdangerous.timed.time.time', lambda: now + storage.url_expires + 1)
+    assert app.test_client().get(url).status_code == 403
+
+
+def test_url_of_missing_object(app):
+    with app.test_request_context():
+        url = storage.url('letters/missing.pdf')
+    assert app.test_client().get(url).status_code == 404
+
+
+def test_s3_backend(app):
+    client = FakeS3Client()
+    storage.use(S3Storage(client, 'insumos'))
+    storage.put(KEY, b'%PDF-1.4', 'application/pdf')
+    assert client.objects[('insumos', KEY)] == b'%PDF-1.4'
+    assert storage.get(KEY) == b'%PDF-1.4'
+    assert storage.url(KEY, content_type='application/pdf').startswith('https://fake-s3.local/insumos/')
+    storage.delete(KEY)
+    with pytest.raises(StorageObjectNotFound):
+        storage.get(KEY)
+    # The local route only serves the local backend
+    with app.test_request_context():
+        url = LocalStorage(app.config['STORAGE_LOCAL_DIR']).url(KEY, 300)
+    assert app.test_client().get(url).status_code == 404